@@ -2,50 +2,92 @@
 """
 Telegram Auto Forwarder
 
-This script allows you to forward messages from one Telegram chat to another.
+This script allows you to forward messages from Telegram chats to other chats.
 It works with both text messages and media content with captions, and can
 forward from public channels to bots like @INRDealsBot.
 
 Features:
 - Forward from any source chat (channel, group, or user) to any destination
-- Forward media attachments with captions
+- Forward media attachments with captions, albums as a single unit
+- Optional native forwarding, batching bursts into one forward_messages call
 - Optional keyword filtering
 - Configurable delay between forwards (default: 5 seconds)
 - Support for both username and ID-based forwarding
+- Multiple routes (many sources to many destinations) served by one client
+- Several destinations per route, each sent to independently
+- Skips reposts of messages already forwarded to a destination
+- Spreads sends over several accounts to stay clear of flood limits
+- Mirrors edits and deletions of source messages to the sent copies
+
+Usage:
+    python TelegramForwarder.py              interactive menu
+    python TelegramForwarder.py run          headless daemon, no menu or prompts
+    python TelegramForwarder.py find NAME    search your chats by name or username
+    python TelegramForwarder.py chats        list your chats page by page
+    python TelegramForwarder.py backfill     send a source's recent history (see --help)
 
 Author: Based on https://github.com/redianmarku/Telegram-Autoforwarder with significant enhancements
 """
 
 import os
 import sys
+import time
 import asyncio
+import argparse
 import logging
 import configparser
-from telethon import TelegramClient, events
+from telethon import TelegramClient
 from telethon.tl.types import User, Channel, Chat
-from telethon.errors import SessionPasswordNeededError
+from telethon.errors import RPCError, SessionPasswordNeededError
+
+from routes import parse_chat_ref, parse_destinations
+from engine import ForwardingEngine
+from dedup import Deduplicator
+from checkpoint import Checkpoint
+from outbox import Outbox
+from media_cache import MediaCache
+from message_map import MessageMap
+from watchdog import ConnectionWatchdog
+from backfill import Backfill, BackfillProgress, PROGRESS_FILE
+from dialogs import DialogIndex, PAGE_SIZE, index_path_for
+from entity_cache import EntityResolver, cache_path_for
+from rate_limiter import RateLimiter
+from accounts import Account, AccountPool
+import metrics
+from status_server import StatusServer
+from settings import Settings, SettingsError, ConfigWatcher, load_settings
+from structured_logging import configure_logging, configure_from_settings
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Log through a background thread; run() applies the [Logging] settings
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Global variables
-config = configparser.ConfigParser()
+# No interpolation, so patterns and templates can contain a plain %
+config = configparser.ConfigParser(interpolation=None)
 config_file = 'config.ini'
+config_mtime = None
+SESSION_NAME = 'telegram_forwarder_session'
+dialog_index = None
 
 def save_config():
     """Save the current configuration to the config file."""
+    global config_mtime
     with open(config_file, 'w') as f:
         config.write(f)
+    # The in-memory config is what was just written, no need to read it back
+    config_mtime = os.stat(config_file).st_mtime_ns
     print(f"Configuration saved to {config_file}")
 
 def load_config():
     """Load configuration from file or create default if it doesn't exist."""
+    global config_mtime
     if os.path.exists(config_file):
+        mtime = os.stat(config_file).st_mtime_ns
+        if mtime == config_mtime and 'Telegram' in config and 'Forwarding' in config:
+            return  # unchanged since the last load
         config.read(config_file)
+        config_mtime = mtime
         print(f"Loaded config from {config_file}")
         print(f"Sections found: {config.sections()}")
     
@@ -84,13 +126,12 @@ def load_config():
             'delay_seconds': '5'
         }
 
-def get_api_credentials():
+def read_api_credentials():
     """
-    Get API credentials from environment variables, config file, or prompt user.
+    Read API credentials from environment variables or the config file.
+    Never prompts; missing values are returned as None.
     Returns (api_id, api_hash, phone)
     """
-    load_config()
-    
     # First check environment variables
     api_id = os.environ.get('TELEGRAM_API_ID')
     api_hash = os.environ.get('TELEGRAM_API_HASH')
@@ -102,31 +143,34 @@ def get_api_credentials():
             # Case-insensitive check for keys
             section_keys = {k.lower(): k for k in config[section].keys()}
             
-            # Check for api_id with any case
-            if not api_id and 'api_id'.lower() in section_keys:
-                actual_key = section_keys['api_id'.lower()]
-                api_id = config[section][actual_key]
-                print(f"Found API ID in config section {section}: {api_id}")
-            
-            # Check for api_hash with any case
-            if not api_hash and 'api_hash'.lower() in section_keys:
-                actual_key = section_keys['api_hash'.lower()]
-                api_hash = config[section][actual_key]
-                print(f"Found API Hash in config section {section}")
-            
-            # Check for phone with any case
-            if not phone and 'phone'.lower() in section_keys:
-                actual_key = section_keys['phone'.lower()]
-                phone = config[section][actual_key]
-                print(f"Found Phone in config section {section}: {phone}")
+            if not api_id and 'api_id' in section_keys:
+                api_id = config[section][section_keys['api_id']]
+            if not api_hash and 'api_hash' in section_keys:
+                api_hash = config[section][section_keys['api_hash']]
+            if not phone and 'phone' in section_keys:
+                phone = config[section][section_keys['phone']]
+    
+    return api_id or None, api_hash or None, phone or None
+
+def get_api_credentials():
+    """
+    Get API credentials from environment variables, config file, or prompt user.
+    Returns (api_id, api_hash, phone)
+    """
+    load_config()
+    api_id, api_hash, phone = read_api_credentials()
     
     # Skip prompting if all values already exist
     if api_id and api_hash and phone:
-        # Save to config in case they were from env vars
-        config['Telegram']['api_id'] = api_id
-        config['Telegram']['api_hash'] = api_hash
-        config['Telegram']['phone'] = phone
-        save_config()
+        print(f"Found API credentials for {phone}")
+        # Save to config only if they came from env vars
+        current = (config['Telegram'].get('api_id'), config['Telegram'].get('api_hash'),
+                   config['Telegram'].get('phone'))
+        if current != (api_id, api_hash, phone):
+            config['Telegram']['api_id'] = api_id
+            config['Telegram']['api_hash'] = api_hash
+            config['Telegram']['phone'] = phone
+            save_config()
         return api_id, api_hash, phone
         
     # Finally, prompt the user
@@ -148,14 +192,10 @@ def get_api_credentials():
 async def get_entity_name(client, entity_id):
     """Get the name of a Telegram entity (user, chat, channel)."""
     try:
-        # Check if it's a username format
-        if isinstance(entity_id, str) and entity_id.startswith('@'):
-            entity = await client.get_entity(entity_id)
-        else:
-            try:
-                entity = await client.get_entity(int(entity_id))
-            except ValueError:
-                entity = await client.get_entity(entity_id)
+        # Config values are strings; numeric IDs must be passed as ints
+        if isinstance(entity_id, str):
+            entity_id = parse_chat_ref(entity_id)
+        entity = await client.get_entity(entity_id)
         
         if isinstance(entity, User):
             return f"{entity.first_name} {entity.last_name if entity.last_name else ''} (@{entity.username if entity.username else 'No username'})"
@@ -167,30 +207,107 @@ async def get_entity_name(client, entity_id):
         logger.error(f"Error getting entity name: {e}")
         return f"Unknown Entity {entity_id}"
 
+def get_dialog_index():
+    """Open the local dialog index that belongs to the session, once."""
+    global dialog_index
+    if dialog_index is None:
+        dialog_index = DialogIndex(index_path_for(SESSION_NAME))
+    return dialog_index
+
+async def ensure_dialog_index(client):
+    """Return the dialog index, building it only the first time."""
+    index = get_dialog_index()
+    if not len(index):
+        print("\nIndexing your chats once, please wait...")
+        await index.refresh(client)
+    return index
+
+def print_chats(entries):
+    """Print chats as a table."""
+    print("=" * 72)
+    print(f"{'Type':<8} | {'Name':<30} | {'ID':<16} | {'Username':<15}")
+    print("=" * 72)
+    for entry in entries:
+        username = f"@{entry.username}" if entry.username else "None"
+        print(f"{entry.kind:<8} | {entry.name[:30]:<30} | {entry.peer_id:<16} | {username:<15}")
+    print("-" * 72)
+
 async def list_chats(client):
-    """List all dialogs (chats) that the user is part of."""
-    print("\nFetching your chats, please wait...\n")
-    print("=" * 60)
-    print(f"{'Type':<10} | {'Name':<25} | {'ID':<15} | {'Username':<15}")
-    print("=" * 60)
-    
-    async for dialog in client.iter_dialogs():
-        entity = dialog.entity
-        
-        if isinstance(entity, User):
-            name = f"{entity.first_name} {entity.last_name if entity.last_name else ''}"
-            username = f"@{entity.username}" if entity.username else "None"
-            print(f"{'User':<10} | {name[:25]:<25} | {entity.id:<15} | {username:<15}")
-        elif isinstance(entity, (Channel, Chat)):
-            chat_type = "Channel" if isinstance(entity, Channel) and entity.broadcast else "Group"
-            username = f"@{entity.username}" if hasattr(entity, 'username') and entity.username else "None"
-            print(f"{chat_type:<10} | {entity.title[:25]:<25} | {entity.id:<15} | {username:<15}")
-        
-        print("-" * 60)
+    """Page through and search the chats that the user is part of."""
+    # The index is kept current from dialog events; 'r' asks Telegram again
+    index = await ensure_dialog_index(client)
+
+    page = 1
+    while True:
+        pages = index.pages()
+        page = min(max(1, page), pages)
+        print(f"\nChats, page {page} of {pages} ({len(index)} chats)")
+        print_chats(index.page(page))
+        choice = input("n = next, p = previous, a page number, r = refresh from Telegram, "
+                       "text to search, Enter to go back: ").strip()
+        if not choice:
+            return
+        if choice.lower() == 'r':
+            print("\nUpdating the chat list...")
+            await index.refresh(client)
+        elif choice.lower() == 'n':
+            page += 1
+        elif choice.lower() == 'p':
+            page -= 1
+        elif choice.isdigit():
+            page = int(choice)
+        else:
+            matches = index.find(choice)
+            print(f"\n{len(matches)} chat(s) matching {choice!r}")
+            print_chats(matches)
+
+async def describe_chat(client, reference):
+    """Name a configured chat, from the dialog index when it is there."""
+    entry = get_dialog_index().lookup(reference)
+    if entry is not None:
+        return entry.name
+    return await get_entity_name(client, reference)
+
+def ask_chat(prompt, default=None):
+    """
+    Ask for a chat ID or username and check it against the dialog index.
+
+    Text that is neither an ID nor a username is searched, and a match can
+    be picked by number. Chats missing from the index have to be confirmed.
+    """
+    index = get_dialog_index()
+    while True:
+        value = input(prompt).strip() or default
+        if not value:
+            continue
+        chosen = []
+        for reference in value.split(','):
+            reference = reference.strip()
+            if not reference:
+                continue
+            entry = index.lookup(reference)
+            if entry is None and not reference.startswith('@') and not reference.lstrip('-').isdigit():
+                matches = index.find(reference, limit=10)
+                for number, match in enumerate(matches, 1):
+                    print(f"  {number}. {match.kind} {match.name} ({match.reference})")
+                pick = input("Pick a chat by number: ").strip() if matches else ''
+                if pick.isdigit() and 1 <= int(pick) <= len(matches):
+                    entry = matches[int(pick) - 1]
+                    reference = entry.reference
+            if entry is not None:
+                print(f"  {reference}: {entry.kind} {entry.name}")
+            elif input(f"  {reference} is not in your chat list, use it anyway? (y/n): ").lower() != 'y':
+                break
+            chosen.append(reference)
+        else:
+            if chosen:
+                return ', '.join(chosen)
 
 async def setup_forwarding(client):
     """Configure forwarding settings."""
     load_config()
+    # Chat names and IDs are checked against the local index, not the network
+    await ensure_dialog_index(client)
     
     print("\n===== Forwarding Setup =====")
     
@@ -199,7 +316,7 @@ async def setup_forwarding(client):
         current = config['Forwarding']['source_chat_id']
         print(f"Current source chat ID: {current}")
         try:
-            name = await get_entity_name(client, current)
+            name = await describe_chat(client, current)
             print(f"Current source chat name: {name}")
         except Exception as e:
             print(f"Unable to get source chat name: {e}")
@@ -208,7 +325,7 @@ async def setup_forwarding(client):
         change = True
     
     if change:
-        source_chat_id = input("Enter source chat ID (where to monitor messages from): ")
+        source_chat_id = ask_chat("Enter source chat ID, username or a name to search (where to monitor messages from): ")
         config['Forwarding']['source_chat_id'] = source_chat_id
         
     # Destination chat configuration (default to @INRDealsBot)
@@ -216,8 +333,8 @@ async def setup_forwarding(client):
         current = config['Forwarding']['destination_chat_id']
         print(f"Current destination chat ID: {current}")
         try:
-            name = await get_entity_name(client, current)
-            print(f"Current destination chat name: {name}")
+            names = [await describe_chat(client, d) for d in current.split(',') if d.strip()]
+            print(f"Current destination chat name: {', '.join(names)}")
         except Exception as e:
             print(f"Unable to get destination chat name: {e}")
         change = input("Change destination chat? (y/n, default is @INRDealsBot): ").lower() == 'y'
@@ -226,7 +343,8 @@ async def setup_forwarding(client):
         config['Forwarding']['destination_chat_id'] = '@INRDealsBot'
     
     if change:
-        destination_chat_id = input("Enter destination chat ID (where to forward messages to, default @INRDealsBot): ") or '@INRDealsBot'
+        destination_chat_id = ask_chat("Enter destination chat ID (where to forward messages to, comma-separated for several, default @INRDealsBot): ",
+                                       default='@INRDealsBot')
         config['Forwarding']['destination_chat_id'] = destination_chat_id
     
     # Keywords configuration
@@ -278,100 +396,141 @@ async def setup_forwarding(client):
            config['Forwarding']['keywords'].split(',') if config['Forwarding']['keywords'] else [], \
            config['Forwarding']['forward_media'].lower() == 'true'
 
-async def start_forwarding(client, source_chat_id, destination_chat_id, keywords, forward_media=True):
-    """Start the forwarding process."""
-    # Try to get source and destination chat names
-    try:
-        # First try to interpret it as an integer (channel/chat ID)
-        try:
-            if source_chat_id.startswith('@'):
-                # It's a username
-                source_entity = await client.get_entity(source_chat_id)
-            else:
-                # Try as an integer
-                source_entity = await client.get_entity(int(source_chat_id))
-        except ValueError:
-            # Not an integer, treat as username or phone
-            source_entity = await client.get_entity(source_chat_id)
-            
-        source_name = source_entity.title if hasattr(source_entity, 'title') else f"Chat {source_chat_id}"
-    except Exception as e:
-        logger.error(f"Error getting source entity: {e}")
-        source_name = f"Chat {source_chat_id}"
-    
-    # Try to handle destination - could be int, string (username) or phone number
-    try:
-        # Check if it's a username format
-        if destination_chat_id.startswith('@'):
-            print(f"Using username format: {destination_chat_id}")
-            destination_entity = await client.get_entity(destination_chat_id)
-        else:
-            # Try as an integer
-            try:
-                destination_entity = await client.get_entity(int(destination_chat_id))
-            except ValueError:
-                # Not an integer, treat as username or phone
-                destination_entity = await client.get_entity(destination_chat_id)
-            
-        destination_name = destination_entity.title if hasattr(destination_entity, 'title') else f"Chat {destination_chat_id}"
-    except Exception as e:
-        logger.error(f"Error getting destination entity: {e}")
-        destination_name = f"Chat {destination_chat_id}"
-    
-    # Get the delay from config
-    forward_delay = int(config['Forwarding'].get('delay_seconds', '5'))
-    
-    print(f"\nMonitoring messages from {source_name}...")
-    if keywords and keywords != ['']:
-        keywords = [k.strip() for k in keywords if k.strip()]
-        if keywords:
-            print(f"Filtering for messages containing any of these keywords: {', '.join(keywords)}")
-        else:
-            print("No valid keywords specified, forwarding all messages")
-    else:
-        print("No keywords filter, forwarding all messages")
-    print(f"Forwarding to {destination_name} ({destination_chat_id})")
-    print(f"Media forwarding: {'Enabled' if forward_media else 'Disabled'}")
-    print(f"Delay between forwards: {forward_delay} seconds")
-    print("\nPress Ctrl+C to stop\n")
-    
-    @client.on(events.NewMessage(chats=int(source_chat_id) if source_chat_id.strip('-').isdigit() else source_chat_id))
-    async def message_handler(event):
-        """Handle new messages in the source chat."""
-        message = event.message
-        
-        # Check if message contains any of the keywords
-        if keywords and keywords != ['']:
-            # Check if message text contains any of the keywords
-            message_text = message.message or ""
-            found_keyword = False
-            for keyword in keywords:
-                if keyword.lower() in message_text.lower():
-                    found_keyword = True
-                    break
-            
-            if not found_keyword:
-                return  # Skip this message
-        
+async def connect_accounts(settings, interactive=False):
+    """
+    Connect the extra accounts from [Account <name>] sections.
+    Interactively, accounts that are not logged in yet are asked for a code,
+    one after another; otherwise they are skipped, and all accounts connect
+    at the same time. Returns the connected accounts.
+    """
+    async def connect(account):
+        client = TelegramClient(account.session, settings.api_id, settings.api_hash)
         try:
-            # Try to forward the message with media if it has any
-            if message.media and forward_media:
-                logger.info(f"Forwarding message {message.id} with media to {destination_chat_id}")
-                await client.send_message(destination_chat_id, message)
-                await asyncio.sleep(forward_delay)  # Wait to avoid rate limiting
+            if interactive:
+                print(f"Connecting account {account.name}...")
+                phone = account.phone or (lambda: input(f"Phone number for account {account.name}: "))
+                await client.start(phone=phone)
             else:
-                if message.message:  # Only forward if there's actual text content
-                    logger.info(f"Forwarding message {message.id} text to {destination_chat_id}")
-                    await client.send_message(destination_chat_id, message.message)
-                    await asyncio.sleep(forward_delay)  # Wait to avoid rate limiting
+                await client.connect()
+                if not await client.is_user_authorized():
+                    logger.warning(f"Account {account.name} is not logged in, run the script interactively once; skipping it")
+                    await client.disconnect()
+                    return None
         except Exception as e:
-            logger.error(f"Error forwarding message: {e}")
+            logger.error(f"Error connecting account {account.name}: {e}")
+            await client.disconnect()
+            return None
+        return Account(account.name, client)
+
+    if interactive:
+        connected = [await connect(account) for account in settings.accounts]
+    else:
+        connected = await asyncio.gather(*(connect(account) for account in settings.accounts))
+    return [account for account in connected if account is not None]
+
+async def join_accounts(engine, settings):
+    """Connect the extra accounts in the background and let the running engine send from them."""
+    accounts = await connect_accounts(settings)
+    if accounts:
+        await engine.add_accounts(accounts)
+        logger.info(f"Sending from {len(engine.accounts.accounts)} accounts")
+
+def create_engine(client, settings, extra_accounts=()):
+    """Build the forwarding engine and its pipeline stages from the settings."""
+    dedup = Deduplicator.from_settings(settings)
+    checkpoint = Checkpoint(settings.checkpoint_file) if settings.catch_up else None
+    resolver = EntityResolver(client, cache_path_for(client))
+    outbox = Outbox.from_settings(settings)
+    accounts = AccountPool([Account('main', client, resolver, RateLimiter.from_settings(settings))]
+                           + list(extra_accounts))
+    media = MediaCache.from_settings(settings)
+    message_map = MessageMap.from_settings(settings)
+    watchdog = ConnectionWatchdog.from_settings(client, settings)
+    engine = ForwardingEngine(client, settings, dedup=dedup, checkpoint=checkpoint,
+                              outbox=outbox, accounts=accounts, media=media, message_map=message_map,
+                              watchdog=watchdog)
+
+    # Expose live figures on the status server's /metrics and /status
+    metrics.QUEUE_DEPTH.set_function(lambda: engine.queue.depth)
+    metrics.QUEUE_LAG.set_function(lambda: engine.queue.lag)
+    metrics.DIGEST_PENDING.set_function(lambda: len(engine.digests))
+    if outbox is not None:
+        metrics.OUTBOX_PENDING.set_function(lambda: outbox.pending)
+
+    def health():
+        connected = client.is_connected()
+        # A stalled connection can look connected; the watchdog knows better
+        stalled = watchdog is not None and watchdog.tripped
+        return connected and not stalled, {
+            'connected': connected,
+            'watchdog': watchdog.stats() if watchdog is not None else None,
+            'routes': len(engine.routes),
+            'sources': len(engine.table),
+            'queue': engine.queue.stats(),
+            'outbox_pending': outbox.pending if outbox is not None else None,
+            'digest_pending': len(engine.digests),
+            'accounts': accounts.stats(),
+            'media_cache': media.stats() if media is not None else None,
+            'destinations': {str(d): stats for d, stats in engine.destination_stats.items()},
+        }
+    metrics.set_health_check(health)
+
+    return engine
+
+async def start_forwarding(client, settings):
+    """
+    Start the forwarding process for every configured route.
+    Returns the engine and the watcher that reloads config.ini on change.
+    """
+    routes = settings.routes
+    extra_accounts = await connect_accounts(settings, interactive=True)
+    engine = create_engine(client, settings, extra_accounts)
+    resolver = engine.resolver
+    table = await engine.resolve()
+
+    print(f"\nMonitoring {len(table)} source chat(s) across {len(routes)} route(s)...")
+    if extra_accounts:
+        print(f"Sending from {len(extra_accounts) + 1} accounts")
+    for route in routes:
+        source_name = await get_entity_name(client, resolver.get(route.source_chat_id))
+        destination_names = [f"{await get_entity_name(client, resolver.get(d))} ({d})"
+                             for d in route.destinations]
+        print(f"\nRoute {route.name}: {source_name} -> {', '.join(destination_names)}")
+        if route.keywords:
+            match_type = "whole words" if route.whole_word else "keywords"
+            print(f"  Filtering for messages containing any of these {match_type}: {', '.join(route.keywords)}")
+        if route.keyword_patterns:
+            print(f"  Filtering for messages matching any of these patterns: {', '.join(route.keyword_patterns)}")
+        if route.exclude_keywords:
+            print(f"  Skipping messages containing any of these keywords: {', '.join(route.exclude_keywords)}")
+        if not route.matcher.filters:
+            print("  No keywords filter, forwarding all messages")
+        print(f"  Media forwarding: {'Enabled' if route.forward_media else 'Disabled'}")
+        print(f"  Forward mode: {route.forward_mode}")
+        if route.digest:
+            print(f"  Digest: every {route.digest_interval} seconds or {route.digest_max} messages")
+        print(f"  Minimum delay between forwards: {route.delay_seconds} seconds")
+
+    if engine.checkpoint is not None:
+        print("\nCatching up on messages missed while the forwarder was stopped...")
+    await engine.start()
+
+    # Pick up edits to config.ini without restarting
+    watcher = ConfigWatcher(config_file, engine.apply_settings, settings.reload_interval)
+    watcher.start()
 
     # Keep running until interrupted
-    print("Forwarding is now active. Press Ctrl+C to stop.")
+    print("\nForwarding is now active. Press Ctrl+C to stop.")
     
-    # Return the event handler for later use
-    return message_handler
+    # Return the engine and watcher for later use
+    return engine, watcher
+
+async def keep_connected(client, engine):
+    """Run until the client disconnects, or for good when the watchdog reconnects it."""
+    if engine.watchdog is not None:
+        await engine.watchdog.wait()
+    else:
+        await client.run_until_disconnected()
 
 async def interactive_menu(client):
     """Display interactive menu for the user."""
@@ -390,26 +549,35 @@ async def interactive_menu(client):
         elif choice == '3':
             # Check if source and destination are configured
             load_config()
-            if 'source_chat_id' not in config['Forwarding'] or 'destination_chat_id' not in config['Forwarding']:
+            try:
+                settings = Settings.from_config(config)
+            except SettingsError as e:
+                print(f"Error: invalid configuration: {e}")
+                continue
+            if not settings.routes:
                 print("Error: Source and destination chats not configured.")
-                print("Please choose option 2 first to setup forwarding.")
+                print("Please choose option 2 first to setup forwarding,")
+                print("or add [Route <name>] sections to config.ini.")
                 continue
             
-            source_chat_id = config['Forwarding']['source_chat_id']
-            destination_chat_id = config['Forwarding']['destination_chat_id']
-            keywords = config['Forwarding'].get('keywords', '').split(',') if config['Forwarding'].get('keywords') else []
-            forward_media = config['Forwarding'].get('forward_media', 'true').lower() == 'true'
-            
             print("\nStarting forwarding...")
+            engine = watcher = None
             try:
-                await start_forwarding(client, source_chat_id, destination_chat_id, keywords, forward_media)
-                # Keep the script running until Ctrl+C
-                while True:
-                    await asyncio.sleep(1)
+                engine, watcher = await start_forwarding(client, settings)
+                # Keep the script running until Ctrl+C, reconnecting when the connection stalls
+                await keep_connected(client, engine)
             except KeyboardInterrupt:
                 print("\nForwarding stopped")
             except Exception as e:
                 print(f"Error during forwarding: {e}")
+            finally:
+                # Detach the handlers and close the stores, so starting again does not run two engines
+                if watcher is not None:
+                    await watcher.stop()
+                if engine is not None:
+                    await engine.stop()
+                    for account in engine.accounts.accounts[1:]:
+                        await account.client.disconnect()
         elif choice == '4':
             print("Exiting...")
             break
@@ -418,9 +586,22 @@ async def interactive_menu(client):
 
 async def main():
     """Main function to run the script."""
+    status_server = None
     try:
         # Get API credentials
         api_id, api_hash, phone = get_api_credentials()
+
+        # Start the status server on this event loop for UptimeRobot monitoring
+        try:
+            settings = Settings.from_config(config)
+            configure_from_settings(settings)
+            port = settings.status_port
+        except SettingsError as e:
+            print(f"Warning: invalid configuration: {e}")
+            port = None
+        if port:
+            status_server = StatusServer(port=port)
+            await status_server.start()
         
         # Convert api_id to int to prevent errors
         try:
@@ -439,7 +620,7 @@ async def main():
             save_config()
         
         # Create the client
-        client = TelegramClient('telegram_forwarder_session', api_id, api_hash)
+        client = TelegramClient(SESSION_NAME, api_id, api_hash)
         
         print(f"Connecting to Telegram as {phone}...")
         await client.start()
@@ -461,6 +642,7 @@ async def main():
         
         me = await client.get_me()
         print(f"Connected to Telegram as {me.first_name}")
+        get_dialog_index().watch(client)
         
         # Display the interactive menu
         await interactive_menu(client)
@@ -470,9 +652,244 @@ async def main():
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
+        if status_server is not None:
+            await status_server.stop()
         if 'client' in locals() and hasattr(client, 'disconnect'):
             await client.disconnect()
 
+async def run():
+    """
+    Run the forwarder headlessly: no menu and no prompts.
+
+    Loads and validates the config once, connects with the existing session
+    and registers the handlers before anything optional: the status server,
+    extra accounts and the media cache come after. Each startup phase is
+    timed and logged. Returns a process exit code.
+    """
+    started = time.perf_counter()
+    phases = []
+
+    def mark(phase):
+        phases.append((phase, time.perf_counter()))
+
+    try:
+        settings = load_settings(config_file)
+    except SettingsError as e:
+        logger.error(f"Invalid configuration in {config_file}: {e}")
+        return 2
+    configure_from_settings(settings)
+    mark('config')
+
+    if not settings.api_id or not settings.api_hash:
+        logger.error("API credentials missing: set TELEGRAM_API_ID/TELEGRAM_API_HASH or run the interactive setup once")
+        return 2
+    if not settings.routes:
+        logger.error("No routes configured: run the interactive setup or add [Route <name>] sections")
+        return 2
+
+    status_server = None
+    watcher = None
+    client = TelegramClient(SESSION_NAME, settings.api_id, settings.api_hash)
+    engine = None
+    joining = None
+    try:
+        await client.connect()
+        if not await client.is_user_authorized():
+            logger.error("Session is not authorized: run the script interactively once to log in")
+            return 2
+        mark('connect')
+
+        engine = create_engine(client, settings)
+        table = await engine.resolve()
+        if not table:
+            logger.error("None of the configured source chats could be resolved")
+            return 1
+        mark('resolve')
+
+        engine.attach()
+        mark('handlers')
+
+        # Extra accounts join once connected; until then the main account sends
+        if settings.accounts:
+            joining = asyncio.ensure_future(join_accounts(engine, settings))
+        # The status server is cheap to start and must be up before a long catch-up
+        if settings.status_port:
+            status_server = StatusServer(port=settings.status_port)
+            await status_server.start()
+        mark('status server')
+
+        await engine.start()
+        get_dialog_index().watch(client)
+        mark('catch-up')
+
+        previous = started
+        timings = []
+        for phase, at in phases:
+            timings.append(f"{phase} {(at - previous) * 1000:.0f}ms")
+            previous = at
+        # Pick up edits to config.ini without restarting
+        watcher = ConfigWatcher(config_file, engine.apply_settings, settings.reload_interval)
+        watcher.start()
+
+        logger.info(f"Forwarding {len(settings.routes)} route(s) from {len(table)} source(s); "
+                    f"startup {(previous - started) * 1000:.0f}ms ({', '.join(timings)})")
+
+        await keep_connected(client, engine)
+        return 0
+    finally:
+        if joining is not None:
+            joining.cancel()
+            await asyncio.gather(joining, return_exceptions=True)
+        if watcher is not None:
+            await watcher.stop()
+        if engine is not None:
+            await engine.stop()
+            for account in engine.accounts.accounts[1:]:
+                await account.client.disconnect()
+        if status_server is not None:
+            await status_server.stop()
+        await client.disconnect()
+
+async def chats_command(args):
+    """
+    Search or page through the chats from the command line.
+
+    Answers from the local dialog index; Telegram is only contacted to
+    build the index the first time or when --refresh is given.
+    """
+    index = get_dialog_index()
+    if args.refresh or not len(index):
+        try:
+            settings = load_settings(config_file)
+        except SettingsError as e:
+            logger.error(f"Invalid configuration in {config_file}: {e}")
+            return 2
+        if not settings.api_id or not settings.api_hash:
+            logger.error("API credentials missing: run the interactive setup once")
+            return 2
+        client = TelegramClient(SESSION_NAME, settings.api_id, settings.api_hash)
+        try:
+            await client.connect()
+            if not await client.is_user_authorized():
+                logger.error("Session is not authorized: run the script interactively once to log in")
+                return 2
+            await index.refresh(client)
+        finally:
+            await client.disconnect()
+
+    if args.command == 'find':
+        matches = index.find(' '.join(args.query), limit=args.limit)
+        print_chats(matches)
+        return 0 if matches else 1
+    pages = index.pages(args.page_size)
+    print(f"Page {min(args.page, pages)} of {pages} ({len(index)} chats)")
+    print_chats(index.page(args.page, args.page_size))
+    return 0
+
+async def backfill_command(args):
+    """
+    Send the recent history of a route's source to its destinations.
+
+    Uses the saved session like headless mode, so stop a running forwarder
+    first. Progress is saved as it goes; running the same command again
+    resumes an interrupted backfill.
+    """
+    try:
+        settings = load_settings(config_file)
+    except SettingsError as e:
+        logger.error(f"Invalid configuration in {config_file}: {e}")
+        return 2
+    configure_from_settings(settings)
+    if not settings.api_id or not settings.api_hash:
+        logger.error("API credentials missing: run the interactive setup once")
+        return 2
+    routes = {route.name: route for route in settings.routes}
+    name = args.route or (next(iter(routes)) if len(routes) == 1 else None)
+    if name not in routes:
+        logger.error(f"Choose a route to backfill: {', '.join(routes) or 'none configured'}")
+        return 2
+    route = routes[name]
+    destinations = parse_destinations(args.destination) if args.destination else route.destinations
+
+    client = TelegramClient(SESSION_NAME, settings.api_id, settings.api_hash)
+    progress = BackfillProgress(args.progress_file)
+    engine = None
+    extra_accounts = []
+    try:
+        await client.connect()
+        if not await client.is_user_authorized():
+            logger.error("Session is not authorized: run the script interactively once to log in")
+            return 2
+        if not args.dry_run:
+            extra_accounts = await connect_accounts(settings)
+        engine = create_engine(client, settings, extra_accounts)
+        await engine.resolve()
+        await engine.accounts.resolve_all(destinations)
+        backfill = Backfill(engine, route, args.limit, destinations, progress,
+                            dry_run=args.dry_run, restart=args.restart)
+        report = await backfill.run()
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    except (RPCError, ConnectionError) as e:
+        logger.error(f"Backfill of route {route.name} stopped: {e}")
+        if not args.dry_run:
+            for destination in destinations:
+                entry = progress.get(route, destination)
+                if entry is not None:
+                    logger.error(f"  {destination}: sent {entry['sent']} message(s), up to message "
+                                 f"{entry['sent_id']} of {entry['last_id']}")
+            logger.error("Progress is saved; run the same command again to resume")
+        return 1
+    finally:
+        if engine is not None:
+            await engine.stop()
+        for account in extra_accounts:
+            await account.client.disconnect()
+        await client.disconnect()
+
+    print(f"\nRoute {route.name}: {report.scanned} message(s) scanned, {report.matched} matched the filters")
+    for destination in destinations:
+        verb = "would send" if args.dry_run else "sent"
+        print(f"  {destination}: {verb} {report.sent[destination]} message(s) in {report.calls[destination]} "
+              f"call(s), {report.duplicates[destination]} duplicate(s) skipped")
+    if args.dry_run:
+        print(f"Estimated time to send: {backfill.estimate() / 60:.1f} minute(s)")
+    else:
+        print(f"Finished in {report.elapsed:.0f}s")
+    return 0
+
 if __name__ == "__main__":
-    # Run the main function
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Telegram Auto Forwarder")
+    subcommands = parser.add_subparsers(dest='command')
+    subcommands.add_parser('run', help="start forwarding headlessly, without the menu or any prompts")
+    find_parser = subcommands.add_parser('find', help="search your chats by name or username")
+    find_parser.add_argument('query', nargs='+')
+    find_parser.add_argument('--limit', type=int, default=20)
+    find_parser.add_argument('--refresh', action='store_true', help="update the chat index from Telegram first")
+    chats_parser = subcommands.add_parser('chats', help="list your chats page by page")
+    chats_parser.add_argument('--page', type=int, default=1)
+    chats_parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    chats_parser.add_argument('--refresh', action='store_true', help="update the chat index from Telegram first")
+    backfill_parser = subcommands.add_parser('backfill', help="send a source's recent history to its destinations")
+    backfill_parser.add_argument('route', nargs='?', help="route name (optional with a single route)")
+    backfill_parser.add_argument('--limit', type=int, default=1000, help="how many recent messages to go through")
+    backfill_parser.add_argument('--destination', action='append',
+                                 help="send only to this destination (repeatable); default: the route's")
+    backfill_parser.add_argument('--dry-run', action='store_true', help="count matches and estimate the time, send nothing")
+    backfill_parser.add_argument('--restart', action='store_true', help="ignore saved progress and start over")
+    backfill_parser.add_argument('--progress-file', default=PROGRESS_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        try:
+            sys.exit(asyncio.run(run()))
+        except KeyboardInterrupt:
+            print("\nExiting...")
+    elif args.command in ('find', 'chats'):
+        sys.exit(asyncio.run(chats_command(args)))
+    elif args.command == 'backfill':
+        sys.exit(asyncio.run(backfill_command(args)))
+    else:
+        # Run the main function
+        asyncio.run(main())
@@ -0,0 +1,149 @@
+"""
+Account pool for the Telegram Auto Forwarder.
+
+One account can only send so fast before Telegram answers with FloodWaits.
+Extra accounts are configured in sections named ``[Account <name>]``:
+
+    [Account backup]
+    session = telegram_forwarder_backup
+    phone = +911234567890
+
+Each account has its own session, entity cache and rate limits. The main
+account from ``[Telegram]`` receives messages and owns routing; sends are
+sharded across every connected account by destination, so each destination
+keeps a stable owner and its messages stay in order. When an account hits a
+FloodWait it is drained: its destinations move to the next account until the
+wait is over. All accounts must be members of the destination chats, and of
+the source chats for native forwards and media.
+"""
+
+import time
+import zlib
+import logging
+from dataclasses import dataclass
+
+from entity_cache import EntityResolver, cache_path_for
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_SECTION_PREFIX = 'ACCOUNT '
+
+
+@dataclass(frozen=True)
+class AccountSettings:
+    """Login details of an extra account."""
+
+    __slots__ = ('name', 'session', 'phone')
+
+    name: str
+    session: str
+    phone: object
+
+
+def load_accounts(config):
+    """Read every ``[Account <name>]`` section of a ConfigParser."""
+    accounts = []
+    for section_name in config.sections():
+        if not section_name.upper().startswith(ACCOUNT_SECTION_PREFIX):
+            continue
+        name = section_name[len(ACCOUNT_SECTION_PREFIX):].strip()
+        section = config[section_name]
+        accounts.append(AccountSettings(
+            name=name,
+            session=section.get('session', '').strip() or f"telegram_forwarder_{name}",
+            phone=section.get('phone', '').strip() or None,
+        ))
+    return tuple(accounts)
+
+
+class Account:
+    """A connected client with its own entity cache and rate limits."""
+
+    def __init__(self, name, client, resolver=None, limiter=None):
+        self.name = name
+        self.client = client
+        self.resolver = resolver or EntityResolver(client, cache_path_for(client))
+        self.limiter = limiter or RateLimiter()
+        self.drained_until = 0.0
+        self.sent = 0
+
+    @property
+    def drained(self):
+        return time.monotonic() < self.drained_until
+
+    @property
+    def available(self):
+        return self.client.is_connected() and not self.drained
+
+    def stats(self):
+        return {
+            'connected': self.client.is_connected(),
+            'drained_seconds': round(max(0.0, self.drained_until - time.monotonic()), 1),
+            'sent': self.sent,
+        }
+
+
+class AccountPool:
+    """Spread sends over several accounts and route around FloodWaits."""
+
+    def __init__(self, accounts):
+        if not accounts:
+            raise ValueError("An account pool needs at least one account")
+        self.accounts = list(accounts)
+
+    @property
+    def primary(self):
+        """The account that receives messages."""
+        return self.accounts[0]
+
+    def add(self, account):
+        """Add an account that connected after the pool was created."""
+        self.accounts.append(account)
+
+    def configure(self, settings, routes):
+        """Apply rate limits and route delays to every account."""
+        for account in self.accounts:
+            account.limiter.reconfigure(settings)
+            account.limiter.configure_routes(routes)
+
+    async def resolve_all(self, references):
+        """Resolve the chats for every account; each has its own access hashes."""
+        for account in self.accounts:
+            await account.resolver.resolve_all(references)
+
+    def get(self, name):
+        """The account with a name, or None."""
+        return next((account for account in self.accounts if account.name == name), None)
+
+    def owner(self, destination):
+        """The account a destination is sharded to while every account is healthy."""
+        index = zlib.crc32(str(destination).encode('utf-8')) % len(self.accounts)
+        return self.accounts[index]
+
+    def pick(self, destination):
+        """
+        Choose the account for the next send to a destination.
+
+        Starts from the destination's owner and moves along the pool past
+        disconnected or drained accounts. When none is available, the
+        account whose FloodWait ends first is used.
+        """
+        start = self.accounts.index(self.owner(destination))
+        count = len(self.accounts)
+        for offset in range(count):
+            account = self.accounts[(start + offset) % count]
+            if account.available:
+                return account
+        connected = [a for a in self.accounts if a.client.is_connected()] or self.accounts
+        return min(connected, key=lambda a: a.drained_until)
+
+    def flood_wait(self, account, destination, seconds):
+        """Pause the account's sends to the destination and drain it if others can take over."""
+        account.limiter.flood_wait(destination, seconds)
+        if len(self.accounts) > 1:
+            account.drained_until = max(account.drained_until, time.monotonic() + seconds)
+            logger.warning(f"Account {account.name} drained for {seconds}s, moving its sends to other accounts")
+
+    def stats(self):
+        return {account.name: account.stats() for account in self.accounts}
@@ -0,0 +1,283 @@
+"""
+Historical backfill for the Telegram Auto Forwarder.
+
+Seeds a new destination with the last N messages of a route's source:
+
+    python TelegramForwarder.py backfill laptops --limit 5000
+    python TelegramForwarder.py backfill laptops --limit 5000 --dry-run
+
+History is read oldest first. One task pages through ``iter_messages``, runs
+the route's keyword and media filters over what it reads and keeps a few
+pages of matching messages ready ahead of the sender. Duplicates are
+skipped and the rest is sent with the route's forward mode: native routes
+forward a page of up to 100 messages in one ``forward_messages`` call, other
+modes send message by message. Every send goes through the usual account
+pool and rate limits.
+
+Progress per destination is saved to a JSON file after every send, so an
+interrupted backfill picks up where it stopped when run again with the same
+route; ``--restart`` starts over. A dry run sends nothing and reports how
+many messages match and roughly how long sending them would take.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+from dedup import fingerprints
+from engine import MAX_FORWARD_IDS
+from send_queue import Job
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_FILE = 'backfill_progress.json'
+# Pages of history fetched ahead of the sends
+PREFETCH_PAGES = 3
+# Pause between history requests, passed to iter_messages as wait_time.
+# Without it Telethon pauses a second per request when no limit is given;
+# short FloodWaits on history are slept through by Telethon itself.
+HISTORY_WAIT = 0.5
+# Messages per history request
+HISTORY_PAGE = 100
+
+
+class BackfillProgress:
+    """The range being backfilled and the last message sent, per route and destination."""
+
+    def __init__(self, path=PROGRESS_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading backfill progress {path}: {e}")
+
+    @staticmethod
+    def key(route, destination):
+        return f"{route.name}|{destination}"
+
+    def get(self, route, destination):
+        return self.entries.get(self.key(route, destination))
+
+    def set(self, route, destination, entry):
+        self.entries[self.key(route, destination)] = entry
+
+    def save(self):
+        """Write the progress atomically."""
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error writing backfill progress {self.path}: {e}")
+
+
+class BackfillReport:
+    """What a backfill found and sent."""
+
+    def __init__(self, destinations):
+        self.scanned = 0
+        self.matched = 0
+        self.pages = 0
+        self.duplicates = dict.fromkeys(destinations, 0)
+        self.sent = dict.fromkeys(destinations, 0)
+        self.calls = dict.fromkeys(destinations, 0)
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+class Backfill:
+    """Send a source's recent history to a route's destinations."""
+
+    def __init__(self, engine, route, limit, destinations=None, progress=None, dry_run=False,
+                 restart=False):
+        self.engine = engine
+        self.route = route
+        self.limit = limit
+        self.destinations = list(destinations or route.destinations)
+        self.progress = progress or BackfillProgress()
+        self.dry_run = dry_run
+        self.restart = restart
+        self.peer_id = engine.resolver.peer_id(route.source_chat_id)
+        if self.peer_id is None:
+            raise ValueError(f"Source chat {route.source_chat_id} of route {route.name} is not resolved")
+        self.source = engine.source_peers.get(self.peer_id, self.peer_id)
+
+    async def bounds(self):
+        """Return (first, last) message IDs of the range to send, oldest first."""
+        client = self.engine.client
+        newest = await client.get_messages(self.source, limit=1)
+        if not newest:
+            return None
+        oldest = await client.get_messages(self.source, limit=1, add_offset=max(0, self.limit - 1))
+        return (oldest[0].id if oldest else 1), newest[0].id
+
+    async def _fetch(self, pages, first_id, last_id):
+        """Queue the history in pages, then None to mark its end (or a failure)."""
+        try:
+            await self._read(pages, first_id, last_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await pages.put(None)
+            raise
+        await pages.put(None)
+
+    async def _read(self, pages, first_id, last_id):
+        """
+        Read the history oldest first and filter it into pages.
+
+        A page is ``(units, end_id)``: the messages and albums that passed the
+        route's filters, at most one forward_messages call's worth, and the
+        ID of the last message read for it.
+        """
+        matched, size, album = [], 0, []
+        end_id = first_id - 1
+
+        async def add(unit):
+            nonlocal matched, size, end_id
+            if self.engine.accepts(self.route, unit):
+                self.report.matched += len(unit)
+                if size + len(unit) > MAX_FORWARD_IDS:
+                    await pages.put((matched, end_id))
+                    matched, size = [], 0
+                matched.append(unit)
+                size += len(unit)
+            end_id = unit[-1].id
+
+        async for message in self.engine.client.iter_messages(
+                self.source, min_id=first_id - 1, max_id=last_id + 1, reverse=True,
+                wait_time=HISTORY_WAIT):
+            self.report.scanned += 1
+            if album and message.grouped_id == album[0].grouped_id:
+                album.append(message)
+                continue
+            if album:
+                await add(album)
+                album = []
+            if message.grouped_id:
+                album = [message]
+            else:
+                await add([message])
+        if album:
+            await add(album)
+        await pages.put((matched, end_id))
+
+    def _resume_from(self, bounds):
+        """The last sent message ID per destination, saving fresh entries for new runs."""
+        resume = {}
+        for destination in self.destinations:
+            entry = self.progress.get(self.route, destination)
+            if entry is None or self.restart:
+                entry = {'first_id': bounds[0], 'last_id': bounds[1], 'sent_id': bounds[0] - 1, 'sent': 0}
+                if not self.dry_run:
+                    self.progress.set(self.route, destination, entry)
+            resume[destination] = entry
+        return resume
+
+    async def run(self):
+        """Run the backfill and return its report."""
+        self.report = BackfillReport(self.destinations)
+        bounds = await self.bounds()
+        if bounds is None:
+            return self.report
+        resume = self._resume_from(bounds)
+        # Resumed destinations keep the range they started with
+        first_id = min(entry['first_id'] for entry in resume.values())
+        last_id = max(entry['last_id'] for entry in resume.values())
+        start_id = min(entry['sent_id'] for entry in resume.values()) + 1
+        if not self.dry_run:
+            self.progress.save()
+        if start_id > last_id:
+            logger.info(f"Backfill of route {self.route.name} is already complete")
+            return self.report
+
+        logger.info(f"Backfilling route {self.route.name}: messages {max(first_id, start_id)} to {last_id} "
+                    f"from {self.route.source_chat_id} to {', '.join(map(str, self.destinations))}"
+                    f"{' (dry run)' if self.dry_run else ''}")
+        pages = asyncio.Queue(maxsize=PREFETCH_PAGES)
+        fetcher = asyncio.ensure_future(self._fetch(pages, max(first_id, start_id), last_id))
+        try:
+            while (page := await pages.get()) is not None:
+                self.report.pages += 1
+                for destination in self.destinations:
+                    await self._send_page(destination, resume[destination], *page)
+                if self.report.pages % 10 == 0:
+                    logger.info(f"Backfill: {self.report.scanned} scanned, {self.report.matched} matched")
+        finally:
+            fetcher.cancel()
+            await asyncio.gather(fetcher, return_exceptions=True)
+        if not fetcher.cancelled() and fetcher.exception() is not None:
+            raise fetcher.exception()
+        return self.report
+
+    async def _send_page(self, destination, entry, matched, end_id):
+        """Send a page's messages to one destination and record the progress."""
+        units = [unit for unit in matched
+                 if entry['first_id'] <= unit[0].id and unit[-1].id > entry['sent_id']]
+        dedup = self.engine.dedup
+        if dedup is not None:
+            fresh = [unit for unit in units if not dedup.contains(destination, _lead(unit))]
+            self.report.duplicates[destination] += len(units) - len(fresh)
+            units = fresh
+        if self.dry_run:
+            if units:
+                native = self.route.forward_mode == 'native'
+                self.report.calls[destination] += 1 if native else len(units)
+                self.report.sent[destination] += sum(len(unit) for unit in units)
+            return
+
+        engine = self.engine
+        if self.route.forward_mode == 'native':
+            if units:
+                await engine.forward_batch(self.route, self.peer_id, destination,
+                                           [m for unit in units for m in unit])
+                self._sent(destination, entry, units)
+        else:
+            for unit in units:
+                job = Job(destination, (self.route, self.peer_id, unit))
+                account, sent = await engine.send_copy(job)
+                engine.remember_copies(self.peer_id, destination, account, unit, sent)
+                self._sent(destination, entry, [unit])
+                entry['sent_id'] = unit[-1].id
+                self.progress.save()
+        # Everything up to the end of the page was sent or filtered out
+        entry['sent_id'] = max(entry['sent_id'], end_id)
+        self.progress.save()
+
+    def _sent(self, destination, entry, units):
+        jobs = [Job(destination, (self.route, self.peer_id, unit)) for unit in units]
+        self.engine.record_forwarded(jobs)
+        if self.engine.dedup is not None:
+            for unit in units:
+                self.engine.dedup.record(destination, fingerprints(_lead(unit)))
+        count = sum(len(unit) for unit in units)
+        entry['sent'] += count
+        self.report.calls[destination] += 1 if self.route.forward_mode == 'native' else len(units)
+        self.report.sent[destination] += count
+
+    def estimate(self):
+        """Rough seconds needed to send what a dry run found, at the configured rates."""
+        settings = self.engine.settings
+        calls = sum(self.report.calls.values())
+        per_destination = max((count * self.route.delay_seconds for count in self.report.calls.values()),
+                              default=0)
+        accounts = len(self.engine.accounts.accounts)
+        per_account = calls / (settings.account_rate * accounts) if settings.account_rate > 0 else 0
+        # History is fetched while sending, pausing between requests
+        requests = -(-self.report.scanned // HISTORY_PAGE)
+        fetching = max(0, requests - 1) * HISTORY_WAIT
+        return max(per_destination, per_account, fetching)
+
+
+def _lead(unit):
+    """The captioned part of an album, which stands in for it when deduplicating."""
+    return next((m for m in unit if m.message), unit[0])
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Deal extraction and deal_filter micro-benchmark.
+
+Measures parsing deal posts into Deal records, evaluating compiled
+deal_filter rules, and what the per-message cache saves when several routes
+and the duplicate check look at the same message.
+
+The built-in corpus is generated from the formats deal channels post in. A
+file of real posts (one per paragraph, e.g. exported from a channel) can be
+given with --corpus.
+
+Usage:
+    python benchmarks/bench_deals.py [--messages 5000] [--routes 4] [--corpus posts.txt]
+"""
+
+import os
+import sys
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deals import Deal, DealCache, compile_deal_filter
+from dedup import fingerprints
+
+TEMPLATES = [
+    "🔥 {product} @ ₹{price} (MRP ₹{mrp}) {pct}% off\n{url}",
+    "Loot deal!! {product} just Rs. {price} only\nBuy: {url}",
+    "{product}\n\nDeal price: ₹{price}\nMRP: ₹{mrp}\nDiscount: {pct}%\n\n👉 {url}\n\n#ad #deals",
+    "Price drop ⬇️ {product} now {price}/- (was {mrp}/-) {url}",
+    "{pct}% OFF on {product} | Bank offer: extra 10% instant discount with HDFC cards\n{url}",
+    "Lightning deal ⚡ {product}\n{url}\nHurry, limited stock!",
+    "INR {price} {product} - lowest ever {url} {url2}",
+]
+PRODUCTS = ['boAt Airdopes 141', 'Samsung Galaxy M14 5G (6GB/128GB)', 'Mi 20000mAh Power Bank',
+            'Lenovo IdeaPad Slim 3 Laptop', 'Prestige Induction Cooktop', 'Puma Running Shoes',
+            'Noise ColorFit Pro 4', 'Philips Trimmer BT1232', 'HP 67 Ink Cartridge',
+            'Milton Thermosteel Flask 1L']
+URLS = ['https://amzn.to/{code}', 'https://www.amazon.in/dp/B0{code}?tag=deals-21',
+        'https://fkrt.it/{code}', 'https://dl.flipkart.com/s/{code}', 'https://myntr.it/{code}',
+        'https://www.ajio.com/p/{code}', 'https://bit.ly/{code}']
+RULES = [
+    'discount >= 60 and price < 500',
+    'domain in {amazon, flipkart} and price <= ₹2,000',
+    'discount >= 50 or (mrp > 10000 and price < 5000)',
+    'not domain == myntra and urls > 0',
+]
+
+
+class Post:
+    """Just enough of a Telethon message for the parser."""
+
+    __slots__ = ('id', 'chat_id', 'message', 'entities', 'photo', 'document')
+
+    def __init__(self, message_id, text):
+        self.id = message_id
+        self.chat_id = -1001234567890
+        self.message = text
+        self.entities = None
+        self.photo = None
+        self.document = None
+
+
+def generate(count, rng):
+    posts = []
+    for number in range(count):
+        mrp = rng.choice([499, 999, 1499, 2999, 4490, 8999, 15999, 64990])
+        pct = rng.randint(10, 90)
+        price = max(49, mrp * (100 - pct) // 100)
+
+        def url():
+            code = ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ23456789') for _ in range(8))
+            return rng.choice(URLS).format(code=code)
+
+        text = rng.choice(TEMPLATES).format(
+            product=rng.choice(PRODUCTS), price=f"{price:,}", mrp=f"{mrp:,}", pct=pct,
+            url=url(), url2=url())
+        posts.append(text)
+    return posts
+
+
+def read_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [post.strip() for post in f.read().split('\n\n') if post.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--routes', type=int, default=4, help="routes reading the same source")
+    parser.add_argument('--corpus', help="file of real posts, separated by blank lines")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    texts = read_corpus(args.corpus) if args.corpus else generate(args.messages, rng)
+    posts = [Post(i, text) for i, text in enumerate(texts)]
+    rules = [compile_deal_filter(rule) for rule in RULES]
+    route_rules = [rules[i % len(rules)] for i in range(args.routes)]
+    deals = [Deal.parse(post) for post in posts]
+
+    def per_route():
+        # Without the cache each route parses again, and dedup extracts the URLs again
+        for post in posts:
+            for rule in route_rules:
+                rule(Deal.parse(post))
+            fingerprints(post)
+
+    def cached():
+        cache = DealCache()
+        for post in posts:
+            for rule in route_rules:
+                rule(cache.get(post))
+            fingerprints(post, cache.get(post).urls)
+
+    cases = [
+        ('parse', lambda: [Deal.parse(post) for post in posts]),
+        ('filter only', lambda: [rule(deal) for deal in deals for rule in rules]),
+        (f'{args.routes} routes, parse each', per_route),
+        (f'{args.routes} routes, cached', cached),
+    ]
+
+    found = sum(deal.price is not None for deal in deals)
+    print(f"{len(posts)} posts ({found} with a price), {len(RULES)} rules, {args.routes} routes")
+    for rule, compiled in zip(RULES, rules):
+        print(f"  {sum(map(compiled, deals)):>6} match  {rule}")
+    print(f"{'Case':<26} | {'us/message':>10}")
+    print("-" * 40)
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:<26} | {best / len(posts) * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
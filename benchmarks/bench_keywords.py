@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Keyword filter micro-benchmark.
+
+Compares the original per-keyword ``lower()`` loop from message_handler with
+the precompiled KeywordMatcher on synthetic deal messages.
+
+Usage:
+    python benchmarks/bench_keywords.py [--keywords 300] [--messages 2000]
+"""
+
+import os
+import sys
+import random
+import string
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_filter import KeywordMatcher
+
+
+def legacy_match(keywords, message_text):
+    """The keyword loop as it was written in message_handler."""
+    for keyword in keywords:
+        if keyword.lower() in message_text.lower():
+            return True
+    return False
+
+
+def make_keywords(count, rng):
+    brands = ['samsung', 'apple', 'oneplus', 'xiaomi', 'boat', 'lenovo', 'hp', 'dell',
+              'asus', 'sony', 'philips', 'puma', 'nike', 'adidas', 'noise', 'realme']
+    words = set(brands)
+    while len(words) < count:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return sorted(words)[:count]
+
+
+def make_messages(count, keywords, hit_rate, rng):
+    filler = ("Grab this LIMITED time DEAL now at the lowest price ever seen "
+              "with bank offers and free delivery https://amzn.to/abc123 ").split()
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(filler) for _ in range(rng.randint(20, 80))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords).upper())
+        messages.append(' '.join(words))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--keywords', type=int, default=300)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--hit-rate', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    keywords = make_keywords(args.keywords, rng)
+    messages = make_messages(args.messages, keywords, args.hit_rate, rng)
+
+    matcher = KeywordMatcher(keywords)
+    word_matcher = KeywordMatcher(keywords, whole_word=True)
+
+    # Both implementations must agree before their speed is worth comparing
+    for text in messages:
+        assert legacy_match(keywords, text) == matcher.matches(text)
+
+    cases = [
+        ('legacy loop', lambda: [legacy_match(keywords, m) for m in messages]),
+        ('compiled', lambda: [matcher.matches(m) for m in messages]),
+        ('compiled whole-word', lambda: [word_matcher.matches(m) for m in messages]),
+    ]
+
+    print(f"{len(keywords)} keywords, {len(messages)} messages, hit rate {args.hit_rate:.0%}")
+    print(f"{'Matcher':<22} | {'us/message':>10}")
+    print("-" * 36)
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:<22} | {best / len(messages) * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
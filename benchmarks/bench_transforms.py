@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Text transform micro-benchmark.
+
+Compares applying each rule with its own ``re.sub`` pass, as downstream
+scripts do, with the compiled single-pass TextTransform, with and without
+formatting entities to move.
+
+Usage:
+    python benchmarks/bench_transforms.py [--rules 20] [--messages 2000]
+"""
+
+import os
+import sys
+import types
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+
+from transforms import TextTransform, URL_PATTERN
+
+
+def make_rules(count):
+    replace = [(r'\bMRP\b', 'List price'), (r'(\d+)% off', r'\1% OFF'), (r'Rs\.?\s?', '₹')]
+    strip = [r'#\w+', r'Join @\w+ for more deals']
+    while len(replace) + len(strip) < count:
+        replace.append((rf'\bcode{len(replace)}\b', f'CODE{len(replace)}'))
+    urls = [('amazon.in', 'tag=deals-21'), ('flipkart.com', 'affid=deals'),
+            ('amzn.to', 'https://example.com/go?u={url}')]
+    return replace, strip, urls
+
+
+def make_messages(count, rng):
+    parts = ["🔥 Deal of the day", "MRP Rs. 2,999", "now Rs 1,499 (50% off)",
+             "https://www.amazon.in/dp/B0{0}?ref=abc", "https://amzn.to/{0}",
+             "#deal #sale", "Join @deals for more deals", "Free delivery", "use code5"]
+    messages = []
+    for i in range(count):
+        words = [rng.choice(parts).format(i) for _ in range(rng.randint(4, 10))]
+        text = '\n'.join(words)
+        # A bold span and a hidden link, like a typical formatted post
+        entities = [types.SimpleNamespace(offset=0, length=min(5, len(text)), url=None),
+                    types.SimpleNamespace(offset=len(text) // 2, length=3,
+                                          url=f"https://www.amazon.in/dp/B{i}")]
+        messages.append((text, entities))
+    return messages
+
+
+def sequential(replace, strip, rewriter, text):
+    """One re.sub pass per rule, as downstream scripts do it."""
+    for pattern, replacement in replace:
+        text = re.sub(pattern, replacement, text)
+    for pattern in strip:
+        text = re.sub(pattern, '', text)
+    return re.sub(URL_PATTERN, lambda m: rewriter.rewrite(m.group()), text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rules', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    replace, strip, urls = make_rules(args.rules)
+    messages = make_messages(args.messages, rng)
+    transform = TextTransform(replace, strip, urls, "{text}\n\nShared by @mychannel")
+
+    cases = [
+        ('sequential re.sub', lambda: [sequential(replace, strip, transform.urls, t) for t, _ in messages]),
+        ('compiled', lambda: [transform.apply(t) for t, _ in messages]),
+        ('compiled + entities', lambda: [transform.apply(t, e) for t, e in messages]),
+    ]
+
+    print(f"{len(replace) + len(strip)} rules, {len(urls)} link rewrites, {len(messages)} messages")
+    print(f"{'Transform':<22} | {'us/message':>10}")
+    print("-" * 36)
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:<22} | {best / len(messages) * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Load test for the forwarding engine with a fake Telegram client.
+
+Injects synthetic NewMessage events at a fixed rate into a real
+ForwardingEngine whose client is a local stand-in: sends take a simulated
+round trip and can fail with FloodWaits. Everything between the event
+handler and the send (filters, dedup, outbox, send queue, rate limiter) is
+the production code. Reports throughput, end-to-end latency from event to
+completed send, and peak memory.
+
+Usage:
+    python benchmarks/load_test.py [--rate 50] [--duration 10] [--hit-rate 0.5]
+                                   [--send-latency-ms 80] [--flood-rate 0.01]
+"""
+
+import os
+import re
+import sys
+import time
+import types
+import random
+import string
+import asyncio
+import argparse
+import resource
+import tempfile
+import configparser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import InputPeerChannel
+
+from settings import Settings
+from engine import ForwardingEngine
+
+SOURCE_ID = 1234567890
+SOURCE_PEER_ID = -1000000000000 - SOURCE_ID
+MARKER_RE = re.compile(r'\[#(\d+)\]')
+
+
+class FakeMessage:
+    """The parts of a Telethon Message the engine reads."""
+
+    __slots__ = ('id', 'message', 'media', 'photo', 'document', 'grouped_id', 'entities', 'chat_id')
+
+    def __init__(self, message_id, text, media=False):
+        self.id = message_id
+        # A marker lets the fake client match copied text back to its message
+        self.message = f"{text} [#{message_id}]"
+        self.photo = types.SimpleNamespace(id=message_id) if media else None
+        self.media = self.photo
+        self.document = None
+        self.grouped_id = None
+        self.entities = None
+        self.chat_id = SOURCE_PEER_ID
+
+
+class FakeClient:
+    """A stand-in TelegramClient with simulated send latency and FloodWaits."""
+
+    def __init__(self, latency, flood_rate, flood_seconds, rng):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.rng = rng
+        self.handlers = {}
+        self.session = types.SimpleNamespace(filename=None)
+        self.on_sent = None
+        self.requests = 0
+        self.flood_waits = 0
+
+    def add_event_handler(self, handler, event):
+        self.handlers[type(event).__name__] = handler
+
+    def remove_event_handler(self, handler):
+        pass
+
+    def is_connected(self):
+        return True
+
+    async def get_input_entity(self, reference):
+        if isinstance(reference, int):
+            return InputPeerChannel(abs(reference) % 10 ** 12, 0)
+        return InputPeerChannel(abs(hash(reference)) % 10 ** 9 + 1, 0)
+
+    async def get_messages(self, chat, ids):
+        return [FakeMessage(i, "restored") for i in ids]
+
+    async def _request(self, message_ids):
+        self.requests += 1
+        # Log-normal round trips: mostly close to the mean with a long tail
+        await asyncio.sleep(self.rng.lognormvariate(0, 0.5) * self.latency)
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        for message_id in message_ids:
+            self.on_sent(message_id)
+
+    async def send_message(self, peer, message, **kwargs):
+        if isinstance(message, FakeMessage):
+            return await self._request([message.id])
+        # Digests carry the markers of every message they list
+        return await self._request([int(marker) for marker in MARKER_RE.findall(message)])
+
+    async def send_file(self, peer, files, caption=None, **kwargs):
+        captions = caption if isinstance(caption, list) else [caption]
+        return await self._request([int(MARKER_RE.search(c).group(1)) for c in captions if c])
+
+    async def forward_messages(self, peer, ids, from_peer=None):
+        return await self._request(list(ids))
+
+
+def make_keywords(count, rng):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 9))))
+    return sorted(words)
+
+
+def make_text(size, keywords, hit, rng):
+    filler = "grab this limited time deal now lowest price ever bank offer free delivery".split()
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(filler)
+        words.append(word)
+        length += len(word) + 1
+    if hit:
+        words.insert(rng.randrange(len(words)), rng.choice(keywords))
+    return ' '.join(words)
+
+
+def build_settings(args, keywords, workdir):
+    config = configparser.ConfigParser(interpolation=None)
+    destinations = ', '.join(f"@bench{i}" for i in range(args.destinations))
+    config['Telegram'] = {'api_id': '1', 'api_hash': 'bench'}
+    config['Forwarding'] = {
+        'source_chat_id': str(SOURCE_PEER_ID),
+        'destination_chat_id': destinations,
+        'keywords': ', '.join(keywords),
+        'forward_media': 'true',
+        'forward_mode': 'copy' if args.mode == 'digest' else args.mode,
+        'digest': str(args.mode == 'digest').lower(),
+        'digest_interval_seconds': str(args.digest_interval),
+        'digest_max_messages': str(args.digest_max),
+        'delay_seconds': '0',
+        'destination_burst': '1000',
+        'account_messages_per_minute': str(args.account_rate),
+        'account_burst': '1000',
+        'send_workers': str(args.workers),
+        'queue_size': str(args.queue_size),
+        'batch_window_ms': str(args.batch_window_ms),
+        'dedup': str(args.dedup).lower(),
+        'dedup_db': os.path.join(workdir, 'dedup.sqlite3'),
+        'outbox': str(args.outbox).lower(),
+        'outbox_db': os.path.join(workdir, 'outbox.sqlite3'),
+        'catch_up': 'false',
+        'reload_interval_seconds': '0',
+    }
+    return Settings.from_config(config, environ={})
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run(args, workdir):
+    rng = random.Random(args.seed)
+    keywords = make_keywords(args.keywords, rng)
+    settings = build_settings(args, keywords, workdir)
+
+    client = FakeClient(args.send_latency_ms / 1000.0, args.flood_rate, args.flood_seconds, rng)
+    injected_at = {}
+    latencies = []
+
+    def on_sent(message_id):
+        latencies.append(time.perf_counter() - injected_at[message_id])
+    client.on_sent = on_sent
+
+    dedup = None
+    if args.dedup:
+        from dedup import Deduplicator
+        dedup = Deduplicator.from_settings(settings)
+    outbox = None
+    if args.outbox:
+        from outbox import Outbox
+        outbox = Outbox.from_settings(settings)
+
+    engine = ForwardingEngine(client, settings, dedup=dedup, outbox=outbox)
+    await engine.resolve()
+    await engine.start()
+    handler = client.handlers['NewMessage']
+
+    total = int(args.rate * args.duration)
+    expected = 0
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    for message_id in range(1, total + 1):
+        # Inject on a fixed schedule, catching up if the handler fell behind
+        delay = started + (message_id - 1) * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        hit = rng.random() < args.hit_rate
+        message = FakeMessage(message_id, make_text(args.size, keywords, hit, rng),
+                              media=rng.random() < args.media_ratio)
+        expected += hit * args.destinations
+        injected_at[message_id] = time.perf_counter()
+        await handler(types.SimpleNamespace(chat_id=SOURCE_PEER_ID, message=message))
+    injected = time.perf_counter()
+
+    # Let the queue drain
+    deadline = injected + args.drain_timeout
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    finished = time.perf_counter()
+    await engine.stop()
+
+    sent = len(latencies)
+    print(f"{total} messages in {injected - started:.1f}s ({total / (injected - started):.0f}/s injected), "
+          f"{args.hit_rate:.0%} keyword hits, {args.media_ratio:.0%} media, "
+          f"{args.destinations} destination(s), mode {args.mode}")
+    print(f"send latency {args.send_latency_ms:.0f}ms, FloodWait rate {args.flood_rate:.1%}, "
+          f"{args.workers} worker(s), dedup {'on' if args.dedup else 'off'}, "
+          f"outbox {'on' if args.outbox else 'off'}")
+    print("-" * 48)
+    print(f"{'sends expected':<24} {expected:>12}")
+    print(f"{'sends completed':<24} {sent:>12}")
+    print(f"{'send requests':<24} {client.requests:>12}")
+    print(f"{'FloodWaits':<24} {client.flood_waits:>12}")
+    print(f"{'throughput (msgs/s)':<24} {sent / (finished - started):>12.1f}")
+    print(f"{'latency p50 (ms)':<24} {percentile(latencies, 0.50) * 1000:>12.1f}")
+    print(f"{'latency p99 (ms)':<24} {percentile(latencies, 0.99) * 1000:>12.1f}")
+    print(f"{'latency max (ms)':<24} {max(latencies, default=0) * 1000:>12.1f}")
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+    print(f"{'peak RSS (MB)':<24} {rss_mb:>12.1f}")
+    return 0 if sent >= expected else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rate', type=float, default=50, help="messages injected per second")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of injection")
+    parser.add_argument('--size', type=int, default=300, help="characters per message")
+    parser.add_argument('--media-ratio', type=float, default=0.3)
+    parser.add_argument('--hit-rate', type=float, default=0.5, help="share of messages matching a keyword")
+    parser.add_argument('--keywords', type=int, default=100)
+    parser.add_argument('--destinations', type=int, default=1)
+    parser.add_argument('--mode', choices=('copy', 'native', 'digest'), default='copy')
+    parser.add_argument('--digest-interval', type=int, default=2, help="seconds per digest in digest mode")
+    parser.add_argument('--digest-max', type=int, default=50, help="messages per digest in digest mode")
+    parser.add_argument('--send-latency-ms', type=float, default=80)
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="share of sends failing with a FloodWait")
+    parser.add_argument('--flood-seconds', type=int, default=2)
+    parser.add_argument('--account-rate', type=float, default=0,
+                        help="account_messages_per_minute (0 = unlimited)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--batch-window-ms', type=int, default=0)
+    parser.add_argument('--dedup', action='store_true')
+    parser.add_argument('--outbox', action='store_true')
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        return asyncio.run(run(args, workdir))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
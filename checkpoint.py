@@ -0,0 +1,82 @@
+"""
+Per-source checkpoints for the Telegram Auto Forwarder.
+
+The checkpoint file records the ID of the last message handled from each
+source chat. On startup the engine pages through anything newer with
+``iter_messages`` so messages posted while the forwarder was down are not
+lost. The file is written atomically and at most every few seconds, so it
+costs nothing on the message path.
+
+What "handled" means depends on the outbox. With ``outbox = true`` a
+message is handled once it was queued, since the outbox keeps queued
+messages across a crash. Without it, the engine holds a source's checkpoint
+below its oldest message that is still queued, so anything lost with the
+in-memory queue is replayed on the next start.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    catch_up = true
+    catch_up_limit = 1000
+    checkpoint_file = checkpoints.json
+"""
+
+import os
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Last handled message ID per source chat, persisted to a JSON file."""
+
+    def __init__(self, path='checkpoints.json', flush_interval=5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.last_ids = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """Read the checkpoint file if it exists."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.last_ids = {int(peer): int(last_id) for peer, last_id in data.items()}
+            logger.info(f"Loaded checkpoints for {len(self.last_ids)} source(s) from {self.path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading checkpoint file {self.path}: {e}")
+
+    def get(self, peer_id):
+        return self.last_ids.get(peer_id)
+
+    def update(self, peer_id, message_id):
+        """Record a handled message; checkpoints only ever move forward."""
+        if message_id > self.last_ids.get(peer_id, 0):
+            self.last_ids[peer_id] = message_id
+            self.dirty = True
+
+    def flush(self):
+        """Write the checkpoints to disk if they changed."""
+        if not self.dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({str(peer): last_id for peer, last_id in self.last_ids.items()}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    async def autosave(self):
+        """Flush the checkpoints periodically until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    logger.error(f"Error writing checkpoint file {self.path}: {e}")
+        finally:
+            self.flush()
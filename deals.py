@@ -0,0 +1,267 @@
+"""
+Deal extraction and numeric filters for the Telegram Auto Forwarder.
+
+Keywords only say what a post mentions. A route can also filter on what a
+deal is worth with ``deal_filter``, a small expression over fields parsed
+from the message:
+
+    deal_filter = discount >= 60 and price < 500
+    deal_filter = domain in {amazon, flipkart} and not price > 2000
+
+Fields:
+
+    price      the lowest price in the message (₹499, Rs. 1,299, 999/-)
+    mrp        the highest price, when the message has more than one
+    discount   the largest percentage (70% off), or else the saving from
+               mrp to price
+    domain     the sites linked to; ``domain in {amazon}`` matches
+               amazon.in, www.amazon.com and short links like amzn.to
+    prices, percents, urls   how many were found
+
+Comparisons are ``<  <=  >  >=  ==  !=`` (``≤`` and ``≥`` work too). They
+can be combined with ``and``, ``or``, ``not`` and parentheses. A comparison
+with a field the message does not have is false. Currency signs and ``%``
+after numbers are ignored.
+
+Each message is parsed once into a Deal with precompiled patterns, and the
+record is cached by chat, message ID and edit date. Every route, destination
+and the duplicate check reuse the same record.
+"""
+
+import re
+import operator
+from collections import OrderedDict
+
+from dedup import extract_urls
+
+CACHE_SIZE = 4096
+
+# ₹499, Rs. 1,299, INR 2,499.50, or an amount followed by /- or Rs
+PRICE_RE = re.compile(
+    r'(?:₹|\brs\.?|\binr)\s?([0-9][0-9,]*(?:\.[0-9]+)?)'
+    r'|\b([0-9][0-9,]*(?:\.[0-9]+)?)\s?(?:/-|₹|rs\b|rupees\b)', re.IGNORECASE)
+PERCENT_RE = re.compile(r'(?<![\d.])(\d{1,3}(?:\.\d+)?)\s?%')
+HOST_RE = re.compile(r'[a-z][a-z0-9+.-]*://(?:[^@/?#\s]*@)?([^:/?#\s]+)', re.IGNORECASE)
+
+# Link shorteners of the big stores, so a rule can name the store
+SHORT_DOMAINS = {
+    'amzn.to': 'amazon.in',
+    'amzn.in': 'amazon.in',
+    'amzn.eu': 'amazon.in',
+    'fkrt.it': 'flipkart.com',
+    'fkrt.cc': 'flipkart.com',
+    'fkrt.to': 'flipkart.com',
+    'myntr.it': 'myntra.com',
+    'ajio.me': 'ajio.com',
+}
+
+
+def _number(text):
+    return float(text.replace(',', ''))
+
+
+def _domain(url):
+    match = HOST_RE.match(url)
+    if match is None:
+        return None
+    host = match.group(1).lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return SHORT_DOMAINS.get(host, host) or None
+
+
+class Deal:
+    """What a message offers, parsed once."""
+
+    __slots__ = ('prices', 'percents', 'urls', 'domains', 'price', 'mrp', 'discount')
+
+    def __init__(self, prices=(), percents=(), urls=frozenset()):
+        self.prices = tuple(prices)
+        self.percents = tuple(percents)
+        self.urls = frozenset(urls)
+        self.domains = frozenset(d for d in map(_domain, self.urls) if d)
+        self.price = min(self.prices) if self.prices else None
+        self.mrp = max(self.prices) if len(self.prices) > 1 else None
+        if self.percents:
+            self.discount = max(self.percents)
+        elif self.mrp:
+            self.discount = round((self.mrp - self.price) / self.mrp * 100, 1)
+        else:
+            self.discount = None
+
+    @classmethod
+    def parse(cls, message):
+        """Extract the deal fields from a message's text and links."""
+        text = message.message or ''
+        prices = [_number(a or b) for a, b in PRICE_RE.findall(text)]
+        percents = [p for p in map(float, PERCENT_RE.findall(text)) if p <= 100]
+        return cls([p for p in prices if p > 0], percents, extract_urls(message))
+
+    def has_domain(self, name):
+        """Whether a link goes to a domain, its subdomains, or a site of that name."""
+        for domain in self.domains:
+            if domain == name or domain.endswith('.' + name) or domain.split('.')[-2:-1] == [name]:
+                return True
+        return False
+
+    def __repr__(self):
+        return (f"Deal(price={self.price}, mrp={self.mrp}, discount={self.discount}, "
+                f"domains={sorted(self.domains)})")
+
+
+class DealCache:
+    """Parsed deals by message, so each message is parsed only once."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.deals = OrderedDict()
+        self.parsed = 0
+
+    def get(self, message):
+        # An edit changes the text, and with it the deal
+        key = (getattr(message, 'chat_id', None), message.id, getattr(message, 'edit_date', None))
+        deal = self.deals.get(key)
+        if deal is None:
+            deal = self.deals[key] = Deal.parse(message)
+            self.parsed += 1
+            if len(self.deals) > self.size:
+                self.deals.popitem(last=False)
+        return deal
+
+
+# The predicate language
+
+NUMBER_FIELDS = ('price', 'mrp', 'discount')
+COUNT_FIELDS = {'prices': 'prices', 'percents': 'percents', 'urls': 'urls'}
+OPERATORS = {
+    '<': operator.lt, '<=': operator.le, '≤': operator.le,
+    '>': operator.gt, '>=': operator.ge, '≥': operator.ge,
+    '==': operator.eq, '=': operator.eq, '!=': operator.ne,
+}
+# Commas separate list items, except inside amounts like 1,49,999
+TOKEN_RE = re.compile(r'\s*(?:(<=|>=|==|!=|[<>=≤≥(){},])|((?:[^\s<>=≤≥!(){},]|,(?=\d{2,3}\b))+))')
+CURRENCY_RE = re.compile(r'^(?:₹|rs\.?|inr)|(?:%|/-)$', re.IGNORECASE)
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_RE.match(expression, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Unexpected {expression[position:]!r} in deal_filter")
+        tokens.append(match.group(1) or match.group(2))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the tokens, building nested closures."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def error(self, message):
+        return ValueError(f"Invalid deal_filter {self.expression!r}: {message}")
+
+    def peek(self):
+        return self.tokens[self.position].lower() if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None:
+            raise self.error("unexpected end")
+        if expected is not None and token != expected:
+            raise self.error(f"expected {expected!r}, got {token!r}")
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def parse(self):
+        predicate = self.disjunction()
+        if self.peek() is not None:
+            raise self.error(f"unexpected {self.peek()!r}")
+        return predicate
+
+    def disjunction(self):
+        terms = [self.conjunction()]
+        while self.peek() == 'or':
+            self.take()
+            terms.append(self.conjunction())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda deal: any(term(deal) for term in terms)
+
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.peek() == 'and':
+            self.take()
+            terms.append(self.negation())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda deal: all(term(deal) for term in terms)
+
+    def negation(self):
+        if self.peek() == 'not':
+            self.take()
+            term = self.negation()
+            return lambda deal: not term(deal)
+        return self.atom()
+
+    def atom(self):
+        if self.peek() == '(':
+            self.take()
+            term = self.disjunction()
+            self.take(')')
+            return term
+        field = self.take().lower()
+        if field == 'domain':
+            return self.domain_rule()
+        if field not in NUMBER_FIELDS and field not in COUNT_FIELDS:
+            raise self.error(f"unknown field {field!r}")
+        op = self.take()
+        if op not in OPERATORS:
+            raise self.error(f"expected a comparison after {field}, got {op!r}")
+        compare = OPERATORS[op]
+        raw = self.take()
+        try:
+            value = float(CURRENCY_RE.sub('', raw).replace(',', ''))
+        except ValueError:
+            raise self.error(f"{raw!r} is not a number")
+
+        if field in COUNT_FIELDS:
+            slot = COUNT_FIELDS[field]
+            return lambda deal: compare(len(getattr(deal, slot)), value)
+
+        def rule(deal):
+            actual = getattr(deal, field)
+            return actual is not None and compare(actual, value)
+        return rule
+
+    def domain_rule(self):
+        op = self.take().lower()
+        if op in ('==', '='):
+            names = [self.take().lower()]
+        elif op == 'in':
+            closing = {'{': '}', '(': ')'}.get(self.take())
+            if closing is None:
+                raise self.error("expected a list like {amazon, flipkart} after 'domain in'")
+            names = []
+            while self.peek() != closing:
+                if names:
+                    self.take(',')
+                names.append(self.take().lower())
+            self.take(closing)
+        else:
+            raise self.error(f"expected 'in' or '==' after domain, got {op!r}")
+        names = tuple(name.lstrip('.') for name in names)
+        return lambda deal: any(deal.has_domain(name) for name in names)
+
+
+def compile_deal_filter(expression):
+    """Compile a deal_filter expression into a function of a Deal, or None when empty."""
+    if not expression or not expression.strip():
+        return None
+    return _Parser(expression).parse()
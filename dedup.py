@@ -0,0 +1,212 @@
+"""
+Duplicate detection for the Telegram Auto Forwarder.
+
+Deal channels repost the same offer many times. Before a message is queued
+for a destination it is reduced to a few fingerprints:
+
+- a hash of its normalized text (lowercased, whitespace collapsed)
+- the ID of its photo or document
+- a hash of the set of URLs it links to
+
+If any fingerprint was already sent to the same destination within the TTL,
+or belongs to a message still queued for it, the message is skipped. A
+message's fingerprints are recorded only once it was sent: a message that is
+dropped from a full queue or given up on is not counted, so a later repost of
+the same deal still gets through.
+
+Fingerprints live in a small SQLite database so deduplication survives
+restarts, with a size-bounded LRU in memory in front of it so repeated checks
+never touch the disk. Writes are committed in batches every second rather
+than once per message. Expired rows are purged periodically.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    dedup = true
+    dedup_ttl_hours = 24
+    dedup_cache_size = 10000
+    dedup_db = dedup.sqlite3
+"""
+
+import re
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+URL_RE = re.compile(r'https?://[^\s<>"\')\]]+', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+# How often expired fingerprints are removed from the database, in seconds
+PURGE_INTERVAL = 3600
+
+
+def _digest(value):
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def extract_urls(message):
+    """Collect the URLs in a message's text and its hidden text links."""
+    text = message.message or ""
+    urls = {url.rstrip('.,!?').lower() for url in URL_RE.findall(text)}
+    for entity in message.entities or ():
+        url = getattr(entity, 'url', None)
+        if url:
+            urls.add(url.lower())
+    return urls
+
+
+def media_id(message):
+    """Return a stable ID for the message's photo or document, if any."""
+    if message.photo is not None:
+        return f"photo:{message.photo.id}"
+    if message.document is not None:
+        return f"document:{message.document.id}"
+    return None
+
+
+def fingerprints(message, urls=None):
+    """
+    Compute the dedup keys for a message.
+
+    ``urls`` are the message's links when they were already extracted, e.g.
+    by the deal parser.
+    """
+    keys = []
+    text = WHITESPACE_RE.sub(' ', (message.message or "").lower()).strip()
+    if text:
+        keys.append('text:' + _digest(text))
+    media = media_id(message)
+    if media:
+        keys.append('media:' + media)
+    if urls is None:
+        urls = extract_urls(message)
+    if urls:
+        keys.append('urls:' + _digest(' '.join(sorted(urls))))
+    return keys
+
+
+class Deduplicator:
+    """Remember which messages were already sent to each destination."""
+
+    def __init__(self, path='dedup.sqlite3', ttl=24 * 3600, cache_size=10000, sync_interval=1.0):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.sync_interval = sync_interval
+        self.cache = OrderedDict()  # key -> time first seen
+        self.held = set()  # keys of messages queued but not sent yet
+        self.duplicates = 0
+        self._last_purge = 0.0
+        self._dirty = False
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, seen REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS seen_time ON seen (seen)')
+        self.db.commit()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create a deduplicator from Settings, or None when disabled."""
+        if not settings.dedup:
+            return None
+        return cls(settings.dedup_db, settings.dedup_ttl, settings.dedup_cache_size)
+
+    def _remember_in_cache(self, key, seen):
+        self.cache[key] = seen
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _lookup(self, keys, now):
+        cutoff = now - self.ttl
+        missing = []
+        for key in keys:
+            if key in self.held:
+                return True
+            seen = self.cache.get(key)
+            if seen is not None and seen >= cutoff:
+                self.cache.move_to_end(key)
+                return True
+            missing.append(key)
+
+        if not missing:
+            return False
+        placeholders = ','.join('?' * len(missing))
+        rows = self.db.execute(
+            f'SELECT key, seen FROM seen WHERE seen >= ? AND key IN ({placeholders})',
+            [cutoff] + missing).fetchall()
+        for key, seen in rows:
+            self._remember_in_cache(key, seen)
+        return bool(rows)
+
+    def contains(self, destination, message, prints=None):
+        """
+        Check whether a message was sent to the destination, or is queued for it.
+
+        ``prints`` are the message's fingerprints if computed once for several
+        destinations. Nothing is recorded; see hold() and record().
+        """
+        if prints is None:
+            prints = fingerprints(message)
+        keys = [f"{destination}|{key}" for key in prints]
+        if keys and self._lookup(keys, time.time()):
+            self.duplicates += 1
+            return True
+        return False
+
+    def hold(self, destination, prints):
+        """Mark fingerprints as queued for a destination, so reposts are skipped until it is sent."""
+        self.held.update(f"{destination}|{key}" for key in prints)
+
+    def release(self, destination, prints):
+        """Forget fingerprints held for a message that will not be sent after all."""
+        self.held.difference_update(f"{destination}|{key}" for key in prints)
+
+    def record(self, destination, prints):
+        """Remember fingerprints of a message that was sent to a destination."""
+        keys = [f"{destination}|{key}" for key in prints]
+        if not keys:
+            return
+        now = time.time()
+        self.held.difference_update(keys)
+        for key in keys:
+            self._remember_in_cache(key, now)
+        self.db.executemany('INSERT OR REPLACE INTO seen (key, seen) VALUES (?, ?)',
+                            [(key, now) for key in keys])
+        self._dirty = True
+
+        if now - self._last_purge > PURGE_INTERVAL:
+            self.purge(now)
+
+    def purge(self, now=None):
+        """Delete fingerprints older than the TTL."""
+        now = now or time.time()
+        self._last_purge = now
+        cursor = self.db.execute('DELETE FROM seen WHERE seen < ?', (now - self.ttl,))
+        self._dirty = True
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} expired dedup entries")
+
+    def sync(self):
+        """Commit the fingerprints recorded since the last sync in one transaction."""
+        if self._dirty:
+            self.db.commit()
+            self._dirty = False
+
+    async def autosync(self):
+        """Sync periodically; meant to run as a background task."""
+        try:
+            while True:
+                await asyncio.sleep(self.sync_interval)
+                self.sync()
+        finally:
+            self.sync()
+
+    def close(self):
+        self.sync()
+        self.db.close()
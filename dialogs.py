@@ -0,0 +1,246 @@
+"""
+Local dialog index for the Telegram Auto Forwarder.
+
+Listing chats used to walk every dialog of the account through the API each
+time, which takes minutes on accounts with thousands of chats. The index
+keeps one row per dialog in a small SQLite database next to the session file:
+
+- the first use builds it with one full pass over the dialogs
+- later refreshes walk the dialogs newest first and stop once a run of
+  dialogs is already indexed unchanged
+- while the client runs, chats that post for the first time, get renamed or
+  are joined or left are updated from their events
+
+Names and usernames are searched through an FTS5 trigram index, so ``find``
+matches any part of a name without touching the network. SQLite builds
+without FTS5 fall back to a plain LIKE scan.
+"""
+
+import time
+import asyncio
+import sqlite3
+import logging
+from dataclasses import dataclass
+
+from telethon import events, utils
+from telethon.tl.types import User, Channel, Chat
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 25
+# A refresh stops after this many consecutive dialogs that did not change
+UNCHANGED_RUN = 50
+# Trigram search needs at least three characters
+MIN_FTS_QUERY = 3
+
+
+def index_path_for(session_name):
+    """Return the index file that belongs next to a session."""
+    if session_name.endswith('.session'):
+        session_name = session_name[:-len('.session')]
+    return session_name + '.dialogs.sqlite3'
+
+
+@dataclass(frozen=True)
+class DialogEntry:
+    """One indexed chat."""
+
+    __slots__ = ('peer_id', 'entity_id', 'kind', 'name', 'username')
+
+    peer_id: int
+    entity_id: int
+    kind: str
+    name: str
+    username: object
+
+    @property
+    def reference(self):
+        """How to refer to the chat in config.ini."""
+        return f"@{self.username}" if self.username else str(self.peer_id)
+
+
+def entry_for(entity):
+    """Describe a Telethon entity as a DialogEntry, or None for other types."""
+    if isinstance(entity, User):
+        kind = 'Bot' if entity.bot else 'User'
+        name = f"{entity.first_name or ''} {entity.last_name or ''}".strip() or 'Deleted account'
+    elif isinstance(entity, Channel):
+        kind = 'Channel' if entity.broadcast else 'Group'
+        name = entity.title
+    elif isinstance(entity, Chat):
+        kind, name = 'Group', entity.title
+    else:
+        return None
+    return DialogEntry(utils.get_peer_id(entity), entity.id, kind, name,
+                       getattr(entity, 'username', None) or None)
+
+
+class DialogIndex:
+    """Search and page through the account's chats without the network."""
+
+    def __init__(self, path='dialogs.sqlite3'):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS dialogs ('
+            'peer_id INTEGER PRIMARY KEY, entity_id INTEGER NOT NULL, kind TEXT NOT NULL, '
+            'name TEXT NOT NULL, username TEXT, updated REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS dialogs_entity ON dialogs (entity_id)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS dialogs_username ON dialogs (username COLLATE NOCASE)')
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS dialogs_fts "
+                            "USING fts5(name, username, tokenize='trigram')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            logger.info("SQLite has no FTS5 trigram tokenizer, chat search falls back to LIKE")
+            self.fts = False
+        self.db.commit()
+        self.known = {row[0]: row[1:] for row in self.db.execute(
+            'SELECT peer_id, name, username FROM dialogs')}
+        self._me = None  # the account's user ID, to notice it leaving a chat
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return len(self.known)
+
+    def upsert(self, entry, commit=True):
+        """Add or update a chat; returns whether anything changed."""
+        if self.known.get(entry.peer_id) == (entry.name, entry.username):
+            return False
+        self.db.execute(
+            'INSERT OR REPLACE INTO dialogs (peer_id, entity_id, kind, name, username, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (entry.peer_id, entry.entity_id, entry.kind, entry.name, entry.username, time.time()))
+        if self.fts:
+            self.db.execute('DELETE FROM dialogs_fts WHERE rowid = ?', (entry.peer_id,))
+            self.db.execute('INSERT INTO dialogs_fts (rowid, name, username) VALUES (?, ?, ?)',
+                            (entry.peer_id, entry.name, entry.username or ''))
+        self.known[entry.peer_id] = (entry.name, entry.username)
+        if commit:
+            self.db.commit()
+        return True
+
+    def remove(self, peer_id):
+        """Drop a chat the account left."""
+        if self.known.pop(peer_id, None) is None:
+            return
+        self.db.execute('DELETE FROM dialogs WHERE peer_id = ?', (peer_id,))
+        if self.fts:
+            self.db.execute('DELETE FROM dialogs_fts WHERE rowid = ?', (peer_id,))
+        self.db.commit()
+
+    async def refresh(self, client, full=False):
+        """
+        Bring the index up to date with the account's dialogs.
+
+        An empty index (or ``full``) is built from every dialog. Otherwise
+        dialogs are read newest first until UNCHANGED_RUN of them in a row
+        are already indexed as they are. Returns the number of changed rows.
+        """
+        full = full or not self.known
+        changed = unchanged = 0
+        started = time.perf_counter()
+        async for dialog in client.iter_dialogs():
+            entry = entry_for(dialog.entity)
+            if entry is None:
+                continue
+            if self.upsert(entry, commit=False):
+                changed += 1
+                unchanged = 0
+            else:
+                unchanged += 1
+                if not full and unchanged >= UNCHANGED_RUN:
+                    break
+        self.db.commit()
+        logger.info(f"Dialog index {'built' if full else 'refreshed'}: {changed} changed, "
+                    f"{len(self.known)} chat(s) in {time.perf_counter() - started:.1f}s")
+        return changed
+
+    def watch(self, client):
+        """Keep the index current from the client's events."""
+        async def add_chat(event):
+            try:
+                entry = entry_for(await event.get_chat())
+            except Exception as e:
+                logger.debug(f"Could not index chat {event.chat_id}: {e}")
+                return
+            if entry is not None:
+                self.upsert(entry)
+
+        async def on_message(event):
+            if event.chat_id not in self.known:
+                await add_chat(event)
+
+        async def on_action(event):
+            joined = event.user_joined or event.user_added
+            if event.new_title is not None or (joined and event.chat_id not in self.known):
+                await add_chat(event)
+            elif (event.user_left or event.user_kicked) and event.user_id == self._me:
+                self.remove(event.chat_id)
+
+        async def remember_me():
+            self._me = (await client.get_me(input_peer=True)).user_id
+
+        asyncio.ensure_future(remember_me())
+        client.add_event_handler(on_message, events.NewMessage())
+        client.add_event_handler(on_action, events.ChatAction())
+
+    def _rows(self, sql, params=()):
+        return [DialogEntry(*row) for row in self.db.execute(sql, params)]
+
+    def page(self, number, size=PAGE_SIZE):
+        """Return one page of chats, ordered by name, counting pages from 1."""
+        return self._rows(
+            'SELECT peer_id, entity_id, kind, name, username FROM dialogs '
+            'ORDER BY name COLLATE NOCASE, peer_id LIMIT ? OFFSET ?',
+            (size, (max(1, number) - 1) * size))
+
+    def pages(self, size=PAGE_SIZE):
+        return max(1, -(-len(self.known) // size))
+
+    def find(self, query, limit=20):
+        """Chats whose name or username contains the query, best matches first."""
+        query = query.strip().lstrip('@')
+        if not query:
+            return []
+        if query.lstrip('-').isdigit():
+            entry = self.lookup(int(query))
+            return [entry] if entry else []
+        if self.fts and len(query) >= MIN_FTS_QUERY:
+            return self._rows(
+                'SELECT d.peer_id, d.entity_id, d.kind, d.name, d.username '
+                'FROM dialogs_fts JOIN dialogs d ON d.peer_id = dialogs_fts.rowid '
+                'WHERE dialogs_fts MATCH ? ORDER BY rank LIMIT ?',
+                ('"' + query.replace('"', '""') + '"', limit))
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self._rows(
+            "SELECT peer_id, entity_id, kind, name, username FROM dialogs "
+            "WHERE name LIKE ? ESCAPE '\\' OR username LIKE ? ESCAPE '\\' "
+            "ORDER BY length(name) LIMIT ?",
+            (pattern, pattern, limit))
+
+    def lookup(self, reference):
+        """
+        Return the chat a configured reference points to, or None.
+
+        Accepts marked IDs (-100...), bare IDs as list_chats used to print
+        them, and usernames with or without '@'.
+        """
+        if isinstance(reference, str):
+            reference = reference.strip()
+            if reference.lstrip('-').isdigit():
+                reference = int(reference)
+        if isinstance(reference, int):
+            rows = self._rows(
+                'SELECT peer_id, entity_id, kind, name, username FROM dialogs '
+                'WHERE peer_id = ? OR entity_id = ? ORDER BY peer_id = ? DESC LIMIT 1',
+                (reference, abs(reference), reference))
+        else:
+            rows = self._rows(
+                'SELECT peer_id, entity_id, kind, name, username FROM dialogs '
+                'WHERE username = ? COLLATE NOCASE LIMIT 1', (reference.lstrip('@'),))
+        return rows[0] if rows else None
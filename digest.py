@@ -0,0 +1,147 @@
+"""
+Digest mode for the Telegram Auto Forwarder.
+
+Routes that do not need every deal right away can collect their messages
+into digests instead of sending them one by one:
+
+    [Route gadgets]
+    digest = true
+    digest_interval_seconds = 600
+    digest_max_messages = 50
+
+Matched messages wait per route and destination until the oldest has waited
+``digest_interval_seconds`` or ``digest_max_messages`` are collected. They are
+then sent as one text message listing each deal with a link to the original
+post, split into several messages only where Telegram's 4096 character
+limit requires it. A burst of 200 messages becomes a handful of sends
+instead of 200 paced ones.
+
+Duplicates are skipped before a message joins a digest. Collected
+messages are kept in memory only, so they depend on a clean stop or on the
+outbox:
+
+- on a clean stop (Ctrl+C, from the menu or in headless mode) pending
+  digests are sent before the forwarder exits
+- with the outbox enabled every collected message is also written to it as
+  usual, so after a crash, or when a digest could not be sent, they are
+  collected again on the next start
+- with neither, a crash loses whatever was waiting for a digest
+"""
+
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limit for the text of one message, in UTF-16 code units
+MAX_MESSAGE_LENGTH = 4096
+# Longer entries are cut, so one wordy post cannot fill a digest
+MAX_ENTRY_LENGTH = 1000
+# Telegram accepts at most this many message IDs per forward and the send
+# queue batches at most this many jobs
+MAX_DIGEST_MESSAGES = 100
+
+
+def text_length(text):
+    """Length of a text as Telegram counts it."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def message_link(source, peer_id, message_id):
+    """
+    A t.me link to a source message, or None when the chat has none.
+
+    Public chats are linked by username; private channels and supergroups
+    through their ID, which opens for members only.
+    """
+    if isinstance(source, str) and not source.lstrip('-').isdigit():
+        return f"https://t.me/{source.lstrip('@')}/{message_id}"
+    if peer_id < -10 ** 12:
+        return f"https://t.me/c/{-peer_id - 10 ** 12}/{message_id}"
+    return None
+
+
+def _truncate(text, limit):
+    if text_length(text) <= limit:
+        return text
+    # Cut by code points, then trim until emoji and other wide characters fit
+    text = text[:limit - 1]
+    while text_length(text) > limit - 1:
+        text = text[:-1]
+    return text.rstrip() + '…'
+
+
+def entry_text(text, entities, link):
+    """One digest entry: the message text, its hidden links and the link to it."""
+    text = (text or '').strip()
+    # Text links are lost once the text is copied, so spell them out
+    hidden = [entity.url for entity in entities or () if getattr(entity, 'url', None)]
+    hidden = [url for url in dict.fromkeys(hidden) if url not in text]
+    if hidden:
+        text = '\n'.join([text, *hidden]) if text else '\n'.join(hidden)
+    if not text:
+        text = '📎 Media'
+    text = _truncate(text, MAX_ENTRY_LENGTH)
+    return f"{text}\n🔗 {link}" if link else text
+
+
+def compose(title, entries, limit=MAX_MESSAGE_LENGTH):
+    """Join entries into as few messages as fit the length limit."""
+    separator = '\n\n'
+    messages = []
+    current = title
+    for number, entry in enumerate(entries, 1):
+        # Room for the title, " (cont.)", the separator and the number
+        item = f"{number}. {_truncate(entry, limit - text_length(title) - 16)}"
+        candidate = f"{current}{separator}{item}" if current else item
+        if text_length(candidate) > limit and current != title:
+            messages.append(current)
+            candidate = f"{title} (cont.){separator}{item}"
+        current = candidate
+    if current and current != title:
+        messages.append(current)
+    return messages
+
+
+class DigestBuffer:
+    """Jobs waiting for their route's digest, per route and destination."""
+
+    def __init__(self):
+        self.buffers = {}  # (route name, destination) -> (deadline, jobs)
+
+    def __len__(self):
+        return sum(len(jobs) for _, jobs in self.buffers.values())
+
+    def add(self, job):
+        """Collect a job; returns the digest's jobs once it is full, else None."""
+        route = job.payload[0]
+        key = (route.name, job.destination)
+        entry = self.buffers.get(key)
+        if entry is None:
+            entry = self.buffers[key] = (time.monotonic() + route.digest_interval, [])
+        jobs = entry[1]
+        jobs.append(job)
+        if len(jobs) >= route.digest_max:
+            del self.buffers[key]
+            return jobs
+        return None
+
+    def hold(self, job):
+        """Collect a job whose digest is already due, e.g. one read back from the spill file."""
+        key = (job.payload[0].name, job.destination)
+        now = time.monotonic()
+        deadline, jobs = self.buffers.get(key, (now, []))
+        jobs.append(job)
+        self.buffers[key] = (min(deadline, now), jobs)
+
+    def due(self, now=None):
+        """Take the digests whose oldest message has waited long enough."""
+        now = time.monotonic() if now is None else now
+        ready = [key for key, (deadline, _) in self.buffers.items() if deadline <= now]
+        return [self.buffers.pop(key)[1] for key in ready]
+
+    def drain(self):
+        """Take every digest, due or not."""
+        digests = [jobs for _, jobs in self.buffers.values()]
+        self.buffers.clear()
+        return digests
@@ -0,0 +1,938 @@
+"""
+Forwarding engine for the Telegram Auto Forwarder.
+
+One engine serves every configured route from a single TelegramClient and a
+single NewMessage handler. Incoming events are dispatched with one dict
+lookup from the chat ID to the routes fed by that chat. The handler only
+filters, drops duplicates and queues; sender workers drain the queue at the
+pace allowed by the rate limiter.
+
+A route may fan out to several destinations: the message is filtered once
+and one job per destination is queued. Every destination is drained by its
+own worker under its own rate limit, so a slow or failing destination never
+holds up the others, and the outcome is reported per destination.
+
+Media albums arrive through an Album handler and travel through the pipeline
+as one unit. Media that cannot be sent by reference (protected content, or
+routes in ``reupload`` mode) is downloaded and uploaded again through the
+media cache. Routes in ``native`` forward mode use ``forward_messages``, and
+native forwards from the same source that arrive close together are sent in
+one batched call.
+
+Routes and filters come from an immutable Settings object and can be
+swapped at runtime with apply_settings. Every source and destination is
+resolved once into an InputPeer by the
+entity resolver, so sends never pay for a username lookup.
+
+Sends go through an account pool. With a single account every send uses
+the receiving client; with several, destinations are sharded across the
+accounts and an account hitting a FloodWait is drained to the others.
+
+On startup, messages posted since the last checkpoint of each source are
+replayed through the same pipeline before live events are processed.
+Without an outbox a checkpoint only moves past messages that were sent (or
+filtered out), so messages still queued when the process dies are replayed.
+
+With an outbox, every queued job is also written to disk and acknowledged
+only after it was sent; failed sends are retried with backoff and jobs left
+over from a previous run are queued again on startup.
+
+Each message gets a Trace on arrival that its jobs carry through the queue;
+the log record for each completed send holds the time spent to every stage.
+"""
+
+import time
+import heapq
+import asyncio
+import logging
+import sqlite3
+from collections import OrderedDict
+from telethon import events
+from telethon.errors import (FloodWaitError, PeerIdInvalidError, ChannelInvalidError,
+                             ChatForwardsRestrictedError, MessageNotModifiedError)
+
+from deals import DealCache
+from digest import DigestBuffer, compose, entry_text, message_link
+from dedup import fingerprints
+from routes import build_route_table
+from rate_limiter import RateLimiter
+from send_queue import Job, SendQueue
+from entity_cache import EntityResolver
+from accounts import Account, AccountPool
+from structured_logging import Trace
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram accepts at most this many message IDs per forward_messages call
+MAX_FORWARD_IDS = 100
+
+# How often the outbox is checked for failed sends that are due again, in seconds
+RETRY_INTERVAL = 1
+
+# How many recently handled message IDs are remembered to skip live duplicates
+RECENT_IDS = 10000
+
+# How often digests are checked for having waited their interval, in seconds
+DIGEST_CHECK_INTERVAL = 1
+
+
+class FanOut:
+    """Collect the per-destination results of one message sent to several destinations."""
+
+    __slots__ = ('route', 'message_id', 'results', 'trace')
+
+    def __init__(self, route, message_id, destinations, trace=None):
+        self.route = route
+        self.message_id = message_id
+        self.results = dict.fromkeys(destinations)
+        self.trace = trace
+
+    def report(self, destination, result):
+        self.results[destination] = result
+        if all(r is not None for r in self.results.values()):
+            summary = ', '.join(f"{d}: {r}" for d, r in self.results.items())
+            extra = {'trace': self.trace.id} if self.trace is not None else None
+            logger.info("Message %s on route %s: %s", self.message_id, self.route, summary, extra=extra)
+
+
+def album_text(messages):
+    """Return the caption of an album (the first non-empty one)."""
+    return next((m.message for m in messages if m.message), "")
+
+
+class ForwardingEngine:
+    """Dispatch new messages from many sources to many destinations."""
+
+    # How many times a send is retried after a FloodWait
+    max_flood_retries = 3
+
+    def __init__(self, client, settings, limiter=None, dedup=None, checkpoint=None,
+                 resolver=None, outbox=None, accounts=None, media=None, message_map=None,
+                 watchdog=None):
+        self.client = client
+        self.settings = settings
+        if accounts is None:
+            accounts = AccountPool([Account('main', client, resolver or EntityResolver(client),
+                                            limiter or RateLimiter.from_settings(settings))])
+        self.accounts = accounts
+        self.resolver = accounts.primary.resolver
+        self.limiter = accounts.primary.limiter
+        self.routes = list(settings.routes)
+        self.table = {}
+        self.source_peers = {}  # marked peer ID -> InputPeer of each source
+        self.accounts.configure(settings, self.routes)
+        self.queue = SendQueue.from_settings(settings, self.deliver,
+                                             self.serialize_job, self.restore_spilled,
+                                             self.batch_key, self.deliver_batch,
+                                             self.discard)
+        self.dedup = dedup
+        self.checkpoint = checkpoint
+        self.outbox = outbox
+        self.media = media
+        self.message_map = message_map
+        self.watchdog = watchdog
+        self.deals = DealCache()  # parsed once per message, shared by routes and dedup
+        self.digests = DigestBuffer()  # jobs of digest routes waiting for their digest
+        self.destination_stats = {}  # destination -> sent/failed counts and last error
+        self._catching_up = False
+        self._backlog = []
+        self._recent = OrderedDict()  # (peer ID, message ID) of recently handled messages
+        self._handled = {}  # peer ID -> highest message ID handled
+        self._unsent = {}  # peer ID -> (heap of message IDs, message ID -> jobs not sent yet)
+        self._background = []
+        self._attached = False
+
+    async def _build_table(self, routes):
+        """Resolve the routes' chats and build a dispatch table for them."""
+        references = [r.source_chat_id for r in routes] + [d for r in routes for d in r.destinations]
+        await self.accounts.resolve_all(references)
+
+        resolved = {}
+        source_peers = {}
+        for route in routes:
+            peer_id = self.resolver.peer_id(route.source_chat_id)
+            if peer_id is None:
+                logger.error(f"Source chat {route.source_chat_id} of route {route.name} could not be resolved")
+                continue
+            resolved[route.source_chat_id] = peer_id
+            source_peers[peer_id] = self.resolver.get(route.source_chat_id)
+
+        return build_route_table(routes, resolved), source_peers
+
+    async def resolve(self):
+        """Resolve every source and destination once and build the dispatch table."""
+        self.table, self.source_peers = await self._build_table(self.routes)
+        return self.table
+
+    async def add_accounts(self, accounts):
+        """Send from extra accounts that connected after the engine started."""
+        references = [r.source_chat_id for r in self.routes] + [d for r in self.routes for d in r.destinations]
+        for account in accounts:
+            await account.resolver.resolve_all(references)
+            self.accounts.add(account)
+        self.accounts.configure(self.settings, self.routes)
+
+    async def apply_settings(self, settings):
+        """
+        Swap in new routes, filters and rate limits while running.
+
+        Messages already queued keep the route they were accepted with, so
+        nothing in flight is dropped. Settings that need a restart (workers,
+        queue size, storage paths, credentials) are reported and ignored.
+        """
+        routes = list(settings.routes)
+        table, source_peers = await self._build_table(routes)
+
+        for name in self.settings.restart_required(settings):
+            logger.warning(f"Setting {name} changed; restart the forwarder to apply it")
+        if self.media is None and any(r.forward_mode == 'reupload' for r in routes):
+            logger.warning("A route now uses forward_mode = reupload; restart the forwarder to "
+                           "create the media cache, until then its media is sent by reference")
+
+        self.accounts.configure(settings, routes)
+        self.queue.batch_window = settings.batch_window
+        # No await between these, so handlers see either the old or the new table
+        self.routes, self.table, self.source_peers = routes, table, source_peers
+        self.settings = settings
+        logger.info(f"Reloaded settings: {len(routes)} route(s) from {len(table)} source(s)")
+
+    def attach(self):
+        """
+        Start the sender workers and attach the shared message handlers.
+
+        Nothing is awaited, so messages are received from here on; while
+        start() replays missed messages, live ones are held back.
+        """
+        if self._attached:
+            return
+        self._attached = True
+        self.queue.start()
+        self._catching_up = self.checkpoint is not None
+        self.client.add_event_handler(self.message_handler, events.NewMessage())
+        self.client.add_event_handler(self.album_handler, events.Album())
+        if self.message_map is not None:
+            if self.settings.mirror_edits:
+                self.client.add_event_handler(self.edit_handler, events.MessageEdited())
+            if self.settings.mirror_deletes:
+                self.client.add_event_handler(self.delete_handler, events.MessageDeleted())
+
+    async def start(self):
+        """
+        Attach the handlers if attach() was not called yet, then start forwarding.
+
+        Jobs left in the outbox by a previous run are queued first. Live
+        events that arrive while missed messages are being replayed are held
+        back and processed right after the replay, in order.
+        """
+        self.attach()
+        if self.media is not None:
+            self.media.ready()  # scan the cached files in the background
+
+        self._background.append(asyncio.ensure_future(self.flush_digests()))
+        if self.dedup is not None:
+            self._background.append(asyncio.ensure_future(self.dedup.autosync()))
+        if self.outbox is not None:
+            pending = await self.redeliver()
+            if pending:
+                logger.info(f"Queued {pending} unsent message(s) from the outbox")
+            self._background.append(asyncio.ensure_future(self.outbox.autosync()))
+            self._background.append(asyncio.ensure_future(self.retry_failed()))
+
+        if self.checkpoint is not None:
+            self._background.append(asyncio.ensure_future(self.checkpoint.autosave()))
+            await self.recover()
+        if self.watchdog is not None:
+            self.watchdog.start(self.recover)
+
+    async def recover(self):
+        """
+        Replay the messages missed while stopped or disconnected.
+
+        Live events that arrive meanwhile are held back and processed right
+        after the replay, in order. Returns the number of messages replayed.
+        """
+        if self.checkpoint is None:
+            return 0
+        self._catching_up = True
+        try:
+            count = await self.catch_up()
+            # Held-back events up to where the replay got were part of it
+            replayed_to = dict(self.checkpoint.last_ids)
+            for peer_id, message_id in self._handled.items():
+                replayed_to[peer_id] = max(replayed_to.get(peer_id, 0), message_id)
+            while self._backlog:
+                peer_id, messages = self._backlog.pop(0)
+                await self.process(peer_id, messages, replayed_to.get(peer_id))
+        finally:
+            self._catching_up = False
+        return count
+
+    async def stop(self):
+        """Detach the message handlers and stop the sender workers."""
+        if self.watchdog is not None:
+            await self.watchdog.stop()
+        self.client.remove_event_handler(self.message_handler)
+        self.client.remove_event_handler(self.album_handler)
+        self.client.remove_event_handler(self.edit_handler)
+        self.client.remove_event_handler(self.delete_handler)
+        if len(self.digests):
+            logger.info(f"Sending {len(self.digests)} message(s) waiting for a digest before stopping")
+            for jobs in self.digests.drain():
+                await self.deliver_digest(jobs)
+        await self.queue.stop()
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._background = []
+        if self.dedup:
+            self.dedup.close()
+        if self.outbox:
+            # Unsent jobs stay in the outbox and are sent after the next start
+            self.outbox.close()
+        if self.message_map:
+            self.message_map.close()
+
+    async def catch_up(self):
+        """Replay messages posted to each source since its last checkpoint; returns how many."""
+        total = 0
+        for peer_id in self.table:
+            last_id = self.checkpoint.get(peer_id)
+            if last_id is None:
+                continue  # first run for this source, start from live messages
+
+            count = 0
+            album = []
+            try:
+                source = self.source_peers.get(peer_id, peer_id)
+                async for message in self.client.iter_messages(
+                        source, min_id=last_id, reverse=True, limit=self.settings.catch_up_limit):
+                    count += 1
+                    # Regroup album parts so they are replayed as one unit
+                    if album and message.grouped_id == album[0].grouped_id:
+                        album.append(message)
+                        continue
+                    if album:
+                        await self.process(peer_id, album, last_id)
+                        album = []
+                    if message.grouped_id:
+                        album.append(message)
+                    else:
+                        await self.process(peer_id, [message], last_id)
+                if album:
+                    await self.process(peer_id, album, last_id)
+            except Exception as e:
+                logger.error(f"Error catching up on source {peer_id}: {e}")
+            if count:
+                logger.info(f"Caught up on {count} missed message(s) from {peer_id}")
+            total += count
+        return total
+
+    async def message_handler(self, event):
+        """Handle a new message from any chat."""
+        # Album parts are handled together by album_handler
+        if event.message.grouped_id:
+            return
+        await self.dispatch(event.chat_id, [event.message])
+
+    async def album_handler(self, event):
+        """Handle a media album from any chat as a single unit."""
+        await self.dispatch(event.chat_id, list(event.messages))
+
+    async def edit_handler(self, event):
+        """Queue an edit of the sent copies of an edited source message."""
+        routes = self.table.get(event.chat_id)
+        if not routes:
+            return
+        await self._queue_mirror('edit', event.chat_id, routes, [event.message])
+
+    async def delete_handler(self, event):
+        """Queue the deletion of the sent copies of deleted source messages."""
+        # Telegram only says which chat a deletion happened in for channels
+        routes = self.table.get(event.chat_id) if event.chat_id is not None else None
+        if not routes:
+            return
+        await self._queue_mirror('delete', event.chat_id, routes, list(event.deleted_ids))
+
+    async def _queue_mirror(self, action, peer_id, routes, items):
+        # Behind the destination's pending sends, so a copy is sent before it is changed
+        queued = set()
+        for route in routes:
+            if route.digest:
+                continue  # a digest stands for many messages
+            if action == 'edit' and route.forward_mode == 'native':
+                continue  # forwarded messages cannot be edited
+            for destination in route.destinations:
+                if destination not in queued:
+                    queued.add(destination)
+                    await self.queue.put(Job(destination, (route, peer_id, items), action=action))
+
+    async def dispatch(self, peer_id, messages):
+        """Process messages now, or hold them back while catching up."""
+        if self._catching_up:
+            if peer_id in self.table:
+                self._backlog.append((peer_id, messages))
+            return
+        await self.process(peer_id, messages)
+
+    async def process(self, peer_id, messages, replayed_to=None):
+        """
+        Filter a message (or album) from a source and queue it for its routes.
+
+        ``replayed_to`` is the checkpoint a replay starts from: messages up
+        to it were already handled. Live messages are not compared with the
+        checkpoint, since an album arrives after the messages posted right
+        behind it; they are skipped only when their IDs were handled lately.
+        """
+        routes = self.table.get(peer_id)
+        if not routes:
+            return
+
+        last_message_id = max(m.id for m in messages)
+        if replayed_to is not None and last_message_id <= replayed_to:
+            return
+        # Skip anything already handled, e.g. seen both in catch-up and live
+        keys = [(peer_id, m.id) for m in messages]
+        if any(key in self._recent for key in keys):
+            return
+        for key in keys:
+            self._recent[key] = None
+        while len(self._recent) > RECENT_IDS:
+            self._recent.popitem(last=False)
+
+        trace = Trace()
+        # The captioned part of an album stands in for it when deduplicating
+        lead = next((m for m in messages if m.message), messages[0])
+        prints = None  # fingerprinted once, for every route and destination
+        for route in routes:
+            metrics.MESSAGES_RECEIVED.labels(route.name).inc()
+            if not self.accepts(route, messages):
+                metrics.MESSAGES_FILTERED.labels(route.name).inc()
+                continue
+            trace.mark('filtered')
+            fanout = FanOut(route.name, lead.id, route.destinations, trace) if len(route.destinations) > 1 else None
+            if self.dedup and prints is None:
+                prints = fingerprints(lead, self.deals.get(lead).urls)
+            for destination in route.destinations:
+                if self.dedup and self.dedup.contains(destination, lead, prints):
+                    logger.info("Skipping duplicate message %s for %s (route %s)", lead.id, destination,
+                                route.name, extra={'trace': trace.id})
+                    metrics.MESSAGES_DUPLICATE.labels(route.name).inc()
+                    if fanout:
+                        fanout.report(destination, 'duplicate')
+                    continue
+                job = Job(destination, (route, peer_id, messages), fanout=fanout, trace=trace, prints=prints)
+                if self.checkpoint is not None and self.outbox is None:
+                    self._hold_checkpoint(peer_id, last_message_id)
+                if self.dedup:
+                    # Recorded once sent; until then only reposts queued meanwhile are skipped
+                    self.dedup.hold(destination, prints)
+                if self.outbox is not None:
+                    job.outbox_id = self.outbox.add(job.destination, self.serialize_job(job))
+                await self.enqueue(job)
+                trace.mark('queued')
+
+        if self.checkpoint is not None:
+            self._handled[peer_id] = max(self._handled.get(peer_id, 0), last_message_id)
+            self._advance_checkpoint(peer_id)
+
+    def _hold_checkpoint(self, peer_id, message_id):
+        # Without an outbox a queued job is lost on a crash, so keep it above the checkpoint until sent
+        heap, counts = self._unsent.setdefault(peer_id, ([], {}))
+        if message_id not in counts:
+            counts[message_id] = 0
+            heapq.heappush(heap, message_id)
+        counts[message_id] += 1
+
+    def _advance_checkpoint(self, peer_id):
+        last_id = self._handled.get(peer_id)
+        if last_id is None:
+            return
+        unsent = self._unsent.get(peer_id)
+        if unsent:
+            heap, counts = unsent
+            while heap and heap[0] not in counts:
+                heapq.heappop(heap)
+            if heap:
+                last_id = min(last_id, heap[0] - 1)
+        self.checkpoint.update(peer_id, last_id)
+
+    def _settle(self, job):
+        """Release the checkpoint held back by a job that was sent or given up on."""
+        if job.action == 'send' and self._unsent:
+            _, peer_id, messages = job.payload
+            self._settle_message(peer_id, max(m.id for m in messages))
+
+    def _settle_message(self, peer_id, message_id):
+        counts = self._unsent.get(peer_id, (None, {}))[1]
+        if message_id not in counts:
+            return  # e.g. a backfill job
+        counts[message_id] -= 1
+        if not counts[message_id]:
+            del counts[message_id]
+            self._advance_checkpoint(peer_id)
+
+    async def enqueue(self, job):
+        """Queue a job, or collect it for its route's digest."""
+        if job.action == 'send' and job.payload[0].digest:
+            jobs = self.digests.add(job)
+            if jobs:
+                await self._queue_digest(jobs)
+            return
+        await self.queue.put(job)
+
+    async def _queue_digest(self, jobs):
+        # Queued back to back, so the send queue hands them over as one batch
+        for job in jobs:
+            await self.queue.put(job)
+
+    async def flush_digests(self):
+        """Periodically queue the digests whose interval is over."""
+        while True:
+            await asyncio.sleep(DIGEST_CHECK_INTERVAL)
+            for jobs in self.digests.due():
+                await self._queue_digest(jobs)
+
+    def accepts(self, route, messages):
+        """Check whether a route would forward this message or album."""
+        text = album_text(messages)
+        # Check if message contains any of the route's keywords
+        if not route.matches(text):
+            return False
+        if route.deal_filter is not None:
+            lead = next((m for m in messages if m.message), messages[0])
+            if not route.deal_filter(self.deals.get(lead)):
+                return False
+        # Only forward if there's media to send or actual text content
+        has_media = any(m.media for m in messages)
+        return bool((has_media and route.forward_media) or text)
+
+    def batch_key(self, job):
+        """Native forwards from the same source to a destination can share a call, digests are one batch."""
+        route, peer_id, messages = job.payload
+        if job.action != 'send':
+            return None
+        if route.digest:
+            return ('digest', route.name)
+        if route.forward_mode == 'native':
+            return peer_id
+        return None
+
+    async def deliver(self, job):
+        """Send one queued message or album to its destination."""
+        if job.action != 'send':
+            return await self.mirror(job)
+        route, peer_id, messages = job.payload
+        if route.forward_mode == 'native':
+            return await self.deliver_batch([job])
+        try:
+            account, sent = await self.send_copy(job)
+        except Exception as e:
+            logger.error("Error forwarding message %s to %s on route %s: %s", messages[0].id, job.destination,
+                         route.name, e, extra=self._trace_fields(job))
+            self.record_failed([job], e)
+        else:
+            self.remember_copies(peer_id, job.destination, account, messages, sent)
+            self.record_forwarded([job])
+
+    async def send_copy(self, job):
+        """
+        Send a job's message or album as a new message, without a forward header.
+
+        Returns the account used and the sent message(s); errors are raised.
+        """
+        route, peer_id, messages = job.payload
+        destination = job.destination
+        first = messages[0]
+        transform = route.transform
+        reupload = route.forward_mode == 'reupload' and self.media is not None
+
+        async def send_album(account, peer):
+            items = await self.messages_for(account, route, peer_id, messages)
+            captions = [m.message or '' for m in items]
+            if transform is not None:
+                captions = [self.transform_text(route, c)[0] if c else c for c in captions]
+            if not reupload:
+                try:
+                    return await account.client.send_file(peer, [m.media for m in items], caption=captions)
+                except ChatForwardsRestrictedError:
+                    if self.media is None:
+                        raise
+                    logger.info("Album %s is protected, re-uploading it", first.grouped_id)
+            return await self.reupload(account, peer, items, caption=captions)
+
+        async def send_media(account, peer):
+            item = (await self.messages_for(account, route, peer_id, [first]))[0]
+            caption, entities = item.message, item.entities
+            if transform is not None:
+                caption, entities = self.transform_text(route, caption, entities)
+            if not reupload:
+                try:
+                    if transform is None:
+                        return await account.client.send_message(peer, item)
+                    return await account.client.send_file(peer, item.media, caption=caption,
+                                                          formatting_entities=entities)
+                except ChatForwardsRestrictedError:
+                    if self.media is None:
+                        raise
+                    logger.info("Message %s is protected, re-uploading its media", item.id)
+            return await self.reupload(account, peer, [item], caption=caption,
+                                       formatting_entities=entities)
+
+        if len(messages) > 1 and route.forward_media:
+            logger.debug("Forwarding album %s (%d items) to %s (route %s)",
+                         first.grouped_id, len(messages), destination, route.name)
+            return await self.send(destination, send_album)
+        if first.media and route.forward_media:
+            # Try to forward the message with media if it has any
+            logger.debug("Forwarding message %s with media to %s (route %s)", first.id, destination, route.name)
+            return await self.send(destination, send_media)
+        logger.debug("Forwarding message %s text to %s (route %s)", first.id, destination, route.name)
+        if transform is None:
+            text = album_text(messages)
+            return await self.send(destination, lambda account, peer: account.client.send_message(peer, text))
+        lead = next((m for m in messages if m.message), first)
+        text, entities = self.transform_text(route, lead.message, lead.entities)
+        return await self.send(destination, lambda account, peer: account.client.send_message(
+            peer, text, formatting_entities=entities))
+
+    async def mirror(self, job):
+        """Apply a source message's edit or deletion to its copies in the destination."""
+        route, peer_id, items = job.payload
+        destination = job.destination
+        source_ids = list(items) if job.action == 'delete' else [m.id for m in items]
+        copies = self.message_map.lookup(peer_id, source_ids, destination)
+        if not copies:
+            return  # never sent there, or sent before the retention
+        if job.action == 'edit':
+            message = items[0]
+            text, entities = message.message or '', message.entities
+            if route.transform is not None:
+                text, entities = self.transform_text(route, text, entities)
+            if not text and not message.media:
+                return
+
+        by_account = {}
+        for _, dest_id, name in copies:
+            by_account.setdefault(name, []).append(dest_id)
+        for name, dest_ids in by_account.items():
+            # Only the account that sent a message can change it
+            account = self.accounts.get(name)
+            if account is None:
+                logger.warning("Cannot %s messages in %s, account %s is no longer configured",
+                               job.action, destination, name)
+                continue
+            try:
+                if job.action == 'delete':
+                    await self.send(destination, lambda account, peer: account.client.delete_messages(
+                        peer, dest_ids), account=account)
+                else:
+                    for dest_id in dest_ids:
+                        await self.send(destination, lambda account, peer: account.client.edit_message(
+                            peer, dest_id, text, formatting_entities=entities), account=account)
+            except MessageNotModifiedError:
+                pass
+            except Exception as e:
+                logger.error("Error mirroring %s of message(s) %s to %s: %s", job.action, source_ids,
+                             destination, e)
+                continue
+            metrics.MESSAGES_MIRRORED.labels(route.name, job.action).inc(len(dest_ids))
+        if job.action == 'delete':
+            self.message_map.forget(peer_id, source_ids, destination)
+
+    def remember_copies(self, peer_id, destination, account, messages, sent):
+        """Record which destination messages the source messages became."""
+        if self.message_map is None or sent is None:
+            return
+        sent = [m for m in (sent if isinstance(sent, list) else [sent]) if m is not None]
+        if len(sent) == len(messages):
+            pairs = [(source.id, copy.id) for source, copy in zip(messages, sent)]
+        elif sent:
+            # Sent as a single text message: it stands for the captioned part
+            lead = next((m for m in messages if m.message), messages[0])
+            pairs = [(lead.id, sent[0].id)]
+        else:
+            return
+        try:
+            self.message_map.add(peer_id, destination, account.name, pairs)
+        except sqlite3.Error as e:
+            logger.error(f"Error recording sent messages in the message map: {e}")
+
+    async def reupload(self, account, peer, messages, **kwargs):
+        """Send messages' media as new uploads, through the media cache."""
+        files = await asyncio.gather(*(self.media.file_for(account, m) for m in messages))
+        digests = [digest for digest, _ in files]
+        handles = [handle for _, handle in files]
+        if len(messages) == 1:
+            handles = handles[0]
+            attributes = getattr(messages[0].document, 'attributes', None)
+            if attributes:
+                kwargs['attributes'] = attributes
+        try:
+            sent = await account.client.send_file(peer, handles, **kwargs)
+        except Exception:
+            # A remembered upload may have expired; the next attempt uploads again
+            self.media.forget(account, digests)
+            raise
+        self.media.remember(account, digests, sent)
+        return sent
+
+    def transform_text(self, route, text, entities=None):
+        """Apply a route's text rules, returning the new text and entities."""
+        return route.transform.apply(text, entities, route=route.name,
+                                     source=route.source_chat_id)
+
+    def record_forwarded(self, jobs):
+        """Count sent jobs and their receive-to-send latency, and acknowledge them."""
+        now = time.monotonic()
+        for job in jobs:
+            metrics.MESSAGES_FORWARDED.labels(job.payload[0].name, job.destination).inc()
+            metrics.FORWARD_LATENCY.observe(now - job.enqueued)
+            self._destination_stats(job.destination)['sent'] += 1
+            if job.outbox_id is not None:
+                self.outbox.ack(job.outbox_id)
+            if job.prints is not None and self.dedup:
+                self.dedup.record(job.destination, job.prints)
+            self._settle(job)
+            if logger.isEnabledFor(logging.INFO):
+                route, _, messages = job.payload
+                logger.info("Forwarded message %s to %s (route %s)", messages[0].id, job.destination,
+                            route.name, extra=self._trace_fields(job, 'sent'))
+            if job.fanout is not None:
+                job.fanout.report(job.destination, 'sent')
+
+    def record_failed(self, jobs, error):
+        """Schedule failed jobs for a retry, or count them as lost."""
+        for job in jobs:
+            route = job.payload[0]
+            stats = self._destination_stats(job.destination)
+            stats['last_error'] = str(error)
+            delay = None
+            if job.outbox_id is not None:
+                delay = self.outbox.fail(job.outbox_id)
+            if delay is None:
+                if job.prints is not None and self.dedup:
+                    self.dedup.release(job.destination, job.prints)
+                self._settle(job)
+                metrics.MESSAGES_FAILED.labels(route.name, job.destination).inc()
+                stats['failed'] += 1
+                result = 'failed'
+            else:
+                logger.info("Retrying message for %s (route %s) in %ss", job.destination, route.name,
+                            delay, extra=self._trace_fields(job))
+                metrics.MESSAGES_RETRIED.labels(route.name).inc()
+                result = f'retrying in {delay}s'
+            if job.fanout is not None:
+                job.fanout.report(job.destination, result)
+
+    @staticmethod
+    def _trace_fields(job, final=None):
+        """Log record fields for a job: its trace and stage timings."""
+        if job.trace is None:
+            return {'route': job.payload[0].name, 'destination': str(job.destination)}
+        return job.trace.extra(final, route=job.payload[0].name, destination=str(job.destination))
+
+    def _destination_stats(self, destination):
+        stats = self.destination_stats.get(destination)
+        if stats is None:
+            stats = self.destination_stats[destination] = {'sent': 0, 'failed': 0, 'last_error': None}
+        return stats
+
+    def discard(self, job):
+        """Acknowledge a job the send queue dropped, so it is not sent later."""
+        if job.outbox_id is not None:
+            self.outbox.ack(job.outbox_id)
+        if job.prints is not None and self.dedup:
+            self.dedup.release(job.destination, job.prints)
+        self._settle(job)
+
+    async def deliver_batch(self, jobs):
+        """Forward the messages of several native-mode jobs with as few calls as possible."""
+        destination = jobs[0].destination
+        route, peer_id = jobs[0].payload[:2]
+        if route.digest:
+            return await self.deliver_digest(jobs)
+        messages = [m for job in jobs for m in job.payload[2]]
+        try:
+            await self.forward_batch(route, peer_id, destination, messages)
+        except Exception as e:
+            logger.error("Error forwarding messages from %s to %s: %s", peer_id, destination, e)
+            self.record_failed(jobs, e)
+        else:
+            self.record_forwarded(jobs)
+
+    async def deliver_digest(self, jobs):
+        """Send the messages of a digest route's jobs as one combined message (or a few)."""
+        destination = jobs[0].destination
+        route = jobs[0].payload[0]
+        entries = []
+        for job in jobs:
+            _, peer_id, messages = job.payload
+            lead = next((m for m in messages if m.message), messages[0])
+            text, entities = lead.message, lead.entities
+            if route.transform is not None and text:
+                text, entities = self.transform_text(route, text, entities)
+            entries.append(entry_text(text, entities, message_link(route.source_chat_id, peer_id, lead.id)))
+        parts = compose(f"📰 Digest: {len(jobs)} message{'s' if len(jobs) != 1 else ''}", entries)
+        logger.debug("Sending a digest of %d message(s) to %s in %d part(s) (route %s)",
+                     len(jobs), destination, len(parts), route.name)
+        try:
+            for part in parts:
+                await self.send(destination, lambda account, peer: account.client.send_message(
+                    peer, part, parse_mode=None, link_preview=False))
+        except Exception as e:
+            logger.error("Error sending a digest of %d message(s) to %s on route %s: %s", len(jobs),
+                         destination, route.name, e)
+            self.record_failed(jobs, e)
+        else:
+            metrics.DIGESTS_SENT.labels(route.name).inc(len(parts))
+            self.record_forwarded(jobs)
+
+    async def forward_batch(self, route, peer_id, destination, messages):
+        """Forward messages from one source natively, MAX_FORWARD_IDS per call; errors are raised."""
+        for start in range(0, len(messages), MAX_FORWARD_IDS):
+            chunk = messages[start:start + MAX_FORWARD_IDS]
+            ids = [m.id for m in chunk]
+            logger.debug("Forwarding %d message(s) from %s to %s in one call", len(chunk), peer_id, destination)
+            account, sent = await self.send(destination, lambda account, peer: account.client.forward_messages(
+                peer, ids, from_peer=self.source_for(account, route, peer_id)))
+            self.remember_copies(peer_id, destination, account, chunk, sent)
+
+    async def send(self, destination, request, account=None):
+        """
+        Run a send request once the rate limit allows.
+
+        ``request`` is called with the account picked for the send (or the
+        given one) and the destination's InputPeer cached for that account.
+        FloodWaits are retried after the pause Telegram asks for, on another
+        account when there is one, and a peer Telegram rejects is resolved
+        again once. Returns the account used and the request's result.
+        """
+        fixed = account
+        refreshed = False
+        attempt = 0
+        while True:
+            account = fixed or self.accounts.pick(destination)
+            await account.limiter.acquire(destination)
+            if self.outbox is not None:
+                # Make every job accepted so far durable before anything is sent
+                self.outbox.sync()
+            started = time.monotonic()
+            try:
+                result = await request(account, account.resolver.get(destination))
+                metrics.SEND_RTT.observe(time.monotonic() - started)
+                metrics.ACCOUNT_SENDS.labels(account.name).inc()
+                account.sent += 1
+                return account, result
+            except FloodWaitError as e:
+                metrics.FLOOD_WAIT_SECONDS.labels(destination).inc(e.seconds)
+                if attempt == self.max_flood_retries:
+                    raise
+                attempt += 1
+                self.accounts.flood_wait(account, destination, e.seconds)
+            except (PeerIdInvalidError, ChannelInvalidError):
+                if refreshed:
+                    raise
+                refreshed = True
+                await account.resolver.refresh(destination)
+
+    def source_for(self, account, route, peer_id):
+        """The source chat's InputPeer as seen by an account."""
+        if account is self.accounts.primary:
+            return self.source_peers.get(peer_id, peer_id)
+        return account.resolver.get(route.source_chat_id)
+
+    async def messages_for(self, account, route, peer_id, messages):
+        """
+        Return the messages as seen by an account.
+
+        Media references are only valid for the account that received the
+        message, so other accounts fetch their own copy before sending it.
+        """
+        if account is self.accounts.primary:
+            return messages
+        fetched = await account.client.get_messages(
+            self.source_for(account, route, peer_id), ids=[m.id for m in messages])
+        fetched = [m for m in fetched if m is not None]
+        if not fetched:
+            raise ValueError(f"Account {account.name} cannot read messages from {route.source_chat_id}")
+        return fetched
+
+    def serialize_job(self, job):
+        """Turn a job into a JSON-safe record for the spill file or the outbox."""
+        route, peer_id, messages = job.payload
+        record = {'route': route.name, 'chat_id': peer_id, 'destination': job.destination,
+                  'message_ids': list(messages) if job.action == 'delete' else [m.id for m in messages]}
+        if job.action != 'send':
+            record['action'] = job.action
+        if job.outbox_id is not None:
+            record['outbox_id'] = job.outbox_id
+        if job.trace is not None:
+            record['trace'] = job.trace.id
+        if job.prints is not None:
+            record['prints'] = job.prints
+        return record
+
+    async def restore_job(self, record):
+        """Rebuild a stored job by fetching its messages again."""
+        route = next((r for r in self.routes if r.name == record['route']), None)
+        if route is None:
+            return None
+        destination = record.get('destination', route.destinations[0])
+        if destination not in route.destinations:
+            return None  # the destination was removed from the route
+        action = record.get('action', 'send')
+        if action == 'delete':
+            # Deleted messages cannot be fetched; their IDs are all a deletion needs
+            return Job(destination, (route, record['chat_id'], record['message_ids']), action=action)
+        source = self.source_peers.get(record['chat_id'], record['chat_id'])
+        messages = await self.client.get_messages(source, ids=record['message_ids'])
+        messages = [m for m in messages if m is not None]
+        prints = record.get('prints')
+        if not messages:
+            if prints is not None and self.dedup:
+                self.dedup.release(destination, prints)  # deleted from the source meanwhile
+            return None
+        if prints is not None and self.dedup:
+            self.dedup.hold(destination, prints)  # again after a restart
+        return Job(destination, (route, record['chat_id'], messages), outbox_id=record.get('outbox_id'),
+                   trace=Trace(record.get('trace')), action=action, prints=prints)
+
+    async def restore_spilled(self, record):
+        """Rebuild a job read back from the spill file; digest jobs rejoin their digest."""
+        job = await self.restore_job(record)
+        if job is None and record.get('action', 'send') == 'send' and self._unsent:
+            self._settle_message(record['chat_id'], max(record['message_ids']))
+        if job is not None and job.action == 'send' and job.payload[0].digest:
+            # Queued together by flush_digests, instead of one by one as they are read back
+            self.digests.hold(job)
+            return None
+        return job
+
+    async def redeliver(self):
+        """Queue the outbox entries that are due for another attempt."""
+        count = 0
+        for entry_id, record in self.outbox.due():
+            try:
+                job = await self.restore_job(record)
+            except Exception as e:
+                logger.error(f"Error restoring outbox entry {entry_id}: {e}")
+                self.outbox.fail(entry_id)
+                continue
+            if job is None:
+                # The route is gone or the messages were deleted
+                self.outbox.ack(entry_id)
+                continue
+            job.outbox_id = entry_id
+            await self.enqueue(job)
+            count += 1
+        return count
+
+    async def retry_failed(self):
+        """Periodically queue failed sends whose backoff has expired."""
+        while True:
+            await asyncio.sleep(RETRY_INTERVAL)
+            try:
+                await self.redeliver()
+            except Exception as e:
+                logger.error(f"Error retrying failed messages: {e}")
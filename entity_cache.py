@@ -0,0 +1,125 @@
+"""
+Entity resolution cache for the Telegram Auto Forwarder.
+
+Every configured source and destination is resolved once at startup into an
+InputPeer, which is all Telegram needs to address a chat. Sends then use the
+cached peer directly, so a username such as @INRDealsBot is never looked up
+again on the message path. The cache is saved next to the session file and
+reused on the next start; an entry is only refreshed when Telegram rejects
+it with a PeerIdInvalid-style error.
+"""
+
+import os
+import json
+import logging
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+logger = logging.getLogger(__name__)
+
+
+def cache_path_for(client):
+    """Return the cache file that belongs next to the client's session file."""
+    filename = getattr(client.session, 'filename', None)
+    if not filename:
+        return None
+    if filename.endswith('.session'):
+        filename = filename[:-len('.session')]
+    return filename + '.entities.json'
+
+
+def _dump_peer(peer):
+    if isinstance(peer, InputPeerChannel):
+        return {'type': 'channel', 'id': peer.channel_id, 'hash': peer.access_hash}
+    if isinstance(peer, InputPeerUser):
+        return {'type': 'user', 'id': peer.user_id, 'hash': peer.access_hash}
+    if isinstance(peer, InputPeerChat):
+        return {'type': 'chat', 'id': peer.chat_id}
+    return None
+
+
+def _load_peer(data):
+    if data['type'] == 'channel':
+        return InputPeerChannel(data['id'], data['hash'])
+    if data['type'] == 'user':
+        return InputPeerUser(data['id'], data['hash'])
+    if data['type'] == 'chat':
+        return InputPeerChat(data['id'])
+    raise ValueError(f"Unknown peer type {data['type']}")
+
+
+class EntityResolver:
+    """Resolve chat references to InputPeers once and remember them."""
+
+    def __init__(self, client, path=None):
+        self.client = client
+        self.path = path
+        self.peers = {}  # str(reference) -> InputPeer
+        self.load()
+
+    def load(self):
+        """Read cached peers from disk, if there is a cache file."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.peers = {ref: _load_peer(peer) for ref, peer in data.items()}
+            logger.info(f"Loaded {len(self.peers)} cached entities from {self.path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error reading entity cache {self.path}: {e}")
+            self.peers = {}
+
+    def save(self):
+        """Write the cached peers to disk atomically."""
+        if not self.path:
+            return
+        data = {}
+        for ref, peer in self.peers.items():
+            dumped = _dump_peer(peer)
+            if dumped:
+                data[ref] = dumped
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error writing entity cache {self.path}: {e}")
+
+    async def resolve(self, reference):
+        """Return the InputPeer for a reference, asking Telegram only on a cache miss."""
+        key = str(reference)
+        peer = self.peers.get(key)
+        if peer is None:
+            peer = await self.client.get_input_entity(reference)
+            self.peers[key] = peer
+            self.save()
+        return peer
+
+    async def resolve_all(self, references):
+        """Resolve many references; failures are logged and left out."""
+        resolved = {}
+        for reference in references:
+            if reference in resolved:
+                continue
+            try:
+                resolved[reference] = await self.resolve(reference)
+            except Exception as e:
+                logger.error(f"Error resolving chat {reference}: {e}")
+        return resolved
+
+    async def refresh(self, reference):
+        """Drop a stale cache entry and resolve the reference again."""
+        logger.warning(f"Cached entity for {reference} was rejected, resolving it again")
+        self.peers.pop(str(reference), None)
+        return await self.resolve(reference)
+
+    def get(self, reference):
+        """Return the cached peer, or the reference itself if it is not cached."""
+        return self.peers.get(str(reference), reference)
+
+    def peer_id(self, reference):
+        """Return the marked ID Telegram uses in events for a cached reference."""
+        peer = self.peers.get(str(reference))
+        return utils.get_peer_id(peer) if peer is not None else None
@@ -0,0 +1,93 @@
+"""
+Precompiled keyword matching for the Telegram Auto Forwarder.
+
+A route's keywords are compiled once at startup into a single regular
+expression built from a trie of the lowercased keywords, so shared prefixes
+are tested only once and a message is checked in one pass over its
+lowercased text, however many keywords there are.
+
+Besides plain keywords a matcher supports:
+
+- whole-word matching (``whole_word = true``), so "pen" does not match "open"
+- exclude keywords (``exclude_keywords``) that reject a message outright
+- regex rules (``keyword_regex``, one pattern per line) that also accept a
+  message, matched case-insensitively against the original text
+"""
+
+import re
+
+
+def _build_trie(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[None] = True  # end of a keyword
+    return trie
+
+
+def _trie_to_pattern(node):
+    alternatives = [re.escape(char) + _trie_to_pattern(child)
+                    for char, child in sorted((k, v) for k, v in node.items() if k is not None)]
+    if not alternatives:
+        return ''
+
+    ends_here = None in node
+    if len(alternatives) == 1 and not ends_here:
+        return alternatives[0]
+
+    pattern = '(?:' + '|'.join(alternatives) + ')'
+    return pattern + '?' if ends_here else pattern
+
+
+def compile_keywords(keywords, whole_word=False):
+    """
+    Compile keywords into one regex that matches lowercased text.
+
+    Returns None when there are no keywords.
+    """
+    words = sorted({k.strip().lower() for k in keywords if k and k.strip()})
+    if not words:
+        return None
+
+    pattern = _trie_to_pattern(_build_trie(words))
+    if whole_word:
+        pattern = r'(?<!\w)' + pattern + r'(?!\w)'
+    return re.compile(pattern)
+
+
+class KeywordMatcher:
+    """Decide whether a message passes a route's keyword filter."""
+
+    __slots__ = ('include', 'exclude', 'patterns')
+
+    def __init__(self, keywords=(), exclude=(), patterns=(), whole_word=False):
+        self.include = compile_keywords(keywords, whole_word)
+        self.exclude = compile_keywords(exclude, whole_word)
+        self.patterns = [re.compile(p, re.IGNORECASE) for p in patterns if p]
+
+    @property
+    def filters(self):
+        """True when the matcher accepts only some messages."""
+        return self.include is not None or bool(self.patterns)
+
+    def matches(self, text):
+        """Check the message text against the compiled rules."""
+        text = text or ""
+        lowered = text.lower()
+
+        if self.exclude is not None and self.exclude.search(lowered):
+            return False
+        if not self.filters:
+            return True
+        if self.include is not None and self.include.search(lowered):
+            return True
+        return any(p.search(text) for p in self.patterns)
+
+
+def parse_patterns(value):
+    """Split a multi-line config value into one regex per line."""
+    if not value:
+        return []
+    return [line.strip() for line in value.splitlines() if line.strip()]
@@ -0,0 +1,262 @@
+"""
+Media re-upload cache for the Telegram Auto Forwarder.
+
+Channels with protected content do not allow their media to be forwarded
+or sent by reference, so the only way to copy it is to download the file and
+upload it again. This cache makes that cheap:
+
+- each file is downloaded once, streamed to disk in chunks while it is
+  hashed, and stored under its SHA-256 so identical files share one copy
+- the cache is bounded by size and evicts the least recently used files
+- a file is uploaded once per account and the upload handle is shared by
+  every destination; once sent, the message's media is remembered and later
+  sends of the same file reuse it by reference instead of uploading again
+- downloads and uploads run concurrently, bounded by ``media_parallel``
+- the files already on disk are scanned once in a worker thread, so a large
+  cache does not hold up startup
+
+The cache exists only while a route uses ``forward_mode = reupload``;
+``media_cache_mb = 0`` turns it off.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    media_cache_dir = media_cache
+    media_cache_mb = 1024
+    media_parallel = 3
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from dedup import media_id
+
+logger = logging.getLogger(__name__)
+
+# Bytes requested from Telegram per download chunk (must be a multiple of 4096)
+CHUNK_SIZE = 512 * 1024
+INDEX_FILE = 'index.json'
+
+
+def _file_name(message):
+    """A file name whose extension tells Telegram how to present the upload."""
+    if message.photo is not None:
+        return 'photo.jpg'
+    document = message.document
+    for attribute in getattr(document, 'attributes', None) or ():
+        name = getattr(attribute, 'file_name', None)
+        if name:
+            return name
+    mime_type = getattr(document, 'mime_type', '') or ''
+    extension = mime_type.split('/')[-1] if '/' in mime_type else 'bin'
+    return f'file.{extension}'
+
+
+class MediaCache:
+    """Download media once, upload it once per account and reuse it."""
+
+    def __init__(self, directory='media_cache', max_bytes=1024 * 1024 * 1024, parallel=3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.files = OrderedDict()  # digest -> size, least recently used first
+        self.index = {}             # media ID -> digest
+        self.handles = {}           # (account name, digest) -> upload or sent media to reuse
+        self.total = 0
+        self.downloads = 0
+        self.hits = 0
+        self.uploads = 0
+        self.reused = 0
+        self._downloading = {}      # media ID -> task, so a file is fetched only once
+        self._uploading = {}        # (account name, digest) -> task, so it is uploaded only once
+        self._limit = asyncio.Semaphore(max(1, parallel))
+        self._loading = None        # task scanning the files already on disk
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create a media cache from Settings, or None when no route re-uploads or the size is 0."""
+        if not settings.media_cache_size or not any(r.forward_mode == 'reupload' for r in settings.routes):
+            return None
+        return cls(settings.media_cache_dir, settings.media_cache_size, settings.media_parallel)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _scan(self):
+        """Find the files and the media ID index already on disk; runs in a worker thread."""
+        found = []
+        index = {}
+        if not os.path.isdir(self.directory):
+            return found, index
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if len(name) != 64 or root == self.directory:
+                    continue  # not a cached file
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        return sorted(found), index
+
+    async def _load(self):
+        found, index = await asyncio.get_event_loop().run_in_executor(None, self._scan)
+        # Files cached since the scan started are the most recently used
+        files = OrderedDict((digest, size) for _, digest, size in found if digest not in self.files)
+        self.total += sum(files.values())
+        files.update(self.files)
+        self.files = files
+        for key, digest in index.items():
+            if digest in self.files:
+                self.index.setdefault(key, digest)
+        if self.files:
+            logger.info(f"Media cache has {len(self.files)} file(s), {self.total / 1048576:.1f} MB")
+
+    def ready(self):
+        """Start loading the cache state from disk once; returns a future to await."""
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        return self._loading
+
+    def save(self):
+        """Write the media ID index atomically."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing media cache index {path}: {e}")
+
+    def _touch(self, digest):
+        self.files.move_to_end(digest)
+        try:
+            os.utime(self._path(digest))
+        except OSError:
+            pass
+
+    def _add(self, key, digest, size):
+        if digest not in self.files:
+            self.files[digest] = size
+            self.total += size
+        self.index[key] = digest
+        self._touch(digest)
+        self._evict(keep=digest)
+        self.save()
+
+    def _evict(self, keep):
+        """Delete least recently used files until the cache fits its size limit."""
+        while self.total > self.max_bytes and len(self.files) > 1:
+            digest, size = next(iter(self.files.items()))
+            if digest == keep:
+                break
+            del self.files[digest]
+            self.total -= size
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
+            self.index = {k: d for k, d in self.index.items() if d != digest}
+            self.handles = {k: m for k, m in self.handles.items() if k[1] != digest}
+            logger.debug(f"Evicted {digest} from the media cache")
+
+    async def _download(self, client, message, key):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f'{key.replace(":", "_")}.part')
+        sha256 = hashlib.sha256()
+        size = 0
+        async with self._limit:
+            try:
+                with open(tmp_path, 'wb') as f:
+                    async for chunk in client.iter_download(message.media, request_size=CHUNK_SIZE):
+                        sha256.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        digest = sha256.hexdigest()
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        self.downloads += 1
+        self._add(key, digest, size)
+        logger.info(f"Downloaded {key} ({size / 1024:.0f} KB) into the media cache")
+        return digest
+
+    async def fetch(self, client, message):
+        """Return the digest of a message's media, downloading it on a cache miss."""
+        key = media_id(message)
+        if key is None:
+            raise ValueError(f"Message {message.id} has no media to copy")
+        await self.ready()
+        digest = self.index.get(key)
+        if digest is not None and os.path.exists(self._path(digest)):
+            self.hits += 1
+            self._touch(digest)
+            return digest
+
+        task = self._downloading.get(key)
+        if task is None:
+            task = self._downloading[key] = asyncio.ensure_future(self._download(client, message, key))
+            task.add_done_callback(lambda _: self._downloading.pop(key, None))
+        return await task
+
+    async def file_for(self, account, message):
+        """
+        Return what to pass to send_file for a message's media.
+
+        That is the media this account already sent for the same file when
+        there is one, otherwise a fresh upload of the cached file.
+        """
+        digest = await self.fetch(account.client, message)
+        key = (account.name, digest)
+        handle = self.handles.get(key)
+        if handle is not None:
+            self.reused += 1
+            return digest, handle
+
+        task = self._uploading.get(key)
+        if task is None:
+            task = self._uploading[key] = asyncio.ensure_future(self._upload(account, message, digest))
+            task.add_done_callback(lambda _: self._uploading.pop(key, None))
+        return digest, await task
+
+    async def _upload(self, account, message, digest):
+        async with self._limit:
+            uploaded = await account.client.upload_file(self._path(digest), file_name=_file_name(message))
+        self.uploads += 1
+        # An uploaded file can be sent to several chats; remember() later
+        # replaces it with the longer-lived media of the sent message
+        if digest in self.files:
+            self.handles[(account.name, digest)] = uploaded
+        return uploaded
+
+    def remember(self, account, digests, sent):
+        """Keep the media of sent messages so the same files are not uploaded again."""
+        sent = sent if isinstance(sent, list) else [sent]
+        for digest, message in zip(digests, sent):
+            media = getattr(message, 'media', None)
+            if media is not None and digest in self.files:
+                self.handles[(account.name, digest)] = media
+
+    def forget(self, account, digests):
+        """Drop remembered media that Telegram no longer accepts."""
+        for digest in digests:
+            self.handles.pop((account.name, digest), None)
+
+    def stats(self):
+        return {
+            'files': len(self.files),
+            'megabytes': round(self.total / 1048576, 1),
+            'downloads': self.downloads,
+            'hits': self.hits,
+            'uploads': self.uploads,
+            'reused': self.reused,
+        }
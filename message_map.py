@@ -0,0 +1,92 @@
+"""
+Source-to-destination message map for the Telegram Auto Forwarder.
+
+Deal posts are edited when the price changes and deleted when the deal
+expires. To mirror that, every successful send records which destination
+message(s) each source message became, and which account sent them (only
+the sender can edit or delete a message).
+
+The map lives in a SQLite table keyed by (source chat, source message ID,
+destination), so a lookup is a single index probe and memory use does not
+grow with the number of messages. Rows older than the retention are
+purged periodically; edits and deletes of older messages are not mirrored.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    mirror_edits = true
+    mirror_deletes = true
+    message_map_db = message_map.sqlite3
+    message_map_retention_hours = 168
+"""
+
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How often rows past the retention are removed, in seconds
+PURGE_INTERVAL = 3600
+
+
+class MessageMap:
+    """Which destination messages each forwarded source message became."""
+
+    def __init__(self, path='message_map.sqlite3', retention=7 * 24 * 3600):
+        self.retention = retention
+        self._last_purge = 0.0
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS sent ('
+            'source INTEGER NOT NULL, source_id INTEGER NOT NULL, destination TEXT NOT NULL, '
+            'dest_id INTEGER NOT NULL, account TEXT NOT NULL, sent REAL NOT NULL, '
+            'PRIMARY KEY (source, source_id, destination, dest_id)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS sent_time ON sent (sent)')
+        self.db.commit()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create a message map from Settings, or None when nothing is mirrored."""
+        if not (settings.mirror_edits or settings.mirror_deletes):
+            return None
+        return cls(settings.message_map_db, settings.message_map_retention)
+
+    def add(self, source, destination, account, pairs):
+        """Record (source message ID, destination message ID) pairs of one send."""
+        now = time.time()
+        self.db.executemany(
+            'INSERT OR REPLACE INTO sent (source, source_id, destination, dest_id, account, sent) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(source, source_id, str(destination), dest_id, account, now) for source_id, dest_id in pairs])
+        self.db.commit()
+        if now - self._last_purge > PURGE_INTERVAL:
+            self.purge(now)
+
+    def lookup(self, source, source_ids, destination):
+        """Return (source ID, destination ID, account name) for the given source messages."""
+        placeholders = ','.join('?' * len(source_ids))
+        return self.db.execute(
+            f'SELECT source_id, dest_id, account FROM sent WHERE source = ? AND source_id IN ({placeholders}) '
+            f'AND destination = ?', [source, *source_ids, str(destination)]).fetchall()
+
+    def forget(self, source, source_ids, destination):
+        """Drop the rows of source messages that were deleted."""
+        placeholders = ','.join('?' * len(source_ids))
+        self.db.execute(
+            f'DELETE FROM sent WHERE source = ? AND source_id IN ({placeholders}) AND destination = ?',
+            [source, *source_ids, str(destination)])
+        self.db.commit()
+
+    def purge(self, now=None):
+        """Delete rows older than the retention."""
+        now = now or time.time()
+        self._last_purge = now
+        cursor = self.db.execute('DELETE FROM sent WHERE sent < ?', (now - self.retention,))
+        self.db.commit()
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} expired message map entries")
+
+    def close(self):
+        self.db.close()
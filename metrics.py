@@ -0,0 +1,282 @@
+"""
+In-process metrics for the Telegram Auto Forwarder.
+
+A tiny Prometheus-compatible registry: counters, gauges and histograms that
+the forwarder updates on the message path and the status server renders on
+``/metrics`` in the Prometheus text format. Labelled children are created
+once and cached, so recording a value is a plain attribute update.
+
+The module also holds the health check used by ``/status``.
+"""
+
+import math
+import threading
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+RTT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Outages range from a dropped socket to hours of a stalled host
+GAP_BUCKETS = (10, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the child for the given label values, creating it once."""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(_format_labels(self.labelnames, values), values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def _render_child(self, labels, values, child):
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from ``function`` whenever metrics are rendered."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, or be read from a callback."""
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def set_function(self, function):
+        self._children[()].set_function(function)
+
+    def _render_child(self, labels, values, child):
+        return [f"{self.name}{labels} {_format_value(child.get())}"]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Counts observations into cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def _render_child(self, labels, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            bucket_labels = _format_labels(self.labelnames + ('le',), values + (_format_value(float(bound)),))
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """A collection of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+MESSAGES_RECEIVED = REGISTRY.counter(
+    'forwarder_messages_received_total', 'Messages received from a route\'s source chat.', ('route',))
+MESSAGES_FILTERED = REGISTRY.counter(
+    'forwarder_messages_filtered_total', 'Messages dropped by a route\'s filters.', ('route',))
+MESSAGES_DUPLICATE = REGISTRY.counter(
+    'forwarder_messages_duplicate_total', 'Messages skipped as already sent to the destination.', ('route',))
+MESSAGES_FORWARDED = REGISTRY.counter(
+    'forwarder_messages_forwarded_total', 'Messages sent to a route\'s destination.', ('route', 'destination'))
+MESSAGES_FAILED = REGISTRY.counter(
+    'forwarder_messages_failed_total', 'Messages that could not be sent.', ('route', 'destination'))
+MESSAGES_RETRIED = REGISTRY.counter(
+    'forwarder_messages_retried_total', 'Failed sends scheduled for another attempt.', ('route',))
+FLOOD_WAIT_SECONDS = REGISTRY.counter(
+    'forwarder_flood_wait_seconds_total', 'Seconds of FloodWait imposed by Telegram.', ('destination',))
+MESSAGES_MIRRORED = REGISTRY.counter(
+    'forwarder_messages_mirrored_total', 'Source edits and deletes applied to destination copies.',
+    ('route', 'action'))
+DIGESTS_SENT = REGISTRY.counter(
+    'forwarder_digests_sent_total', 'Combined digest messages sent for digest routes.', ('route',))
+ACCOUNT_SENDS = REGISTRY.counter(
+    'forwarder_account_sends_total', 'Successful send requests made by each account.', ('account',))
+QUEUE_DEPTH = REGISTRY.gauge(
+    'forwarder_queue_depth', 'Messages waiting in the send queue.')
+QUEUE_LAG = REGISTRY.gauge(
+    'forwarder_queue_lag_seconds', 'Age of the oldest message waiting in the send queue.')
+DIGEST_PENDING = REGISTRY.gauge(
+    'forwarder_digest_pending', 'Messages collected for digests that were not sent yet.')
+OUTBOX_PENDING = REGISTRY.gauge(
+    'forwarder_outbox_pending', 'Accepted messages in the outbox that were not sent yet.')
+FORWARD_LATENCY = REGISTRY.histogram(
+    'forwarder_forward_latency_seconds', 'Time from receiving a message to having sent it.',
+    buckets=LATENCY_BUCKETS)
+WATCHDOG_TRIPS = REGISTRY.counter(
+    'forwarder_watchdog_trips_total', 'Stalled connections detected by the watchdog.', ('reason',))
+RECONNECTS = REGISTRY.counter(
+    'forwarder_reconnects_total', 'Reconnects forced by the watchdog.', ('result',))
+RECONNECT_SECONDS = REGISTRY.histogram(
+    'forwarder_reconnect_seconds', 'Time from a watchdog trip to a working connection.',
+    buckets=LATENCY_BUCKETS)
+GAP_SECONDS = REGISTRY.histogram(
+    'forwarder_update_gap_seconds', 'Time without updates covered by a recovery.',
+    buckets=GAP_BUCKETS)
+GAP_MESSAGES = REGISTRY.counter(
+    'forwarder_gap_messages_total', 'Missed source messages replayed after a reconnect.')
+LAST_UPDATE_AGE = REGISTRY.gauge(
+    'forwarder_last_update_age_seconds', 'Seconds since the last update from Telegram.')
+SEND_RTT = REGISTRY.histogram(
+    'forwarder_send_seconds', 'Duration of a single Telegram send request.',
+    buckets=RTT_BUCKETS)
+
+
+# Health check used by /status; set by the forwarder once it is running
+_health_check = None
+
+
+def set_health_check(function):
+    """Register a function returning ``(healthy, details)`` for ``/status``."""
+    global _health_check
+    _health_check = function
+
+
+def health():
+    """Return ``(healthy, details)`` from the registered health check."""
+    if _health_check is None:
+        return False, {'status': 'starting'}
+    try:
+        healthy, details = _health_check()
+    except Exception as e:
+        return False, {'status': 'error', 'error': str(e)}
+    details = dict(details)
+    details['status'] = 'ok' if healthy else 'unhealthy'
+    return healthy, details
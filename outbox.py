@@ -0,0 +1,146 @@
+"""
+Durable outbox for the Telegram Auto Forwarder.
+
+Every message accepted for a destination is written to the outbox before it
+is sent and removed once the send succeeded, so nothing is lost when a send
+fails or the process dies mid-burst: failed sends are retried with
+exponential backoff, and whatever is still pending is replayed on the next
+start. Delivery is at least once; a message may be sent twice if the
+process stops between the send and its acknowledgement.
+
+Entries live in a small SQLite database in WAL mode. Writes are not
+committed one by one: they are grouped into one transaction that is
+committed (and fsynced) right before the next send, or after a short
+interval, so a burst of messages costs a single fsync.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    outbox = true
+    outbox_db = outbox.sqlite3
+    outbox_max_attempts = 10
+    outbox_retry_seconds = 5
+"""
+
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts at the same entry, in seconds
+MAX_BACKOFF = 3600
+
+
+class Outbox:
+    """A write-ahead log of accepted messages that have not been sent yet."""
+
+    def __init__(self, path='outbox.sqlite3', max_attempts=10, backoff=5, sync_interval=0.2):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.sync_interval = sync_interval
+        self.retried = 0
+        self.given_up = 0
+        self._inflight = set()  # entry IDs currently queued or being sent
+        self._dirty = False
+
+        # Commits are rare and batched, so each one can afford a full fsync
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                        'id INTEGER PRIMARY KEY, destination TEXT NOT NULL, record TEXT NOT NULL, '
+                        'attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt)')
+        self.db.commit()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create an outbox from Settings, or None when disabled."""
+        if not settings.outbox:
+            return None
+        return cls(settings.outbox_db, settings.outbox_max_attempts, settings.outbox_retry)
+
+    @property
+    def pending(self):
+        """Number of entries not yet acknowledged."""
+        return self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def add(self, destination, record):
+        """Record a message for a destination and return its entry ID."""
+        cursor = self.db.execute(
+            'INSERT INTO outbox (destination, record, next_attempt) VALUES (?, ?, ?)',
+            (str(destination), json.dumps(record), time.time()))
+        self._dirty = True
+        self._inflight.add(cursor.lastrowid)
+        return cursor.lastrowid
+
+    def ack(self, entry_id):
+        """Forget an entry once it was sent."""
+        self.db.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
+        self._dirty = True
+        self._inflight.discard(entry_id)
+
+    def fail(self, entry_id):
+        """
+        Schedule a failed entry for another attempt.
+
+        Returns the delay before the retry in seconds, or None when the entry
+        ran out of attempts and was dropped.
+        """
+        self._inflight.discard(entry_id)
+        row = self.db.execute('SELECT attempts FROM outbox WHERE id = ?', (entry_id,)).fetchone()
+        if row is None:
+            return None
+        attempts = row[0] + 1
+        self._dirty = True
+        if attempts >= self.max_attempts:
+            self.db.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
+            self.given_up += 1
+            return None
+        delay = min(MAX_BACKOFF, self.backoff * 2 ** (attempts - 1))
+        self.db.execute('UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?',
+                        (attempts, time.time() + delay, entry_id))
+        self.retried += 1
+        return delay
+
+    def due(self, limit=100):
+        """
+        Take up to ``limit`` entries whose next attempt is due.
+
+        Returns ``(entry_id, record)`` pairs in the order they were added and
+        marks them in flight until they are acknowledged or failed again.
+        On startup nothing is in flight, so every pending entry is due.
+        """
+        rows = self.db.execute(
+            'SELECT id, record FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?',
+            (time.time(), limit + len(self._inflight))).fetchall()
+        entries = []
+        for entry_id, record in rows:
+            if entry_id in self._inflight:
+                continue
+            self._inflight.add(entry_id)
+            entries.append((entry_id, json.loads(record)))
+            if len(entries) == limit:
+                break
+        return entries
+
+    def sync(self):
+        """Commit everything written since the last sync in one transaction."""
+        if self._dirty:
+            self.db.commit()
+            self._dirty = False
+
+    async def autosync(self):
+        """Sync periodically; meant to run as a background task."""
+        try:
+            while True:
+                await asyncio.sleep(self.sync_interval)
+                self.sync()
+        finally:
+            self.sync()
+
+    def close(self):
+        self.sync()
+        self.db.close()
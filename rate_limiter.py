@@ -0,0 +1,134 @@
+"""
+Rate limiting for the Telegram Auto Forwarder.
+
+Every send waits on two token buckets: one for its destination and one
+shared by the whole account. Buckets refill continuously, so a quiet channel
+sends immediately while a burst is spread out at the configured rate. When
+Telegram answers with a FloodWait, only the bucket of the affected
+destination is paused for the requested number of seconds.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    destination_burst = 3               # sends allowed back-to-back per destination
+    account_messages_per_minute = 30    # sustained rate for the whole account
+    account_burst = 5                   # sends allowed back-to-back for the account
+
+The per-destination rate comes from each route's ``delay_seconds``.
+"""
+
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """An asyncio token bucket that hands out tokens in FIFO order."""
+
+    def __init__(self, rate, capacity):
+        # rate is in tokens per second; a rate of 0 means unlimited
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        else:
+            self.tokens = self.capacity
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    @property
+    def paused(self):
+        return time.monotonic() < self.paused_until
+
+
+class RateLimiter:
+    """Per-destination token buckets plus one global bucket for the account."""
+
+    def __init__(self, account_rate=0.5, account_burst=5, destination_burst=3):
+        self.account = TokenBucket(account_rate, account_burst)
+        self.destination_burst = destination_burst
+        self.destinations = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create a limiter from the forwarder's Settings."""
+        return cls(
+            account_rate=settings.account_rate,
+            account_burst=settings.account_burst,
+            destination_burst=settings.destination_burst,
+        )
+
+    def reconfigure(self, settings):
+        """Apply changed account and burst limits to the existing buckets."""
+        self.account.rate = settings.account_rate
+        self.account.capacity = max(1, settings.account_burst)
+        self.destination_burst = settings.destination_burst
+        for bucket in self.destinations.values():
+            bucket.capacity = max(1, settings.destination_burst)
+
+    def configure_routes(self, routes):
+        """
+        Set the pacing of each destination from its routes' delays.
+
+        When several routes share a destination the shortest delay wins.
+        """
+        delays = {}
+        for route in routes:
+            for destination in route.destinations:
+                current = delays.get(destination)
+                if current is None or route.delay_seconds < current:
+                    delays[destination] = route.delay_seconds
+
+        for destination, delay in delays.items():
+            rate = 1.0 / delay if delay > 0 else 0
+            bucket = self.destinations.get(destination)
+            if bucket is None:
+                self.destinations[destination] = TokenBucket(rate, self.destination_burst)
+            else:
+                bucket.rate = rate
+
+    def bucket(self, destination):
+        bucket = self.destinations.get(destination)
+        if bucket is None:
+            bucket = self.destinations[destination] = TokenBucket(0, self.destination_burst)
+        return bucket
+
+    async def acquire(self, destination):
+        """Wait for both the destination and the account bucket."""
+        # Take the destination token first so a slow destination never holds
+        # an account token that other destinations could use
+        await self.bucket(destination).acquire()
+        await self.account.acquire()
+
+    def flood_wait(self, destination, seconds):
+        """Pause only the bucket of the destination that hit a FloodWait."""
+        logger.warning(f"FloodWait of {seconds}s for {destination}, pausing its sends")
+        self.bucket(destination).pause(seconds)
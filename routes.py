@@ -0,0 +1,215 @@
+"""
+Routing table for the Telegram Auto Forwarder.
+
+A route connects a source chat to one or more destination chats with its
+own keyword filter, media flag and delay. Routes are read from config sections named
+``[Route <name>]``, for example:
+
+    [Route deals]
+    source_chat_id = -1001234567890
+    destination_chat_id = @INRDealsBot, -1009876543210
+    keywords = laptop, phone
+    exclude_keywords = refurbished
+    whole_word = false
+    forward_media = true
+    forward_mode = copy
+    delay_seconds = 5
+
+Several destinations are separated by commas; a message is filtered once
+and then sent to each of them independently.
+
+``forward_mode`` is ``copy`` (send the content as a new message) or
+``native`` (use Telegram's forward, keeping the "Forwarded from" header)
+or ``reupload`` (like copy, but media is downloaded and uploaded again, for
+channels that protect their content).
+Copy-mode routes can also rewrite the text on the way (``replace``,
+``strip``, ``url_rewrite`` and ``template``, see transforms.py).
+``deal_filter`` keeps only deals worth forwarding, e.g.
+``discount >= 60 and price < 500`` (see deals.py).
+``digest = true`` collects a route's messages and sends them as one
+combined message every ``digest_interval_seconds`` or ``digest_max_messages``
+(see digest.py).
+
+Any option missing from a route section falls back to the value in
+``[Forwarding]``. When no route sections exist, ``[Forwarding]`` itself is
+used as a single route so existing config files keep working.
+"""
+
+from deals import compile_deal_filter
+from digest import MAX_DIGEST_MESSAGES
+from keyword_filter import KeywordMatcher, parse_patterns
+from transforms import TextTransform
+
+ROUTE_SECTION_PREFIX = 'ROUTE '
+FORWARD_MODES = ('copy', 'native', 'reupload')
+
+
+def parse_chat_ref(value):
+    """Turn a configured chat reference into an int ID or a username string."""
+    value = value.strip()
+    if value.lstrip('-').isdigit():
+        return int(value)
+    return value
+
+
+def parse_destinations(value):
+    """Split a comma-separated list of destination chats into chat references."""
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value).split(',')
+    return [parse_chat_ref(str(item)) for item in items if str(item).strip()]
+
+
+def parse_keywords(value):
+    """Split a comma-separated keyword string into a clean list."""
+    if not value:
+        return []
+    return [k.strip() for k in value.split(',') if k.strip()]
+
+
+def parse_bool(value, default=True):
+    """Parse a config boolean written as true/false, yes/no, y/n or 1/0."""
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('true', 'yes', 'y', '1', 'on')
+
+
+class Route:
+    """A forwarding rule from one source to one or more destinations."""
+
+    __slots__ = ('name', 'source_chat_id', 'destinations',
+                 'keywords', 'exclude_keywords', 'keyword_patterns',
+                 'whole_word', 'forward_media', 'forward_mode', 'delay_seconds',
+                 'matcher', 'transform', 'deal_filter',
+                 'digest', 'digest_interval', 'digest_max')
+
+    def __init__(self, name, source_chat_id, destinations,
+                 keywords=None, forward_media=True, delay_seconds=5,
+                 exclude_keywords=None, keyword_patterns=None, whole_word=False,
+                 forward_mode='copy', transform=None, deal_filter=None,
+                 digest=False, digest_interval=600, digest_max=50):
+        self.name = name
+        self.source_chat_id = parse_chat_ref(str(source_chat_id))
+        self.destinations = parse_destinations(destinations)
+        self.keywords = [k.lower() for k in (keywords or [])]
+        self.exclude_keywords = [k.lower() for k in (exclude_keywords or [])]
+        self.keyword_patterns = list(keyword_patterns or [])
+        self.whole_word = whole_word
+        self.forward_media = forward_media
+        self.forward_mode = forward_mode if forward_mode in FORWARD_MODES else 'copy'
+        self.delay_seconds = delay_seconds
+        # Compile the filter once so the message handler never re-parses it
+        self.matcher = KeywordMatcher(self.keywords, self.exclude_keywords,
+                                      self.keyword_patterns, whole_word)
+        # Compiled text rules applied before sending, or None
+        self.transform = transform
+        # Compiled deal_filter predicate over a Deal, or None
+        self.deal_filter = deal_filter
+        # Collect messages into combined digests instead of sending each one
+        self.digest = digest
+        self.digest_interval = max(1, digest_interval)
+        self.digest_max = max(1, min(digest_max, MAX_DIGEST_MESSAGES))
+
+    def matches(self, text):
+        """Check whether the message text passes this route's keyword filter."""
+        return self.matcher.matches(text)
+
+    def __repr__(self):
+        return f"Route({self.name!r}, {self.source_chat_id!r} -> {self.destinations!r})"
+
+
+def _route_from_section(name, section, defaults):
+    """Build a Route from a config section, falling back to defaults."""
+    def get(key, fallback=''):
+        value = section.get(key)
+        if value is None or value.strip() == '':
+            value = defaults.get(key, fallback)
+        return value
+
+    source = get('source_chat_id')
+    destination = get('destination_chat_id', '@INRDealsBot')
+    if not source or not source.strip() or not destination or not destination.strip():
+        return None
+
+    try:
+        delay = int(get('delay_seconds', '5'))
+    except ValueError:
+        delay = 5
+
+    try:
+        digest_interval = int(get('digest_interval_seconds', '600'))
+        digest_max = int(get('digest_max_messages', '50'))
+    except ValueError:
+        raise ValueError(f"route {name}: digest_interval_seconds and digest_max_messages must be numbers")
+
+    try:
+        transform = TextTransform.from_config(get('replace'), get('strip'),
+                                              get('url_rewrite'), get('template'))
+    except ValueError as e:
+        raise ValueError(f"route {name}: {e}")
+
+    try:
+        deal_filter = compile_deal_filter(get('deal_filter'))
+    except ValueError as e:
+        raise ValueError(f"route {name}: {e}")
+
+    return Route(
+        name=name,
+        source_chat_id=source,
+        destinations=destination,
+        keywords=parse_keywords(get('keywords')),
+        forward_media=parse_bool(get('forward_media', 'true')),
+        delay_seconds=delay,
+        exclude_keywords=parse_keywords(get('exclude_keywords')),
+        keyword_patterns=parse_patterns(get('keyword_regex')),
+        whole_word=parse_bool(get('whole_word', 'false'), default=False),
+        forward_mode=get('forward_mode', 'copy').strip().lower(),
+        transform=transform,
+        deal_filter=deal_filter,
+        digest=parse_bool(get('digest', 'false'), default=False),
+        digest_interval=digest_interval,
+        digest_max=digest_max,
+    )
+
+
+def load_routes(config):
+    """
+    Read every route from a loaded ConfigParser.
+
+    Returns a list of Route objects. Sections that are missing a source or
+    destination are skipped.
+    """
+    defaults = config['Forwarding'] if 'Forwarding' in config else {}
+    routes = []
+
+    for section in config.sections():
+        if section.upper().startswith(ROUTE_SECTION_PREFIX):
+            name = section[len(ROUTE_SECTION_PREFIX):].strip()
+            route = _route_from_section(name, config[section], defaults)
+            if route:
+                routes.append(route)
+
+    if not routes and defaults:
+        route = _route_from_section('default', defaults, {})
+        if route:
+            routes.append(route)
+
+    return routes
+
+
+def build_route_table(routes, resolved_ids):
+    """
+    Build the dispatch table used by the message handler.
+
+    ``resolved_ids`` maps each configured source reference to the marked peer
+    ID Telegram reports as ``event.chat_id``. The result maps that peer ID to
+    the list of routes fed by the chat, so dispatch is a single dict lookup.
+    """
+    table = {}
+    for route in routes:
+        peer_id = resolved_ids.get(route.source_chat_id)
+        if peer_id is None:
+            continue
+        table.setdefault(peer_id, []).append(route)
+    return table
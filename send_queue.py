@@ -0,0 +1,298 @@
+"""
+Bounded send queue for the Telegram Auto Forwarder.
+
+The message handler only filters a message and puts a job on this queue; a
+pool of sender workers does the actual sends. Jobs are kept in one FIFO per
+destination and a destination is owned by at most one worker at a time, so
+messages for the same destination keep their order while a slow destination
+never ties up the other workers.
+
+Jobs that share a batch key (for example native forwards from the same
+source) can be coalesced: the worker waits ``batch_window_ms`` for more to
+arrive and hands every consecutive job with that key to one batched send.
+
+When the queue is full the overflow policy decides what happens:
+
+    block        the handler waits until there is room (default)
+    drop_oldest  the oldest waiting job is discarded
+    spill        new jobs are appended to a file on disk and read back in
+                 order once the queue has room again
+
+The spill file only relieves memory and is started over on every start;
+spilled jobs survive a restart through the outbox, which the settings
+require for the spill policy.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    send_workers = 4
+    queue_size = 1000
+    queue_overflow = block
+    queue_spill_file = send_queue.spill
+    batch_window_ms = 500
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
+
+
+class Job:
+    """A single pending send."""
+
+    __slots__ = ('destination', 'payload', 'enqueued', 'outbox_id', 'fanout', 'trace', 'action', 'prints')
+
+    def __init__(self, destination, payload, enqueued=None, outbox_id=None, fanout=None, trace=None,
+                 action='send', prints=None):
+        self.destination = destination
+        self.payload = payload
+        self.enqueued = time.monotonic() if enqueued is None else enqueued
+        # Entry in the durable outbox to acknowledge once the job was sent
+        self.outbox_id = outbox_id
+        # Results of the sibling jobs sending the same message elsewhere
+        self.fanout = fanout
+        # The message's trace, shared by its jobs for every destination
+        self.trace = trace
+        # 'send', or 'edit'/'delete' to mirror a change to the sent copies;
+        # these share the destination's FIFO so they run after the send
+        self.action = action
+        # Dedup fingerprints to record once the job was sent
+        self.prints = prints
+
+
+class SpillFile:
+    """Append-only JSON lines file used as overflow storage."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._offset = 0
+        if os.path.exists(path):
+            os.remove(path)
+
+    def append(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self.count += 1
+
+    def pop(self):
+        """Read the next record in write order, or None when empty."""
+        if not self.count:
+            return None
+        with open(self.path, 'r') as f:
+            f.seek(self._offset)
+            line = f.readline()
+            self._offset = f.tell()
+        self.count -= 1
+        if not self.count:
+            # Everything was read back, start the file over
+            os.remove(self.path)
+            self._offset = 0
+        return json.loads(line)
+
+
+class SendQueue:
+    """A bounded queue of sends drained by a pool of workers."""
+
+    def __init__(self, send, workers=4, maxsize=1000, overflow='block',
+                 spill_path='send_queue.spill', serialize=None, deserialize=None,
+                 batch_key=None, send_batch=None, batch_window=0.5, max_batch=100,
+                 on_drop=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown queue overflow policy: {overflow}")
+        if overflow == 'spill' and (serialize is None or deserialize is None):
+            raise ValueError("The spill overflow policy needs serialize and deserialize functions")
+
+        self.send = send
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.spill = SpillFile(spill_path) if overflow == 'spill' else None
+        self.batch_key = batch_key if send_batch is not None else None
+        self.send_batch = send_batch
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.on_drop = on_drop
+
+        self.dropped = 0
+        self.sent = 0
+        self.last_lag = 0.0
+
+        self._pending = {}        # destination -> deque of jobs
+        self._ready = deque()     # destinations with jobs and no worker
+        self._size = 0
+        self._wakeup = None
+        self._room = None
+        self._tasks = []
+
+    @classmethod
+    def from_settings(cls, settings, send, serialize=None, deserialize=None,
+                      batch_key=None, send_batch=None, on_drop=None):
+        """Create a queue from the forwarder's Settings."""
+        return cls(send, workers=settings.send_workers, maxsize=settings.queue_size,
+                   overflow=settings.queue_overflow, spill_path=settings.queue_spill_file,
+                   serialize=serialize, deserialize=deserialize,
+                   batch_key=batch_key, send_batch=send_batch,
+                   batch_window=settings.batch_window, on_drop=on_drop)
+
+    @property
+    def depth(self):
+        """Number of jobs waiting, including any spilled to disk."""
+        return self._size + (self.spill.count if self.spill else 0)
+
+    @property
+    def lag(self):
+        """Age in seconds of the oldest job still waiting in memory."""
+        oldest = self._oldest()
+        if oldest is None:
+            return 0.0
+        return time.monotonic() - oldest[1].enqueued
+
+    def stats(self):
+        """Queue figures used to size the worker pool."""
+        return {
+            'depth': self.depth,
+            'in_memory': self._size,
+            'spilled': self.spill.count if self.spill else 0,
+            'lag_seconds': round(self.lag, 3),
+            'last_lag_seconds': round(self.last_lag, 3),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'workers': self.workers,
+        }
+
+    def start(self):
+        """Start the sender workers on the running event loop."""
+        self._wakeup = asyncio.Condition()
+        self._room = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers. Jobs still waiting in memory are discarded."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, job):
+        """Queue a job, applying the overflow policy when the queue is full."""
+        # Keep order: once anything is on disk, new jobs go behind it
+        if self.spill and self.spill.count:
+            self.spill.append(self.serialize(job))
+            return
+
+        if self._size >= self.maxsize:
+            if self.overflow == 'block':
+                async with self._room:
+                    await self._room.wait_for(lambda: self._size < self.maxsize)
+            elif self.overflow == 'drop_oldest':
+                self._drop_oldest()
+            else:
+                self.spill.append(self.serialize(job))
+                return
+
+        await self._push(job)
+
+    async def _push(self, job):
+        jobs = self._pending.get(job.destination)
+        if jobs is None:
+            self._pending[job.destination] = deque([job])
+            self._ready.append(job.destination)
+        else:
+            jobs.append(job)
+        self._size += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    def _oldest(self):
+        oldest = None
+        for destination, jobs in list(self._pending.items()):
+            if jobs and (oldest is None or jobs[0].enqueued < oldest[1].enqueued):
+                oldest = (destination, jobs[0])
+        return oldest
+
+    def _drop_oldest(self):
+        oldest = self._oldest()
+        if oldest is None:
+            return
+        destination = oldest[0]
+        job = self._pending[destination].popleft()
+        self._size -= 1
+        self.dropped += 1
+        logger.warning(f"Send queue full, dropped oldest message for {destination}")
+        if self.on_drop is not None:
+            self.on_drop(job)
+
+    async def _refill(self):
+        """Move spilled jobs back into memory while there is room."""
+        while self.spill and self.spill.count and self._size < self.maxsize:
+            record = self.spill.pop()
+            try:
+                job = await self.deserialize(record)
+            except Exception as e:
+                logger.error(f"Error restoring spilled message: {e}")
+                continue
+            if job is not None:
+                await self._push(job)
+
+    async def _next_destination(self):
+        async with self._wakeup:
+            await self._wakeup.wait_for(lambda: self._ready)
+            return self._ready.popleft()
+
+    async def _collect_batch(self, first, jobs, key):
+        """Take the jobs right behind ``first`` that share its batch key."""
+        if self.batch_window > 0:
+            # Give the rest of a burst a moment to arrive
+            await asyncio.sleep(self.batch_window)
+
+        batch = [first]
+        while jobs and len(batch) < self.max_batch and self.batch_key(jobs[0]) == key:
+            batch.append(jobs.popleft())
+            self._size -= 1
+        if len(batch) > 1:
+            async with self._room:
+                self._room.notify_all()
+        return batch
+
+    async def _worker(self, index):
+        while True:
+            destination = await self._next_destination()
+            jobs = self._pending[destination]
+            job = jobs.popleft() if jobs else None
+
+            if job is not None:
+                self._size -= 1
+                self.last_lag = time.monotonic() - job.enqueued
+                async with self._room:
+                    self._room.notify()
+                try:
+                    key = self.batch_key(job) if self.batch_key else None
+                    if key is None:
+                        await self.send(job)
+                        self.sent += 1
+                    else:
+                        batch = await self._collect_batch(job, jobs, key)
+                        await self.send_batch(batch)
+                        self.sent += len(batch)
+                except Exception as e:
+                    logger.error(f"Sender worker {index} failed to send to {destination}: {e}")
+
+            # Hand the destination back so other destinations get a turn,
+            # or forget it once it has nothing left to send
+            if jobs:
+                self._ready.append(destination)
+                async with self._wakeup:
+                    self._wakeup.notify()
+            else:
+                del self._pending[destination]
+
+            await self._refill()
@@ -0,0 +1,294 @@
+"""
+Typed settings for the Telegram Auto Forwarder.
+
+``config.ini`` is read and validated once into an immutable Settings object:
+numbers are parsed, booleans normalized and every route's keyword filter is
+compiled up front, so nothing on the message path looks at config strings
+again. A ConfigWatcher polls the file and, when it changes, builds a new
+Settings object and hands it to a callback; the forwarder swaps its routes
+and filters over in one step without restarting the client or dropping
+queued messages.
+"""
+
+import os
+import asyncio
+import logging
+import configparser
+from dataclasses import dataclass
+
+from routes import load_routes, parse_bool
+from accounts import load_accounts
+from send_queue import OVERFLOW_POLICIES
+from structured_logging import LOG_FORMATS, DEFAULT_LEVELS, parse_levels
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsError(ValueError):
+    """Raised when config.ini contains invalid values."""
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Validated, immutable view of config.ini."""
+
+    __slots__ = (
+        'api_id', 'api_hash', 'phone', 'accounts', 'routes',
+        'account_rate', 'account_burst', 'destination_burst',
+        'send_workers', 'queue_size', 'queue_overflow', 'queue_spill_file', 'batch_window',
+        'dedup', 'dedup_db', 'dedup_ttl', 'dedup_cache_size',
+        'outbox', 'outbox_db', 'outbox_max_attempts', 'outbox_retry',
+        'media_cache_dir', 'media_cache_size', 'media_parallel',
+        'mirror_edits', 'mirror_deletes', 'message_map_db', 'message_map_retention',
+        'catch_up', 'catch_up_limit', 'checkpoint_file',
+        'watchdog', 'watchdog_idle', 'watchdog_timeout',
+        'status_port', 'reload_interval',
+        'log_format', 'log_level', 'log_levels', 'log_sample_rate',
+    )
+
+    api_id: object
+    api_hash: object
+    phone: object
+    accounts: tuple
+    routes: tuple
+    account_rate: float
+    account_burst: int
+    destination_burst: int
+    send_workers: int
+    queue_size: int
+    queue_overflow: str
+    queue_spill_file: str
+    batch_window: float
+    dedup: bool
+    dedup_db: str
+    dedup_ttl: float
+    dedup_cache_size: int
+    outbox: bool
+    outbox_db: str
+    outbox_max_attempts: int
+    outbox_retry: float
+    media_cache_dir: str
+    media_cache_size: int
+    media_parallel: int
+    mirror_edits: bool
+    mirror_deletes: bool
+    message_map_db: str
+    message_map_retention: float
+    catch_up: bool
+    catch_up_limit: int
+    checkpoint_file: str
+    watchdog: bool
+    watchdog_idle: float
+    watchdog_timeout: float
+    status_port: object
+    reload_interval: float
+    log_format: str
+    log_level: str
+    log_levels: tuple
+    log_sample_rate: float
+
+    @classmethod
+    def from_config(cls, config, environ=None):
+        """
+        Build settings from a ConfigParser with [Telegram], [Forwarding] and [Logging] sections.
+
+        Environment variables (TELEGRAM_API_ID, TELEGRAM_API_HASH,
+        TELEGRAM_PHONE, PORT) take precedence over the file. Raises
+        SettingsError listing every invalid value.
+        """
+        environ = os.environ if environ is None else environ
+        telegram = _section(config, 'TELEGRAM')
+        forwarding = _section(config, 'FORWARDING')
+        logging_section = _section(config, 'LOGGING')
+        errors = []
+
+        def number(key, default, cast, minimum=None):
+            raw = forwarding.get(key, '').strip() or default
+            try:
+                value = cast(raw)
+            except ValueError:
+                errors.append(f"{key} must be a number, got {raw!r}")
+                return cast(default)
+            if minimum is not None and value < minimum:
+                errors.append(f"{key} must be at least {minimum}, got {raw!r}")
+                return cast(default)
+            return value
+
+        def text(key, default):
+            return forwarding.get(key, '').strip() or default
+
+        api_id = environ.get('TELEGRAM_API_ID') or telegram.get('api_id', '').strip() or None
+        if api_id is not None:
+            digits = ''.join(c for c in api_id if c.isdigit())
+            if not digits:
+                errors.append(f"api_id must be a number, got {api_id!r}")
+            api_id = int(digits) if digits else None
+
+        overflow = text('queue_overflow', 'block').lower()
+        if overflow not in OVERFLOW_POLICIES:
+            errors.append(f"queue_overflow must be one of {', '.join(OVERFLOW_POLICIES)}, got {overflow!r}")
+            overflow = 'block'
+        elif overflow == 'spill' and not parse_bool(forwarding.get('outbox'), default=True):
+            # The spill file is started over on every start; the outbox is what keeps its jobs
+            errors.append("queue_overflow = spill needs outbox = true, or spilled messages are lost on a restart")
+
+        status_port = environ.get('PORT') or forwarding.get('status_port', '').strip() or None
+        if status_port is not None:
+            try:
+                status_port = int(status_port)
+            except ValueError:
+                errors.append(f"status_port must be a number, got {status_port!r}")
+                status_port = None
+
+        log_format = logging_section.get('format', '').strip().lower() or 'text'
+        if log_format not in LOG_FORMATS:
+            errors.append(f"format in [Logging] must be one of {', '.join(LOG_FORMATS)}, got {log_format!r}")
+            log_format = 'text'
+        log_level = logging_section.get('level', '').strip().upper() or 'INFO'
+        if not isinstance(logging.getLevelName(log_level), int):
+            errors.append(f"level in [Logging] must be a log level, got {log_level!r}")
+            log_level = 'INFO'
+        try:
+            log_levels = DEFAULT_LEVELS + parse_levels(logging_section.get('levels'))
+        except ValueError as e:
+            errors.append(str(e))
+            log_levels = DEFAULT_LEVELS
+        raw_rate = logging_section.get('sample_rate', '').strip() or '1'
+        try:
+            log_sample_rate = float(raw_rate)
+            if not 0 <= log_sample_rate <= 1:
+                raise ValueError
+        except ValueError:
+            errors.append(f"sample_rate in [Logging] must be between 0 and 1, got {raw_rate!r}")
+            log_sample_rate = 1.0
+
+        try:
+            routes = tuple(load_routes(config))
+        except ValueError as e:
+            errors.append(str(e))
+            routes = ()
+        for route in routes:
+            if route.delay_seconds < 0:
+                errors.append(f"delay_seconds of route {route.name} must not be negative")
+
+        settings = cls(
+            api_id=api_id,
+            api_hash=environ.get('TELEGRAM_API_HASH') or telegram.get('api_hash', '').strip() or None,
+            phone=environ.get('TELEGRAM_PHONE') or telegram.get('phone', '').strip() or None,
+            accounts=load_accounts(config),
+            routes=routes,
+            account_rate=number('account_messages_per_minute', '30', float, 0) / 60.0,
+            account_burst=number('account_burst', '5', int, 1),
+            destination_burst=number('destination_burst', '3', int, 1),
+            send_workers=number('send_workers', '4', int, 1),
+            queue_size=number('queue_size', '1000', int, 1),
+            queue_overflow=overflow,
+            queue_spill_file=text('queue_spill_file', 'send_queue.spill'),
+            batch_window=number('batch_window_ms', '500', int, 0) / 1000.0,
+            dedup=parse_bool(forwarding.get('dedup'), default=True),
+            dedup_db=text('dedup_db', 'dedup.sqlite3'),
+            dedup_ttl=number('dedup_ttl_hours', '24', float, 0) * 3600,
+            dedup_cache_size=number('dedup_cache_size', '10000', int, 1),
+            outbox=parse_bool(forwarding.get('outbox'), default=True),
+            outbox_db=text('outbox_db', 'outbox.sqlite3'),
+            outbox_max_attempts=number('outbox_max_attempts', '10', int, 1),
+            outbox_retry=number('outbox_retry_seconds', '5', float, 0),
+            media_cache_dir=text('media_cache_dir', 'media_cache'),
+            media_cache_size=int(number('media_cache_mb', '1024', float, 0) * 1024 * 1024),
+            media_parallel=number('media_parallel', '3', int, 1),
+            mirror_edits=parse_bool(forwarding.get('mirror_edits'), default=True),
+            mirror_deletes=parse_bool(forwarding.get('mirror_deletes'), default=True),
+            message_map_db=text('message_map_db', 'message_map.sqlite3'),
+            message_map_retention=number('message_map_retention_hours', '168', float, 0) * 3600,
+            catch_up=parse_bool(forwarding.get('catch_up'), default=True),
+            catch_up_limit=number('catch_up_limit', '1000', int, 0),
+            checkpoint_file=text('checkpoint_file', 'checkpoints.json'),
+            watchdog=parse_bool(forwarding.get('watchdog'), default=True),
+            watchdog_idle=number('watchdog_idle_seconds', '120', float, 1),
+            watchdog_timeout=number('watchdog_timeout_seconds', '15', float, 1),
+            status_port=status_port,
+            reload_interval=number('reload_interval_seconds', '5', float, 0),
+            log_format=log_format,
+            log_level=log_level,
+            log_levels=log_levels,
+            log_sample_rate=log_sample_rate,
+        )
+        if errors:
+            raise SettingsError('; '.join(errors))
+        return settings
+
+    def restart_required(self, other):
+        """Names of changed settings that only take effect after a restart."""
+        live = ('routes', 'account_rate', 'account_burst', 'destination_burst',
+                'batch_window', 'reload_interval')
+        return [name for name in self.__slots__
+                if name not in live and getattr(self, name) != getattr(other, name)]
+
+
+def _section(config, name):
+    """Return a section by case-insensitive name, or an empty dict."""
+    for section in config.sections():
+        if section.upper() == name:
+            return config[section]
+    return {}
+
+
+def read_config(path):
+    """Read config.ini into a fresh ConfigParser with canonical section names."""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(path)
+    for canonical in ('Telegram', 'Forwarding'):
+        if canonical not in parser:
+            section = _section(parser, canonical.upper())
+            parser[canonical] = dict(section) if section else {}
+    return parser
+
+
+def load_settings(path='config.ini', environ=None):
+    """Read and validate config.ini in one go."""
+    return Settings.from_config(read_config(path), environ)
+
+
+class ConfigWatcher:
+    """Poll config.ini and pass newly validated settings to a callback."""
+
+    def __init__(self, path, on_change, interval=5):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._mtime = self._stat()
+        self._task = None
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            mtime = self._stat()
+            if mtime is None or mtime == self._mtime:
+                continue
+            self._mtime = mtime
+
+            try:
+                settings = load_settings(self.path)
+            except SettingsError as e:
+                logger.error(f"Not reloading {self.path}, it has invalid values: {e}")
+                continue
+            try:
+                await self.on_change(settings)
+            except Exception as e:
+                logger.error(f"Error applying new settings from {self.path}: {e}")
@@ -0,0 +1,154 @@
+"""
+Status server for the Telegram Auto Forwarder.
+
+A minimal HTTP server that runs on the same asyncio event loop as the
+Telegram client, so it reads the forwarder's live state directly and stops
+together with it. It replaces the Flask keep-alive thread and serves:
+
+    /         status page for humans and uptime monitors
+    /status   JSON health report, HTTP 503 when the forwarder is unhealthy
+    /metrics  Prometheus metrics
+"""
+
+import json
+import asyncio
+import logging
+from string import Template
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Give up on clients that do not send a complete request in time
+REQUEST_TIMEOUT = 10
+
+# Simple HTML template for the status page
+HTML = Template("""
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Telegram Auto Forwarder</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 0;
+            padding: 0;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            background-color: #f5f5f5;
+        }
+        .container {
+            text-align: center;
+            padding: 30px;
+            background-color: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
+        }
+        .status {
+            color: $color;
+            font-weight: bold;
+        }
+        .subtitle {
+            color: #6c757d;
+            margin: 20px 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Telegram Auto Forwarder</h1>
+        <p>Status: <span class="status">$status</span></p>
+        <p class="subtitle">Replit Status Page - UptimeRobot Monitor</p>
+        <p>This page confirms the forwarder service is active.</p>
+    </div>
+</body>
+</html>
+""")
+
+REASONS = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+
+def home():
+    healthy, details = metrics.health()
+    status = 'Running' if healthy else details.get('status', 'unhealthy').capitalize()
+    body = HTML.substitute(status=status, color='#28a745' if healthy else '#dc3545')
+    return 200, 'text/html; charset=utf-8', body
+
+
+def status():
+    # Report the forwarder's real health; 503 tells monitors something is wrong
+    healthy, details = metrics.health()
+    return (200 if healthy else 503), 'application/json', json.dumps(details)
+
+
+def prometheus_metrics():
+    # Prometheus text exposition format
+    return 200, 'text/plain; version=0.0.4', metrics.REGISTRY.render()
+
+
+ROUTES = {
+    '/': home,
+    '/status': status,
+    '/metrics': prometheus_metrics,
+}
+
+
+class StatusServer:
+    """Serve the status endpoints from the running event loop."""
+
+    def __init__(self, host='0.0.0.0', port=5000):
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"Status server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            logger.info("Status server stopped")
+
+    async def handle(self, reader, writer):
+        """Answer a single HTTP request and close the connection."""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            # Read and discard the headers
+            while True:
+                line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0], parts[1].split('?', 1)[0]
+
+            handler = ROUTES.get(path)
+            if handler is None:
+                code, content_type, body = 404, 'text/plain', 'Not Found'
+            elif method not in ('GET', 'HEAD'):
+                code, content_type, body = 405, 'text/plain', 'Method Not Allowed'
+            else:
+                code, content_type, body = handler()
+
+            payload = body.encode('utf-8')
+            head = (f"HTTP/1.1 {code} {REASONS.get(code, '')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    "Connection: close\r\n\r\n")
+            writer.write(head.encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Error serving status request: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,210 @@
+"""
+Structured logging and message tracing for the Telegram Auto Forwarder.
+
+Every message gets a trace when it is received. The trace records how long
+after receipt it was filtered, queued and sent, and is attached to the log
+record written when the send completes:
+
+    {"time": "...", "level": "INFO", "logger": "engine", "message": "forwarded",
+     "trace": "5f1c9a0e7b2d", "route": "deals", "destination": "@INRDealsBot",
+     "stages_ms": {"received": 0.0, "filtered": 0.2, "queued": 0.4, "sent": 412.7}}
+
+Records are handed to a background thread through a queue, so the event
+loop never blocks on stdout; message arguments are merged when a record is
+queued and everything else (timestamps, JSON) is formatted on that thread.
+Traced records below WARNING can be sampled: a trace is kept or dropped as
+a whole, by its ID, so sampled traces stay complete.
+
+Settings are read from the ``[Logging]`` section:
+
+    format = text          # or json
+    level = INFO
+    # Per-logger levels, comma-separated logger=LEVEL pairs
+    levels = telethon=WARNING
+    # Share of traced messages whose INFO/DEBUG records are written
+    sample_rate = 1.0
+"""
+
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import secrets
+import logging.handlers
+
+LOG_FORMATS = ('text', 'json')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Telethon logs every reconnect and update gap at INFO
+DEFAULT_LEVELS = (('telethon', 'WARNING'),)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def parse_levels(value):
+    """Parse ``logger=LEVEL, ...`` into (logger, level) pairs."""
+    levels = []
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        name, sep, level = item.partition('=')
+        level = level.strip().upper()
+        if not sep or not name.strip() or not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Invalid logger level {item.strip()!r}, expected logger=LEVEL")
+        levels.append((name.strip(), level))
+    return tuple(levels)
+
+
+class Trace:
+    """A message's ID for the logs and the time it reached each stage."""
+
+    __slots__ = ('id', 'started', 'stages')
+
+    def __init__(self, trace_id=None):
+        self.id = trace_id or secrets.token_hex(6)
+        self.started = time.perf_counter()
+        self.stages = {'received': 0.0}
+
+    def mark(self, stage):
+        """Record that the message reached a stage; the first time counts."""
+        if stage not in self.stages:
+            self.stages[stage] = time.perf_counter() - self.started
+
+    def extra(self, final=None, **fields):
+        """
+        Fields for a log record about this trace.
+
+        ``final`` names a last stage that is timed now without being stored,
+        for the per-destination ends of a trace shared by several sends.
+        """
+        stages = {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+        if final is not None:
+            stages[final] = round((time.perf_counter() - self.started) * 1000, 1)
+        fields['trace'] = self.id
+        fields['stages_ms'] = stages
+        return fields
+
+
+def record_fields(record):
+    """The ``extra`` fields of a log record."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(record_fields(record))
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic text format, with any extra fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if not fields:
+            return line
+        stages = fields.pop('stages_ms', None)
+        parts = [f"{key}={value}" for key, value in fields.items()]
+        if stages:
+            parts.extend(f"{stage}={ms}ms" for stage, ms in stages.items())
+        return f"{line} [{' '.join(parts)}]"
+
+
+class TraceSampler(logging.Filter):
+    """Keep the INFO/DEBUG records of a share of traces, chosen by trace ID."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        # Trace IDs are random hex, so their leading digits are uniform
+        self.threshold = int(max(0.0, min(1.0, rate)) * 0x10000)
+
+    def filter(self, record):
+        trace = getattr(record, 'trace', None)
+        if trace is None or record.levelno >= logging.WARNING or self.threshold >= 0x10000:
+            return True
+        return int(trace[:4], 16) < self.threshold
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for the listener thread, formatting as little as possible.
+
+    The stock QueueHandler formats the whole record before queueing it, on
+    the logging thread. Records here only stay in this process, so the
+    message arguments are merged (they may change later) and the rest is
+    left to the listener's formatter.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(log_format='text', level='INFO', levels=DEFAULT_LEVELS, sample_rate=1.0,
+                      stream=None):
+    """
+    Route every log record through a queue to one stream handler.
+
+    Replaces handlers configured earlier (including by basicConfig), so it
+    can be called again once the settings are known.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    if sample_rate < 1.0:
+        queue_handler.addFilter(TraceSampler(sample_rate))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in levels:
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def configure_from_settings(settings):
+    """Apply the [Logging] settings."""
+    return configure_logging(settings.log_format, settings.log_level, settings.log_levels,
+                             settings.log_sample_rate)
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -3,7 +3,12 @@
 Telegram Auto Forwarder Wrapper
 
 This wrapper ensures the main script is called correctly and keeps the script running 24/7.
-It starts a web server that can be pinged by UptimeRobot to keep the Replit instance alive.
+The forwarder serves a status page that can be pinged by UptimeRobot to keep the Replit
+instance alive (on the port from the PORT environment variable, or status_port in config.ini).
+
+It starts the forwarder headlessly, the same as `python TelegramForwarder.py run`:
+no menu and no prompts. Run TelegramForwarder.py without arguments once to enter
+your credentials, log in and set up forwarding.
 
 Usage:
     Simply run this script to start the Telegram Auto Forwarder.
@@ -13,73 +18,47 @@ Usage:
 
 import os
 import sys
+import asyncio
 import traceback
 import logging
-import time
-import builtins
-from keep_alive import keep_alive
+import importlib.util
+
+from structured_logging import configure_logging
 
-# Set up detailed logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# INFO to stdout until the forwarder applies the [Logging] settings; at
+# DEBUG, Telethon's internals flood the output and cost CPU under load
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Start the keep-alive server for UptimeRobot
-keep_alive()
-logger.info("Keep-alive server started for UptimeRobot monitoring")
-logger.info("Your Replit URL can now be monitored at your Replit domain")
+# The status server for UptimeRobot runs inside the forwarder's event loop
+logger.info("Your Replit URL can be monitored at your Replit domain once the forwarder starts")
 logger.info("Add this URL to UptimeRobot to keep the script running 24/7")
 
-# Give the keep-alive server a moment to start
-time.sleep(1)
-
-# Store the original input function
-original_input = builtins.input
 
-# Auto-select menu option 3 (Start forwarding)
-def auto_input(prompt):
-    """Auto-input function that returns '3' for menu selection"""
-    logger.info(f"Auto-responding to prompt: {prompt}")
-    
-    # If this is the menu selection, choose option 3
-    if "Select an option:" in prompt:
-        logger.info("Automatically selecting option 3 (Start forwarding)")
-        return "3"
-    
-    # For any other input prompts, use the original input function
-    return original_input(prompt)
+def load_forwarder():
+    """Import TelegramForwarder.py by path; its name differs from this file only by case."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TelegramForwarder.py")
+    spec = importlib.util.spec_from_file_location("TelegramForwarder", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
-# Replace the built-in input function
-builtins.input = auto_input
 
-# Simply run the actual file with proper capitalization
 if __name__ == "__main__":
     try:
         logger.info("Starting TelegramForwarder.py wrapper")
         logger.info(f"Current directory: {os.getcwd()}")
-        
-        # Execute the main script
-        logger.info("About to execute TelegramForwarder.py - will auto-select Start Forwarding")
-        
-        # Using exec instead of runpy for better error visibility
-        with open("TelegramForwarder.py", "r") as f:
-            code = compile(f.read(), "TelegramForwarder.py", 'exec')
-            exec(code, globals())
-            
+
+        forwarder = load_forwarder()
+        logger.info("Starting forwarding in headless mode")
+        exit_code = asyncio.run(forwarder.run())
+
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+        exit_code = 0
     except Exception as e:
         logger.error(f"Error running TelegramForwarder.py: {e}")
         logger.error(traceback.format_exc())
-        
-        # Restore the original input function
-        builtins.input = original_input
-        
-        sys.exit(1)
-        
-    finally:
-        # Restore the original input function
-        builtins.input = original_input
+        exit_code = 1
+
+    sys.exit(exit_code)
@@ -0,0 +1,278 @@
+"""
+Text transforms for the Telegram Auto Forwarder.
+
+Between the filter and the send, copy-mode routes can rewrite a message's
+text. The rules are read from the route's section (or ``[Forwarding]``):
+
+    # Regex substitutions, one "pattern => replacement" per line
+    replace =
+        \bMRP\b => List price
+        (\d+)% off => \1% OFF
+    # Regexes removed from the text, one per line
+    strip =
+        #\w+
+        Join @\w+ for more
+    # Links to a domain (or its subdomains) are rewritten, one per line:
+    # "domain => key=value" sets a query parameter, anything else is a
+    # template using {url}, {host}, {path} and {query}
+    url_rewrite =
+        amazon.in => tag=mytag-21
+        flipkart.com => https://fkrt.it/redirect?u={url}
+    # Template for the final text, with {text}, {route} and {source}
+    template = {text}
+        Shared by @mychannel
+
+Every substitution, strip and link rewrite is compiled into one regular
+expression and applied in a single pass over the text. A rule whose pattern
+refers back to its own numbered groups (``(\w)\1``) cannot be combined, as
+the groups are numbered anew; it is compiled on its own and applied in a
+pass of its own after the others, in config order. Backreferences in
+replacements (``\1``, ``\g<name>``) always refer to the rule's own groups.
+Formatting entities (bold, links, ...) are moved along with the text they
+cover, and hidden text links are rewritten with the same URL rules. Use
+scoped flags such as ``(?i:...)`` for case-insensitive rules.
+"""
+
+import re
+import copy
+from urllib.parse import urlsplit, urlunsplit
+
+from telethon.helpers import add_surrogate, del_surrogate
+
+# A link, without trailing punctuation that belongs to the sentence
+URL_PATTERN = r'https?://[^\s<>"\')\]]*[^\s<>"\')\].,!?]'
+RULE_SEPARATOR = '=>'
+EXPANSION_CACHE_SIZE = 4096
+# Characters outside the BMP take two UTF-16 code units in entity offsets
+ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+# A numbered backreference in a pattern, like \1 (not an escaped backslash)
+GROUP_REFERENCE_RE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]')
+
+
+def _add_surrogate(text):
+    """telethon's add_surrogate, touching only the characters that need it."""
+    return ASTRAL_RE.sub(lambda m: add_surrogate(m.group()), text)
+
+
+def parse_rules(value):
+    """Split a multi-line config value into (left, right) pairs around '=>'."""
+    rules = []
+    for line in (value or '').splitlines():
+        if not line.strip():
+            continue
+        left, sep, right = line.partition(RULE_SEPARATOR)
+        if not sep:
+            raise ValueError(f"Rule {line.strip()!r} is missing '{RULE_SEPARATOR}'")
+        rules.append((left.strip(), right.strip()))
+    return rules
+
+
+class UrlRewriter:
+    """Rewrite links to configured domains."""
+
+    __slots__ = ('rules',)
+
+    def __init__(self, rules):
+        # Longest domain first, so a subdomain rule wins over its parent
+        self.rules = sorted(((d.lower().lstrip('.'), t) for d, t in rules),
+                            key=lambda rule: -len(rule[0]))
+        for domain, template in self.rules:
+            try:
+                template.format(url='', host='', path='', query='')
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Invalid url_rewrite template for {domain}: {e}")
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def rewrite(self, url):
+        """Return the rewritten URL, or the URL itself if no rule applies."""
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return url
+        host = (parts.hostname or '').lower()
+        for domain, template in self.rules:
+            if host == domain or host.endswith('.' + domain):
+                return self._apply(url, parts, template)
+        return url
+
+    @staticmethod
+    def _apply(url, parts, template):
+        key, sep, value = template.partition('=')
+        if sep and '{' not in template and '/' not in key and '?' not in key:
+            # key=value: set one query parameter, replacing any existing one
+            query = [p for p in parts.query.split('&') if p and p.split('=', 1)[0] != key]
+            query.append(template)
+            return urlunsplit(parts._replace(query='&'.join(query)))
+        return template.format(url=url, host=parts.hostname or '', path=parts.path,
+                               query=parts.query)
+
+
+class TextTransform:
+    """A route's compiled text rules."""
+
+    __slots__ = ('regex', 'replacements', 'separate', 'urls', 'prefix', 'suffix', 'replace_text',
+                 '_expanded')
+
+    def __init__(self, replace=(), strip=(), url_rewrite=(), template=None):
+        self.urls = UrlRewriter(url_rewrite)
+        alternatives = []
+        # Each rule keeps its own compiled pattern to expand backreferences
+        self.replacements = {}
+        # Expanded backreference replacements, as re parses the template on every expand
+        self._expanded = {}
+        # Rules referring back to their own groups in the pattern, applied one by one
+        self.separate = []
+        for index, (pattern, replacement) in enumerate(list(replace) + [(p, '') for p in strip]):
+            try:
+                compiled = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern {pattern!r}: {e}")
+            name = f'r{index}'
+            if GROUP_REFERENCE_RE.search(pattern):
+                self.separate.append((name, compiled, replacement))
+                continue
+            # Replacements without backreferences are used as they are
+            self.replacements[name] = (compiled if '\\' in replacement else None, replacement)
+            alternatives.append(f'(?P<{name}>{pattern})')
+        if self.urls:
+            alternatives.append(f'(?P<url>{URL_PATTERN})')
+        try:
+            self.regex = re.compile('|'.join(alternatives)) if alternatives else None
+        except re.error as e:
+            raise ValueError(f"Cannot combine the text rules, use scoped flags like (?i:...): {e}")
+
+        # The template is split around {text} so entities only need one shift
+        self.prefix = self.suffix = ''
+        self.replace_text = False
+        if template:
+            template = template.replace('\\n', '\n')
+            if '{text}' in template:
+                self.prefix, _, self.suffix = template.partition('{text}')
+            else:
+                self.prefix, self.replace_text = template, True
+            try:
+                (self.prefix + self.suffix).format(text='', route='', source='')
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"Invalid template {template!r}: {e}")
+
+    @classmethod
+    def from_config(cls, replace='', strip='', url_rewrite='', template=''):
+        """Compile the rules from config values, or return None when there are none."""
+        if not any(v and v.strip() for v in (replace, strip, url_rewrite, template)):
+            return None
+        strip_patterns = [line.strip() for line in (strip or '').splitlines() if line.strip()]
+        return cls(parse_rules(replace), strip_patterns, parse_rules(url_rewrite),
+                   template.strip() or None)
+
+    def _replacement(self, match, text):
+        name = match.lastgroup
+        if name == 'url':
+            return self.urls.rewrite(match.group())
+        compiled, replacement = self.replacements[name]
+        if compiled is None:
+            return replacement
+        # Match the rule alone at the same spot so its own groups can be used
+        own = compiled.fullmatch(text, match.start(), match.end())
+        if own is None:
+            return replacement
+        return self._expand(name, own, replacement)
+
+    def _expand(self, name, match, replacement):
+        key = (name, match.groups())
+        expanded = self._expanded.get(key)
+        if expanded is None:
+            if len(self._expanded) >= EXPANSION_CACHE_SIZE:
+                self._expanded.clear()
+            expanded = self._expanded[key] = match.expand(replacement)
+        return expanded
+
+    @staticmethod
+    def _sub(regex, replacement, text, edits):
+        """regex.sub that also records each change in ``edits``, when it is a list."""
+        if edits is None:
+            return regex.sub(replacement, text)
+        shift = 0
+
+        def replace(match):
+            nonlocal shift
+            new = replacement(match)
+            start, end = match.span()
+            if new != match.group():
+                edits.append((start, end, start + shift, len(new)))
+                shift += len(new) - (end - start)
+            return new
+        return regex.sub(replace, text)
+
+    def apply(self, text, entities=None, **context):
+        """
+        Transform text and return ``(text, entities)``.
+
+        ``context`` supplies the template's other fields ({route}, {source}).
+        Entity offsets count UTF-16 code units, like Telegram's.
+        """
+        text = text or ''
+        entities = list(entities or ())
+        # With surrogates added, Python string indices equal UTF-16 offsets
+        work = _add_surrogate(text) if entities else text
+
+        # The edits of each pass, to move the entities through them in turn
+        passes = []
+        if self.regex is not None:
+            edits = [] if entities else None
+            source = work
+            work = self._sub(self.regex, lambda match: self._replacement(match, source), work, edits)
+            passes.append(edits)
+        for name, compiled, replacement in self.separate:
+            edits = [] if entities else None
+            if '\\' in replacement:
+                work = self._sub(compiled, lambda match: self._expand(name, match, replacement), work, edits)
+            else:
+                work = self._sub(compiled, lambda match: replacement, work, edits)
+            passes.append(edits)
+
+        fields = {'route': '', 'source': ''}
+        fields.update(context)
+        if self.replace_text:
+            return self.prefix.format(text='', **fields), []
+
+        prefix = self.prefix.format(**fields) if self.prefix else ''
+        suffix = self.suffix.format(**fields) if self.suffix else ''
+        if entities:
+            entities = self._move_entities(entities, passes, len(_add_surrogate(prefix)))
+            work = del_surrogate(work)
+        return prefix + work + suffix, entities
+
+    def _move_entities(self, entities, passes, offset):
+        """Shift entities past the edits of every pass and the template prefix."""
+        def move(pos, edits, is_end):
+            moved = pos
+            for start, end, new_start, length in edits:
+                if pos >= end and not (is_end and pos == end == start):
+                    moved = pos + (new_start + length - end)
+                elif pos > start:
+                    # Inside a replaced span: cover the whole replacement
+                    return new_start + length if is_end else new_start
+                else:
+                    break
+            return moved
+
+        def position(pos, is_end):
+            for edits in passes:
+                pos = move(pos, edits, is_end)
+            return pos + offset
+
+        moved = []
+        for entity in entities:
+            start = position(entity.offset, False)
+            end = position(entity.offset + entity.length, True)
+            if end <= start:
+                continue  # the text it covered was removed
+            entity = copy.copy(entity)
+            entity.offset, entity.length = start, end - start
+            url = getattr(entity, 'url', None)
+            if url and self.urls:
+                entity.url = self.urls.rewrite(url)
+            moved.append(entity)
+        return moved
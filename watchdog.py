@@ -0,0 +1,199 @@
+"""
+Connection watchdog for the Telegram Auto Forwarder.
+
+On some hosts the client's connection stalls without an error: the socket
+stays open, nothing arrives and Telethon never notices. The watchdog
+notices instead:
+
+- every update from Telegram is timestamped
+- once no update arrived for ``watchdog_idle_seconds``, it asks Telegram
+  for the update state (``updates.getState``). An answer proves the
+  connection works, and also makes Telegram resume pushing updates to a
+  session it considered idle
+- a ping that fails or takes longer than ``watchdog_timeout_seconds``
+  trips the watchdog, which disconnects and connects again, retrying with
+  a growing pause until it succeeds
+
+After a reconnect the missed updates are fetched with getDifference
+(``client.catch_up()``) and every source is replayed from its checkpoint,
+so messages posted during the stall are forwarded once, in order.
+``/status`` reports unhealthy from the trip until the recovery is done.
+
+Settings are read from the ``[Forwarding]`` section:
+
+    watchdog = true
+    watchdog_idle_seconds = 120
+    watchdog_timeout_seconds = 15
+"""
+
+import time
+import asyncio
+import logging
+
+from telethon import events
+from telethon.tl.functions.updates import GetStateRequest
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# How often the time since the last update is checked, in seconds
+CHECK_INTERVAL = 5
+# Longest pause between two reconnect attempts, in seconds
+MAX_RECONNECT_BACKOFF = 60
+
+
+class ConnectionWatchdog:
+    """Detect a stalled client connection and reconnect without losing messages."""
+
+    def __init__(self, client, idle=120, timeout=15):
+        self.client = client
+        self.idle = idle
+        self.timeout = timeout
+        self.last_update = time.monotonic()
+        self.last_contact = self.last_update  # last update or successful ping
+        self.tripped_at = None
+        self.trips = 0
+        self.last_reconnect = None  # seconds the last reconnect took
+        self.last_gap = None  # (seconds without updates, messages replayed)
+        self._recover = None
+        self._task = None
+        self._recovered = asyncio.Event()
+
+    @classmethod
+    def from_settings(cls, client, settings):
+        """Create a watchdog from Settings, or None when disabled."""
+        if not settings.watchdog:
+            return None
+        return cls(client, settings.watchdog_idle, settings.watchdog_timeout)
+
+    @property
+    def tripped(self):
+        return self.tripped_at is not None
+
+    def start(self, recover=None):
+        """
+        Start watching the connection.
+
+        ``recover`` is awaited after every reconnect to replay missed
+        messages and returns how many it replayed.
+        """
+        self._recover = recover
+        self.last_update = self.last_contact = time.monotonic()
+        self.client.add_event_handler(self._on_update, events.Raw())
+        metrics.LAST_UPDATE_AGE.set_function(lambda: time.monotonic() - self.last_update)
+        self._task = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        self.client.remove_event_handler(self._on_update)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _on_update(self, update):
+        self.last_update = self.last_contact = time.monotonic()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            if time.monotonic() - self.last_contact < self.idle:
+                continue
+            try:
+                await self.ping()
+            except asyncio.TimeoutError:
+                await self.reconnect('timeout')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Connection check failed: {e}")
+                await self.reconnect('error')
+
+    async def ping(self):
+        """Ask Telegram for the update state; raises when the connection does not answer."""
+        await asyncio.wait_for(self.client(GetStateRequest()), self.timeout)
+        self.last_contact = time.monotonic()
+
+    async def reconnect(self, reason):
+        """Reconnect until it works, then recover the messages missed meanwhile."""
+        if self.tripped:
+            await self._recovered.wait()  # already being handled
+            return
+        self.tripped_at = time.monotonic()
+        self.trips += 1
+        self._recovered.clear()
+        silent_since = self.last_update
+        metrics.WATCHDOG_TRIPS.labels(reason).inc()
+        logger.warning(f"Connection stalled ({reason}), no updates for {self.tripped_at - silent_since:.0f}s; "
+                       f"reconnecting")
+
+        backoff = 1
+        while True:
+            try:
+                await asyncio.wait_for(self.client.disconnect(), self.timeout)
+            except Exception as e:
+                logger.debug(f"Error disconnecting the stalled client: {e}")
+            try:
+                await asyncio.wait_for(self.client.connect(), self.timeout * 2)
+                await self.ping()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.RECONNECTS.labels('failed').inc()
+                logger.warning(f"Reconnect failed: {e or type(e).__name__}; retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RECONNECT_BACKOFF)
+
+        reconnected = time.monotonic()
+        self.last_reconnect = reconnected - self.tripped_at
+        metrics.RECONNECTS.labels('ok').inc()
+        metrics.RECONNECT_SECONDS.observe(self.last_reconnect)
+
+        # Updates missed while the connection was down, then anything getDifference could not cover
+        try:
+            await self.client.catch_up()
+        except Exception as e:
+            logger.warning(f"Error fetching missed updates: {e}")
+        replayed = 0
+        if self._recover is not None:
+            try:
+                replayed = await self._recover()
+            except Exception as e:
+                logger.error(f"Error replaying missed messages: {e}")
+
+        gap = reconnected - silent_since
+        self.last_gap = (gap, replayed)
+        metrics.GAP_SECONDS.observe(gap)
+        metrics.GAP_MESSAGES.inc(replayed)
+        logger.info(f"Reconnected in {self.last_reconnect:.1f}s, recovered a {gap:.0f}s gap "
+                    f"({replayed} message(s) replayed)")
+        self.tripped_at = None
+        self.last_update = self.last_contact = time.monotonic()
+        self._recovered.set()
+
+    async def wait(self):
+        """
+        Keep the client connected until cancelled.
+
+        Used instead of ``run_until_disconnected``, which returns on the
+        watchdog's own reconnects and when Telethon gives up reconnecting;
+        the latter is handled like a stall.
+        """
+        while True:
+            await self.client.disconnected
+            if self.tripped:
+                await self._recovered.wait()
+            else:
+                await self.reconnect('disconnected')
+
+    def stats(self):
+        """Watchdog figures for /status."""
+        return {
+            'tripped': self.tripped,
+            'seconds_since_update': round(time.monotonic() - self.last_update, 1),
+            'trips': self.trips,
+            'last_reconnect_seconds': round(self.last_reconnect, 1) if self.last_reconnect is not None else None,
+            'last_gap_seconds': round(self.last_gap[0], 1) if self.last_gap else None,
+            'last_gap_messages': self.last_gap[1] if self.last_gap else None,
+        }